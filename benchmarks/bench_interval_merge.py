@@ -0,0 +1,120 @@
+# coding: utf-8
+"""
+IntervalMerge 逐个 add 和 add_many 的耗时, 对比改为有序列表之前的实现, 并校验合并结果和长度相同
+旧实现每次 add 都重新排序整个列表, 只对前 baseline 个区间计时
+数据模拟一个用户的观看记录: 大致按时间先后、部分重叠或首尾相接的片段
+python -m benchmarks.bench_interval_merge --count=50000
+"""
+
+import time
+import random
+import fire
+from utils.base import IntervalMerge
+
+
+class Before(object):
+    """改为有序列表之前的实现"""
+
+    def __init__(self):
+        self._intervals = []
+
+    def add(self, start, end):
+        start, end = (start, end) if start < end else (end, start)
+        self._intervals.append(dict(st=start, et=end))
+        self._intervals.sort(key=lambda x: x['st'])
+        tmp = [self._intervals[0]]
+        index = 0
+        for item in self._intervals:
+            st, et = item['st'], item['et']
+            if tmp[index]['st'] <= st <= tmp[index]['et']:
+                tmp[index]['et'] = max(et, tmp[index]['et'])
+            else:
+                tmp.append(dict(st=st, et=et))
+                index += 1
+        self._intervals = tmp
+
+    @property
+    def intervals(self):
+        return self._intervals
+
+    @property
+    def length(self):
+        return sum(map(lambda x: x['et'] - x['st'], self._intervals))
+
+
+def make_segments(count, seed=0):
+    r = random.Random(seed)
+    segments = []
+    position = 0
+    for _ in xrange(count):
+        x = r.random()
+        if x < 0.1:
+            # 回看: 与之前的片段重叠
+            start = max(position - r.randint(0, 3600), 0)
+        elif x < 0.3:
+            start = position
+        else:
+            start = position + r.randint(1, 600)
+        end = start + r.randint(0, 1800)
+        segments.append((start, end) if r.random() < 0.95 else (end, start))
+        position = max(position, end)
+    # 前 10% 的片段乱序到达
+    head = segments[:count / 10]
+    r.shuffle(head)
+    segments[:count / 10] = head
+    return segments
+
+
+def timed(func):
+    start = time.time()
+    result = func()
+    return result, time.time() - start
+
+
+def add_each(cls, segments):
+    merge = cls()
+    for start, end in segments:
+        merge.add(start, end)
+    return merge
+
+
+def check(segments, merge):
+    before = add_each(Before, segments)
+    assert merge.intervals == before.intervals and merge.length == before.length
+    pairs = [(i['st'], i['et']) for i in before.intervals]
+    r = random.Random(1)
+    for point in xrange(0, pairs[-1][1], 97):
+        assert merge.contains(point) == any(st <= point <= et for st, et in pairs), point
+        end = point + r.randint(0, 5000)
+        covered = sum(max(min(et, end) - max(st, point), 0) for st, et in pairs)
+        assert merge.coverage(point, end) == covered, (point, end)
+        assert merge.covers(point, end) == any(st <= point and end <= et for st, et in pairs), (point, end)
+
+
+def main(count=50000, baseline=5000):
+    segments = make_segments(count)
+    check(segments[:2000], add_each(IntervalMerge, segments[:2000]))
+    merge = IntervalMerge()
+    merge.add_many(segments[:2000])
+    check(segments[:2000], merge)
+
+    base = segments[:baseline]
+    _, before = timed(lambda: add_each(Before, base))
+    _, after = timed(lambda: add_each(IntervalMerge, base))
+    print '{} segments'.format(baseline)
+    print '{:<28}{:>10.3f}s'.format('before add', before)
+    print '{:<28}{:>10.3f}s{:>10.0f}x'.format('add', after, before / after)
+
+    each, after = timed(lambda: add_each(IntervalMerge, segments))
+    many = IntervalMerge()
+    _, bulk = timed(lambda: many.add_many(segments))
+    assert each.intervals == many.intervals and each.length == many.length
+    _, query = timed(lambda: [each.coverage(st, et) for st, et in segments])
+    print '{} segments, {} merged intervals'.format(count, len(each.intervals))
+    print '{:<28}{:>10.3f}s'.format('add', after)
+    print '{:<28}{:>10.3f}s'.format('add_many', bulk)
+    print '{:<28}{:>10.3f}s'.format('coverage x {}'.format(count), query)
+
+
+if __name__ == '__main__':
+    fire.Fire(main)
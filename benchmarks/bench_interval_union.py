@@ -0,0 +1,76 @@
+# coding: utf-8
+"""
+按用户计算观看时长: merge_intervals 批量合并, 对比每个用户一个 IntervalMerge 的逐行 add / 分组后 add_many,
+并校验各用户的总长度和合并后的区间相同
+python -m benchmarks.bench_interval_union --count=1000000 --users=20000
+"""
+
+import time
+import random
+import collections
+import fire
+import numpy
+from utils.base import IntervalMerge, merge_intervals
+
+
+def make_rows(count, users, seed=0):
+    """(user_id, start, end) 的三列, 每个用户的片段大致按时间先后、部分重叠"""
+    r = numpy.random.RandomState(seed)
+    keys = r.randint(0, users, count)
+    starts = r.randint(0, 86400 * 30, count)
+    ends = starts + r.randint(0, 3600, count)
+    swap = r.random_sample(count) < 0.05
+    starts[swap], ends[swap] = ends[swap], starts[swap]
+    return keys, starts, ends
+
+
+def timed(func):
+    start = time.time()
+    result = func()
+    return result, time.time() - start
+
+
+def per_object_add(keys, starts, ends):
+    merges = collections.defaultdict(IntervalMerge)
+    for key, start, end in zip(keys.tolist(), starts.tolist(), ends.tolist()):
+        merges[key].add(start, end)
+    return merges
+
+
+def per_object_add_many(keys, starts, ends):
+    groups = collections.defaultdict(list)
+    for key, start, end in zip(keys.tolist(), starts.tolist(), ends.tolist()):
+        groups[key].append((start, end))
+    return dict((key, IntervalMerge(pairs)) for key, pairs in groups.iteritems())
+
+
+def check(union, merges):
+    assert union.keys.tolist() == sorted(merges)
+    assert union.lengths.tolist() == [merges[key].length for key in union.keys.tolist()]
+    intervals = collections.defaultdict(list)
+    for key, st, et in zip(union.interval_keys.tolist(), union.starts.tolist(), union.ends.tolist()):
+        intervals[key].append(dict(st=st, et=et))
+    assert all(intervals[key] == merge.intervals for key, merge in merges.iteritems())
+
+
+def main(count=1000000, users=20000):
+    keys, starts, ends = make_rows(count, users)
+    union, vectorized = timed(lambda: merge_intervals(keys, starts, ends))
+    merges, each = timed(lambda: per_object_add(keys, starts, ends))
+    check(union, merges)
+    merges, many = timed(lambda: per_object_add_many(keys, starts, ends))
+    check(union, merges)
+
+    r = random.Random(0)
+    floats = [r.random() * 100 for _ in xrange(2000)]
+    small = merge_intervals([i % 7 for i in xrange(1000)], floats[:1000], floats[1000:])
+    check(small, per_object_add_many(numpy.arange(1000) % 7, numpy.array(floats[:1000]), numpy.array(floats[1000:])))
+
+    print '{} rows, {} users, {} merged intervals'.format(count, len(union.keys), len(union.starts))
+    print '{:<32}{:>10.3f}s'.format('IntervalMerge.add per row', each)
+    print '{:<32}{:>10.3f}s{:>8.1f}x'.format('IntervalMerge.add_many per user', many, each / many)
+    print '{:<32}{:>10.3f}s{:>8.1f}x'.format('merge_intervals', vectorized, each / vectorized)
+
+
+if __name__ == '__main__':
+    fire.Fire(main)
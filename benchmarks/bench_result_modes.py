@@ -0,0 +1,70 @@
+# coding: utf-8
+"""
+对比 MySqlClient 各结果模式的吞吐和内存, 每种模式在单独的子进程中执行, 内存为子进程 maxrss 的增量
+python -m benchmarks.bench_result_modes --db=user --user=dever --password=dever \
+    --sql="select id, user_id, amount, create_time from orders limit 1000000"
+"""
+
+import time
+import resource
+import multiprocessing
+import fire
+from utils.mysql_tool import MySqlClient
+
+
+def _dict_query(client, sql):
+    return client.query(sql)
+
+
+def _dict_iter(client, sql):
+    count = 0
+    for _ in client.iter_query(sql):
+        count += 1
+    return count
+
+
+def _tuples(client, sql):
+    return client.query_tuples(sql)
+
+
+def _columns(client, sql):
+    return client.query_columns(sql)
+
+
+MODES = [
+    ('query (dict)', _dict_query),
+    ('iter_query (dict)', _dict_iter),
+    ('query_tuples', _tuples),
+    ('query_columns', _columns),
+]
+
+
+def _run(func, params, sql, out):
+    client = MySqlClient(**params)
+    base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.time()
+    result = func(client, sql)
+    seconds = time.time() - start
+    memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - base
+    if isinstance(result, tuple):
+        result = result[1]
+    count = result if isinstance(result, int) else len(result.values()[0]) if isinstance(result, dict) \
+        else len(result or ())
+    out.put((count, seconds, memory))
+
+
+def main(sql, host='localhost', port=3306, user=None, password=None, db=None):
+    params = dict(host=host, port=port, user=user, password=password, db=db)
+    print '{:<20}{:>12}{:>12}{:>14}{:>14}'.format('mode', 'rows', 'seconds', 'rows/s', 'memory(MB)')
+    for name, func in MODES:
+        out = multiprocessing.Queue()
+        p = multiprocessing.Process(target=_run, args=(func, params, sql, out))
+        p.start()
+        count, seconds, memory = out.get()
+        p.join()
+        print '{:<20}{:>12}{:>12.2f}{:>14.0f}{:>14.1f}'.format(name, count, seconds, count / seconds if seconds else 0,
+                                                              memory / 1024.0)
+
+
+if __name__ == '__main__':
+    fire.Fire(main)
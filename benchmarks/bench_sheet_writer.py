@@ -0,0 +1,69 @@
+# coding: utf-8
+"""
+SheetWriter 逐行 write 与批量 write_rows / write_columns 的吞吐对比, 写入阶段与含 close() 的总耗时分开统计
+python -m benchmarks.bench_sheet_writer --rows=100000
+"""
+
+import os
+import time
+import random
+import tempfile
+import datetime
+import fire
+from utils.xlsx_tool import XlsxTool
+from benchmarks.bench_text_width import INDUSTRIES, POSITIONS
+
+HEADER = [u'编号', u'行业', u'职位', u'人数', u'薪资', u'比例', u'创建时间', u'备注']
+
+
+def make_rows(rows, seed=0):
+    r = random.Random(seed)
+    start = datetime.datetime(2018, 1, 1)
+    return [[i, r.choice(INDUSTRIES), r.choice(POSITIONS), r.randint(1, 5000), r.random() * 50000, r.random(),
+             start + datetime.timedelta(seconds=r.randint(0, 86400 * 365)), u' 备注 {} '.format(i)]
+            for i in xrange(rows)]
+
+
+def _write(sheet, rows):
+    for row in rows:
+        sheet.write(row)
+
+
+def _write_rows(sheet, rows):
+    sheet.write_rows(rows)
+
+
+def _write_columns(sheet, rows):
+    sheet.write_columns(zip(*rows))
+
+
+CASES = [
+    ('write', _write),
+    ('write_rows', _write_rows),
+    ('write_columns', _write_columns),
+]
+
+
+def main(rows=100000, streaming=False):
+    data = make_rows(rows)
+    print '{} rows x {} columns, streaming={}'.format(rows, len(HEADER), streaming)
+    print '{:<16}{:>10}{:>14}{:>10}{:>12}'.format('case', 'write(s)', 'rows/s', 'speedup', 'total(s)')
+    base = None
+    for name, func in CASES:
+        path = os.path.join(tempfile.gettempdir(), 'bench_sheet_writer.xlsx')
+        book = XlsxTool(path, streaming=streaming)
+        sheet = book.sheet('bench')
+        sheet.write(HEADER)
+        start = time.time()
+        func(sheet, data)
+        seconds = time.time() - start
+        sheet.finish()
+        book.close()
+        total = time.time() - start
+        os.remove(path)
+        base = base or seconds
+        print '{:<16}{:>10.2f}{:>14,.0f}{:>9.1f}x{:>12.2f}'.format(name, seconds, rows / seconds, base / seconds, total)
+
+
+if __name__ == '__main__':
+    fire.Fire(main)
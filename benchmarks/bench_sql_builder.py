@@ -0,0 +1,42 @@
+# coding: utf-8
+"""
+SQL/SqlTool 构造语句的单行开销, 对比加入语句缓存之前的实现(sql_builder_baseline)
+python -m benchmarks.bench_sql_builder
+"""
+
+import timeit
+from utils.mysql_tool import SQL, SqlTool
+from benchmarks.sql_builder_baseline import BaselineSQL, BaselineSqlTool
+
+
+ROW = dict(id=1, user_id=10086, industry_id=12, position_name='产品', status=1, create_time='2018-09-01 00:00:00')
+TOOL = SqlTool('position_new').primary_key('id').columns(*ROW).data(**ROW)
+BASELINE_TOOL = BaselineSqlTool('position_new').primary_key('id').columns(*ROW).data(**ROW)
+
+
+def _cases(sql, tool):
+    return [
+        ('SQL.insert', lambda: sql.insert('position_new', **ROW)),
+        ('SQL.upsert', lambda: sql.upsert('position_new', **ROW)),
+        ('SQL.update', lambda: sql.update('position_new', ROW, dict(id=1))),
+        ('SQL.delete', lambda: sql.delete('position_new', id=1, status=1)),
+        ('SQL.select', lambda: sql.select('position_new', 'id', 'position_name', industry_id=12, status=1)),
+        ('SQL.update_insert', lambda: sql.update_insert('position_new', dict(id=1), position_name='产品', status=1)),
+        ('SqlTool.update_query', lambda: tool.update_query),
+        ('SqlTool.insert_query', lambda: tool.insert_query),
+    ]
+
+
+def _per_call(func, number):
+    return min(timeit.repeat(func, number=number, repeat=3)) / number * 1e6
+
+
+def main(number=100000):
+    print '{:<24}{:>14}{:>14}{:>10}'.format('builder', 'before(us)', 'cached(us)', 'speedup')
+    for (name, before), (_, after) in zip(_cases(BaselineSQL, BASELINE_TOOL), _cases(SQL, TOOL)):
+        before, after = _per_call(before, number), _per_call(after, number)
+        print '{:<24}{:>14.2f}{:>14.2f}{:>9.1f}x'.format(name, before, after, before / after)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+# coding: utf-8
+"""
+SheetWriter.get_text_width 在中文行业/职位数据上的开销, 对比原逐字符循环实现
+python -m benchmarks.bench_text_width --rows=100000
+"""
+
+import random
+import timeit
+import fire
+from utils.xlsx_tool import _u, SheetWriter
+
+
+INDUSTRIES = [u'农林牧渔', u'采掘', u'化工', u'钢铁', u'有色金属', u'电子', u'家用电器', u'食品饮料', u'纺织服装',
+              u'轻工制造', u'医药生物', u'公用事业', u'交通运输', u'房地产', u'商业贸易', u'休闲服务', u'计算机', u'传媒']
+POSITIONS = [u'Java开发工程师', u'产品经理', u'UI设计师', u'运营专员', u'销售代表', u'财务主管', u'HRBP', u'数据分析师']
+
+
+def loop_width(text):
+    """优化前的实现"""
+    text = unicode(_u(text))
+    width = 0
+    for c in unicode(_u(text)):
+        if ord(c) < 256:
+            width += 1
+        else:
+            width += 2.4
+    return width
+
+
+def make_rows(rows, seed=0):
+    r = random.Random(seed)
+    return [(r.randint(1, 10 ** 6), r.choice(INDUSTRIES), r.choice(INDUSTRIES) + u'/' + r.choice(POSITIONS),
+             u'{}-{}'.format(r.choice(POSITIONS), r.randint(1, 500)), r.random() * 1000) for _ in xrange(rows)]
+
+
+def _best(func, repeat=3):
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def main(rows=100000):
+    data = make_rows(rows)
+    cells = [v for row in data for v in row]
+    for v in cells:
+        assert abs(loop_width(v) - SheetWriter.get_text_width(v)) < 1e-6, v
+    cases = [
+        ('loop per cell', lambda: [loop_width(v) for v in cells]),
+        ('get_text_width per cell', lambda: [SheetWriter.get_text_width(v) for v in cells]),
+        ('get_text_widths per row', lambda: [SheetWriter.get_text_widths(row) for row in data]),
+    ]
+    base = None
+    print '{} rows, {} cells'.format(rows, len(cells))
+    print '{:<28}{:>10}{:>14}{:>10}'.format('case', 'seconds', 'cells/s', 'speedup')
+    for name, func in cases:
+        seconds = _best(func)
+        base = base or seconds
+        print '{:<28}{:>10.3f}{:>14,.0f}{:>9.1f}x'.format(name, seconds, len(cells) / seconds, base / seconds)
+
+
+if __name__ == '__main__':
+    fire.Fire(main)
@@ -0,0 +1,102 @@
+# coding: utf-8
+"""
+TimeTool 月/季度/周边界和日期提示的单次调用开销, 对比改为日历表之前的实现
+python -m benchmarks.bench_time_calendar --count=200000
+"""
+
+import random
+import timeit
+import datetime
+import fire
+from utils.time_tool import TimeTool
+
+
+class Before(object):
+    """改为日历表之前的实现"""
+
+    @classmethod
+    def get_month_first(cls, d):
+        if not isinstance(d, datetime.date):
+            return None
+        return datetime.datetime(year=d.year, month=d.month, day=1)
+
+    @classmethod
+    def get_next_month_first(cls, d):
+        if d.month == 12:
+            return datetime.datetime(year=d.year + 1, month=1, day=1)
+        return datetime.datetime(year=d.year, month=d.month + 1, day=1)
+
+    @classmethod
+    def get_month_last(cls, d):
+        return cls.get_next_month_first(d) - datetime.timedelta(microseconds=1)
+
+    @classmethod
+    def get_quarter_first(cls, d):
+        year, quarter = TimeTool.get_quarter(d)
+        return cls.get_month_first(datetime.datetime(year=year, month=(quarter - 1) * 3 + 1, day=1))
+
+    @classmethod
+    def get_quarter_last(cls, d):
+        year, quarter = TimeTool.get_quarter(d)
+        return cls.get_month_last(datetime.datetime(year=year, month=(quarter - 1) * 3 + 3, day=1))
+
+    @classmethod
+    def get_first_last_date_by_week_number(cls, year, week_number):
+        if isinstance(year, int) and year > 0 and isinstance(week_number, int) and 0 <= week_number <= 52:
+            year_first = datetime.datetime(year=year, month=1, day=1)
+            return (year_first + datetime.timedelta(days=week_number * 7 - year_first.weekday()),
+                    year_first + datetime.timedelta(days=week_number * 7 - year_first.weekday() + 7)
+                    - datetime.timedelta(microseconds=1))
+        return None, None
+
+    @classmethod
+    def get_date_tips(cls, d, _type='day'):
+        if isinstance(d, (str, unicode)):
+            d = TimeTool.str_to_datetime(d)
+        if isinstance(d, datetime.date):
+            d = TimeTool.date_to_datetime(d)
+        if isinstance(d, datetime.datetime):
+            if _type == 'day':
+                return '周' + ('一', '二', '三', '四', '五', '六', '日')[d.weekday()]
+            elif _type == 'week':
+                y, w, d = d.isocalendar()
+                return '%d年第%02d周' % (y, w)
+            elif _type == 'month':
+                return '%d年%02d月' % (d.year, d.month)
+            elif _type == 'quarter':
+                year, quarter = TimeTool.get_quarter(d)
+                return '%d年%02d季度' % (year, quarter)
+        return ''
+
+
+def cases(dates, weeks):
+    return [
+        ('get_month_first', lambda t: [t.get_month_first(d) for d in dates]),
+        ('get_month_last', lambda t: [t.get_month_last(d) for d in dates]),
+        ('get_next_month_first', lambda t: [t.get_next_month_first(d) for d in dates]),
+        ('get_quarter_first', lambda t: [t.get_quarter_first(d) for d in dates]),
+        ('get_quarter_last', lambda t: [t.get_quarter_last(d) for d in dates]),
+        ('week_number', lambda t: [t.get_first_last_date_by_week_number(y, w) for y, w in weeks]),
+        ('get_date_tips(day)', lambda t: [t.get_date_tips(d, 'day') for d in dates]),
+        ('get_date_tips(week)', lambda t: [t.get_date_tips(d, 'week') for d in dates]),
+        ('get_date_tips(month)', lambda t: [t.get_date_tips(d, 'month') for d in dates]),
+        ('get_date_tips(quarter)', lambda t: [t.get_date_tips(d, 'quarter') for d in dates]),
+    ]
+
+
+def main(count=200000):
+    r = random.Random(0)
+    dates = [datetime.datetime(2015, 1, 1) + datetime.timedelta(seconds=r.randint(0, 86400 * 365 * 5))
+             for _ in xrange(count)]
+    weeks = [(r.randint(2015, 2020), r.randint(0, 52)) for _ in xrange(count)]
+    print '{} calls each'.format(count)
+    print '{:<24}{:>12}{:>12}{:>10}'.format('helper', 'before(us)', 'after(us)', 'speedup')
+    for name, func in cases(dates, weeks):
+        assert func(Before) == func(TimeTool), name
+        before = min(timeit.repeat(lambda: func(Before), number=1, repeat=3)) / count * 1e6
+        after = min(timeit.repeat(lambda: func(TimeTool), number=1, repeat=3)) / count * 1e6
+        print '{:<24}{:>12.2f}{:>12.2f}{:>9.1f}x'.format(name, before, after, before / after)
+
+
+if __name__ == '__main__':
+    fire.Fire(main)
@@ -0,0 +1,107 @@
+# coding: utf-8
+"""
+TimeTool 时间戳批量转换的吞吐, 对比逐个调用标量方法, 并校验两者结果相同
+计时的数据为最近 days 天内的时间戳; 另取覆盖 1970-2037 年的数据只校验结果, 包含各次夏令时切换前后的时刻
+tz 指定时区(如 America/New_York)时在该时区下运行
+python -m benchmarks.bench_time_epoch --count=200000 --tz=Asia/Shanghai
+"""
+
+import os
+import time
+import random
+import calendar
+import datetime
+import fire
+from utils.time_tool import TimeTool
+
+
+def make_millis(count, start, end, seed=0):
+    r = random.Random(seed)
+    millis = []
+    for _ in xrange(count):
+        x = r.random()
+        if x < 0.01:
+            millis.append(r.choice([0, None]))
+        elif x < 0.1:
+            millis.append(r.randint(start, end) * 1000 + r.random())
+        else:
+            millis.append(r.randint(start, end) * 1000 + r.randint(0, 999))
+    return millis
+
+
+def make_strings(millis, seed=0):
+    r = random.Random(seed)
+    strings = []
+    for s in TimeTool.millis_to_strs(millis):
+        x = r.random()
+        if x < 0.1:
+            s = s[:10]
+        elif x < 0.12:
+            s = s.replace('-', '/')
+        strings.append(s)
+    return strings
+
+
+def ambiguous(value):
+    """夏令时切换时重复或不存在的本地时间, mktime 的结果与之前的调用有关, 不参与校验"""
+    d = TimeTool.str_to_datetime(value) if isinstance(value, str) else value
+    if not isinstance(d, datetime.date):
+        return False
+    t = d.timetuple()[:6]
+    local = calendar.timegm(t)
+    offsets = set(TimeTool._utc_offset(local + delta) for delta in (-86400, 86400))
+    return len(offsets) > 1 and sum(time.localtime(local - offset)[:6] == t for offset in offsets) != 1
+
+
+def measure(name, scalar, bulk, values, verbose=True):
+    start = time.time()
+    expected = [scalar(v) for v in values]
+    before = time.time() - start
+    start = time.time()
+    result = bulk(values)
+    after = time.time() - start
+    assert len(result) == len(expected), name
+    for v, x, y in zip(values, expected, result):
+        assert x == y or ambiguous(v), (name, v, x, y)
+    count = len(values)
+    if verbose:
+        print '{:<24}{:>14,.0f}/s{:>14,.0f}/s{:>8.1f}x'.format(name, count / before, count / after, before / after)
+
+
+def run(millis, verbose=True):
+    seconds = [m / 1000 if m else m for m in millis]
+    strings = make_strings(millis)
+    datetimes = [TimeTool.str_to_datetime(s) for s in strings]
+    datetimes += [d.date() for d in datetimes[:len(datetimes) / 10] if d]
+    measure('millis_to_datetime', TimeTool.millis_to_datetime, TimeTool.millis_to_datetimes, millis, verbose)
+    measure('millis_to_str', TimeTool.millis_to_str, TimeTool.millis_to_strs, millis, verbose)
+    measure('millis_to_str(%Y%m%d)', lambda m: TimeTool.millis_to_str(m, '%Y%m%d'),
+            lambda v: TimeTool.millis_to_strs(v, '%Y%m%d'), millis, verbose)
+    measure('seconds_to_str', TimeTool.seconds_to_str, TimeTool.seconds_to_strs, seconds, verbose)
+    measure('datetime_to_millis', TimeTool.datetime_to_millis, TimeTool.datetimes_to_millis, datetimes, verbose)
+    measure('str_to_millis', TimeTool.str_to_millis, TimeTool.strs_to_millis, strings, verbose)
+    measure('query_to_millis(second)', lambda s: TimeTool.datetime_to_millis(TimeTool.str_to_datetime(s)) / 1000,
+            lambda v: list(TimeTool.query_to_millis(*v, second=True)), strings, verbose)
+
+
+def main(count=200000, days=365, tz=None):
+    if tz:
+        os.environ['TZ'] = tz
+        time.tzset()
+    now = int(time.time())
+    run(make_millis(count / 4, 0, 2 ** 31 - 1, seed=1), verbose=False)
+
+    print '{} values in {} days, TZ={}'.format(count, days, tz or time.tzname[0])
+    print '{:<24}{:>16}{:>16}{:>9}'.format('helper', 'scalar', 'bulk', 'speedup')
+    run(make_millis(count, now - days * 86400, now))
+
+    # 当前时间前后 days 天的时间戳, 误差为两次取时间的间隔
+    for days in (-1, 0, 7):
+        expected = int(time.time() * 1000) + days * 86400 * 1000
+        assert abs(TimeTool.current_millis(days) - expected) < 1000, days
+    assert TimeTool.millis_to_strs([86400 * 1000], offset=0) == ['1970-01-02 00:00:00']
+    assert TimeTool.datetimes_to_millis([datetime.datetime(1970, 1, 2, 8)], offset=8 * 3600) == [86400 * 1000]
+
+
+if __name__ == '__main__':
+    fire.Fire(main)
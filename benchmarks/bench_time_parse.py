@@ -0,0 +1,72 @@
+# coding: utf-8
+"""
+TimeTool.str_to_datetime 批量解析时间字符串的吞吐, 对比直接调用 dateutil
+mixed: 90% 为 %Y-%m-%d %H:%M:%S, 8% 为 %Y-%m-%d, 2% 为少量重复的其他格式
+unique: 每个字符串都不重复, 一半为 %Y/%m/%d %H:%M:%S, 一半为需要 dateutil 解析的格式, 缓存不会命中
+dateutil 较慢, 只解析前 baseline 条估算吞吐
+python -m benchmarks.bench_time_parse --count=1000000
+"""
+
+import time
+import random
+import datetime
+import fire
+from dateutil import parser
+from utils.time_tool import TimeTool
+
+OTHER_FORMATS = ['%Y/%m/%d', '%Y%m%d', '%d/%m/%Y %H:%M']
+
+
+def make_strings(count, seed=0):
+    r = random.Random(seed)
+    start = datetime.datetime(2015, 1, 1)
+    others = [(start + datetime.timedelta(days=r.randint(0, 1000))).strftime(r.choice(OTHER_FORMATS))
+              for _ in xrange(500)]
+    strings = []
+    for _ in xrange(count):
+        x = r.random()
+        if x < 0.02:
+            strings.append(r.choice(others))
+        else:
+            d = start + datetime.timedelta(seconds=r.randint(0, 86400 * 1500))
+            strings.append(d.strftime('%Y-%m-%d %H:%M:%S' if x < 0.92 else '%Y-%m-%d'))
+    return strings
+
+
+def make_unique_strings(count):
+    start = datetime.datetime(2018, 1, 1)
+    strings = []
+    for i in xrange(count):
+        d = start + datetime.timedelta(seconds=i * 4801)
+        strings.append(d.strftime('%Y/%m/%d %H:%M:%S' if i % 2 else OTHER_FORMATS[2]))
+    return strings
+
+
+def run(name, strings, baseline):
+    count = len(strings)
+    start = time.time()
+    for s in strings[:baseline]:
+        parser.parse(s)
+    base = min(baseline, count) / (time.time() - start)
+
+    TimeTool.parse_cache.clear()
+    TimeTool.reset_parse_stats()
+    start = time.time()
+    for s in strings:
+        TimeTool.str_to_datetime(s)
+    seconds = time.time() - start
+
+    print '{}: {} strings'.format(name, count)
+    print '{:<24}{:>14,.0f} strings/s'.format('dateutil', base)
+    print '{:<24}{:>14,.0f} strings/s  {:.2f}s  {:.1f}x'.format('str_to_datetime', count / seconds, seconds,
+                                                                count / seconds / base)
+    print 'tiers', TimeTool.parse_stats
+
+
+def main(count=1000000, baseline=50000, unique=6480):
+    run('mixed', make_strings(count), baseline)
+    run('unique', make_unique_strings(unique), baseline)
+
+
+if __name__ == '__main__':
+    fire.Fire(main)
@@ -0,0 +1,127 @@
+# coding: utf-8
+"""
+加入语句缓存之前的 SQL / SqlTool 语句构造, 原样保留供 bench_sql_builder 对比, 不要在业务代码中使用
+"""
+
+from utils.mysql_tool import SqlTool
+
+
+class BaselineSQL(object):
+
+    @classmethod
+    def insert(cls, table_name, **values):
+        columns = values.keys()
+        params = tuple(map(lambda k: values.get(k), columns))
+        sql = 'insert into `{table_name}` ({columns}) values({params})' \
+              ''.format(table_name=table_name,
+                        columns=', '.join(map(lambda k: '`{}`'.format(k), columns)),
+                        params=', '.join(['%s'] * len(columns)))
+        return sql, params
+
+    @classmethod
+    def upsert(cls, table_name, **values):
+        if not isinstance(table_name, str):
+            raise TypeError('table_name must be string')
+        if not values:
+            raise ValueError('need at least one filed value')
+
+        columns = values.keys()
+        set_columns = map(lambda k: '`{}` = %s'.format(k), columns)
+        sql = 'insert into `{table_name}` ({columns}) values({params}) ' \
+              'on duplicate key update {set_columns}' \
+              ''.format(table_name=table_name,
+                        columns=', '.join(map(lambda k: '`{}`'.format(k), columns)),
+                        params=', '.join(['%s'] * len(columns)),
+                        set_columns=', '.join(set_columns))
+        params = tuple(map(lambda k: values.get(k), columns))
+        params = params + params
+        return sql, params
+
+    @classmethod
+    def update(cls, table_name, values, where):
+        if not isinstance(table_name, str):
+            raise TypeError('`table_name` must be string object')
+        if not isinstance(values, dict):
+            raise TypeError('`values` must be dict object')
+        if not isinstance(where, dict):
+            raise TypeError('`where` must be dict object')
+        set_columns = values.keys()
+        where_columns = where.keys()
+        sql = 'update `{table_name}` set {set_columns} where {where_columns}'.format(
+            table_name=table_name,
+            set_columns=', '.join(map(lambda x: '`{}` = %s'.format(x), set_columns)),
+            where_columns=' and '.join(map(lambda x: '`{}` = %s'.format(x), where_columns))
+        )
+        params = tuple(map(lambda x: values.get(x), set_columns) + map(lambda x: where.get(x), where_columns))
+        return sql, params
+
+    @classmethod
+    def delete(cls, table_name, **where):
+        if not isinstance(table_name, str):
+            raise TypeError('`table_name` must be string object')
+        if not where:
+            raise ValueError('need at least one filed value')
+        where_columns = where.keys()
+        sql = 'delete from `{table_name}` where {where_columns}'.format(
+            table_name=table_name,
+            where_columns=' and '.join(map(lambda x: '`{}` = %s'.format(x), where_columns))
+        )
+        params = tuple(map(lambda x: where.get(x), where_columns))
+        return sql, params
+
+    @classmethod
+    def select(cls, table_name, *columns, **where):
+        if not columns:
+            columns = ('*',)
+        where_columns = where.keys()
+        sql = 'select {columns} from `{table_name}` where {where}'.format(
+            columns=', '.join(columns),
+            table_name=table_name,
+            where=' and '.join(map(lambda x: '`{}` = %s'.format(x), where_columns))
+        )
+        params = tuple(map(lambda x: where.get(x), where_columns))
+        return sql, params
+
+    @classmethod
+    def update_insert(cls, table_name, duplicate, **data):
+        if not isinstance(table_name, str):
+            raise TypeError('table_name must be string')
+        if not data:
+            raise ValueError('need at least one filed value')
+        if not isinstance(duplicate, dict) or not isinstance(data, dict):
+            raise TypeError('data or update_ata must be dict object')
+        upsert_columns = data.keys()
+        data.update(duplicate)
+        insert_columns = data.keys()
+        set_columns = map(lambda k: '`{}` = %s'.format(k), upsert_columns)
+        sql = 'insert into `{table_name}` ({columns}) values({params}) ' \
+              'on duplicate key update {set_columns}' \
+              ''.format(table_name=table_name,
+                        columns=', '.join(map(lambda k: '`{}`'.format(k), insert_columns)),
+                        params=', '.join(['%s'] * len(insert_columns)),
+                        set_columns=', '.join(set_columns))
+        insert_params = tuple(map(lambda k: data.get(k), insert_columns))
+        upsert_params = tuple(map(lambda k: data.get(k), upsert_columns))
+        return sql, insert_params + upsert_params
+
+
+class BaselineSqlTool(SqlTool):
+
+    @property
+    def update_query(self):
+        update = ', '.join(map(lambda x: '{k} = %s'.format(k=x), self._columns))
+        primary = ' and '.join(map(lambda x: '{k} = %s'.format(k=x), self._primary_keys))
+        params = (map(lambda x: self._values.get(x), self._columns) +
+                  map(lambda x: self._values.get(x), self._primary_keys))
+
+        return 'update {table_name} set {update} where {primary} ' \
+               ''.format(table_name=self._table_name, update=update, primary=primary), tuple(params)
+
+    @property
+    def insert_query(self):
+        keys = set(self._columns + self._primary_keys)
+        columns = ', '.join(keys)
+        values = ', '.join(['%s'] * len(keys))
+        params = map(lambda x: self._values.get(x), keys)
+        return 'insert into {table_name}({columns}) values ({values})' \
+               ''.format(table_name=self._table_name, columns=columns, values=values), tuple(params)
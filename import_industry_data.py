@@ -1,30 +1,86 @@
 # coding: utf8
 
-import torndb
+import collections
 import fire
+from utils.mysql_tool import MySqlClient
 
 
-db_industry = torndb.Connection(host="localhost", user="dever", password="dever", database="user", charset="utf8")
+# local_infile 开启时用 LOAD DATA 导入, 服务端禁用时 load_file 自动改用多行 insert
+DB_CONFIG = dict(host="localhost", user="dever", password="dever", db="user", charset="utf8", local_infile=True)
+# MySqlClient 创建时即连接, 首次使用时才创建
+db_industry = None
+
+# 改用 insert 时每条语句包含的行数, 往返次数为 行数 / BATCH_SIZE
+BATCH_SIZE = 1000
+# 源数据中表示该列为空的占位值
+PLACEHOLDER = "aaaa"
+
+
+def _s(u):
+    if isinstance(u, unicode):
+        return u.encode("utf-8")
+    return u
+
+
+def _db():
+    global db_industry
+    if db_industry is None:
+        db_industry = MySqlClient(**DB_CONFIG)
+    return db_industry
+
+
+def _iter_lines(path):
+    """逐行读取数据文件, 按 tab 切分, 跳过空行"""
+    with open(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield [column.strip() for column in line.split("\t")]
+
 
 class ImportIndustryData(object):
     """导入新一级行业数据"""
     @classmethod
-    def import_new_industry1(cls):
-        # 讲一级行业读到列表中
-        new_industry_list = list()
-        with open("./new_industry1_data", "r") as f:
-            for line in f.readlines():
-                if line.strip():
-                    print type(line.strip())
-                    new_industry_list.append([line.strip()])
-
-        db_industry.insertmany("insert into industry_new(industry_name) values (%s)", new_industry_list)
-
+    def import_new_industry1(cls, path="./new_industry1_data", batch_size=BATCH_SIZE):
+        return _db().load_file("industry_new", ((columns[0],) for columns in _iter_lines(path)),
+                               ["industry_name"], chunk_size=batch_size)
 
     """导入新二级行业和职位"""
     @classmethod
-    def import_new_industry2(cls):
-        pass
+    def import_new_industry2(cls, path="./new_industry2_data", batch_size=BATCH_SIZE):
+        """
+        数据文件每行三列: 二级行业, 职位, 所属一级行业, 为空的列用 PLACEHOLDER 占位
+        二级行业写入 industry_new(industry_level=2), 职位写入 position_new, 均关联到一级行业 id
+        """
+        # 一次查出全部一级行业, 之后按名称在内存中查找 id
+        rows = _db().query("select id, industry_name from industry_new where industry_level = 1")
+        if rows is None:
+            raise RuntimeError("failed to query level 1 industries")
+        industry1 = dict((_s(row["industry_name"]), row["id"]) for row in rows)
+
+        # 表上没有 (上级 id, 名称) 的唯一索引, 只能在内存中按首次出现的顺序去重:
+        # 名称 40 字节时每种 (一级行业 id, 名称) 约占 400 字节, 内存只与行业/职位的种类数有关, 与文件行数无关,
+        # 百万种约 400MB; 之后若加唯一索引, 可改为 insert ignore 由数据库去重
+        industries, positions = collections.OrderedDict(), collections.OrderedDict()
+        skipped = 0
+
+        for columns in _iter_lines(path):
+            if len(columns) < 3 or columns[2] not in industry1:
+                skipped += 1
+                continue
+            industry2_name, position_name, industry1_name = columns[:3]
+            parent_id = industry1[industry1_name]
+            if industry2_name != PLACEHOLDER:
+                industries.setdefault((parent_id, industry2_name))
+            if position_name != PLACEHOLDER:
+                positions.setdefault((parent_id, position_name))
+
+        industry_count = _db().load_file(
+            "industry_new", ((2, parent_id, name) for parent_id, name in industries),
+            ["industry_level", "parent_id", "industry_name"], chunk_size=batch_size)
+        position_count = _db().load_file(
+            "position_new", positions, ["industry_id", "position_name"], chunk_size=batch_size)
+        return dict(industry=industry_count, position=position_count, skipped=skipped)
 
 
 if __name__ == "__main__":
@@ -32,4 +88,5 @@ if __name__ == "__main__":
     fire.Fire(ImportIndustryData)
 
 
-# cp -P22 import_industry_data.py louyongfeng@123.57.143.47:/home/louyongfeng/hundun_2018/20180901_industry_data_cleaning
\ No newline at end of file
+# cp -P22 import_industry_data.py \
+#     louyongfeng@123.57.143.47:/home/louyongfeng/hundun_2018/20180901_industry_data_cleaning
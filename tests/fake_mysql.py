@@ -0,0 +1,130 @@
+# coding: utf-8
+"""
+测试共用的 MySQLdb 替身, 不需要 MySQL 服务
+>>> server = FakeServer(rows=[dict(id=1)])
+>>> server.install(self)    # 在 TestCase.setUp 中替换 MySQLdb.connect, 测试结束后恢复
+>>> MySqlClient(db='test').query('select id from t')
+"""
+
+import threading
+import MySQLdb
+
+
+class FakeCursor(object):
+
+    def __init__(self, server):
+        self.server = server
+        self.rows = []
+        self.rowcount = 0
+        self.description = None
+
+    def execute(self, sql, args=None):
+        self.rows = list(self.server.execute(sql, args))
+        self.rowcount = len(self.rows)
+        self.description = self.server.description
+        return self.rowcount
+
+    def executemany(self, sql, values):
+        self.rowcount = self.server.executemany(sql, values)
+        return self.rowcount
+
+    def _fetch(self, size):
+        if self.server.fetch_error is not None:
+            raise self.server.fetch_error
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+    def fetchmany(self, size):
+        return self._fetch(size)
+
+    def fetchall(self):
+        return self._fetch(len(self.rows))
+
+    def fetchone(self):
+        rows = self._fetch(1)
+        return rows[0] if rows else None
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def close(self):
+        pass
+
+
+class FakeConnection(object):
+
+    def __init__(self, server):
+        self.server = server
+        self.closed = False
+
+    def cursor(self, cursorclass=None):
+        return FakeCursor(self.server)
+
+    def _check(self):
+        if self.server.down:
+            raise MySQLdb.OperationalError(2006, 'MySQL server has gone away')
+
+    def ping(self):
+        self.server.pings += 1
+        self._check()
+
+    def commit(self):
+        self.server.commits += 1
+
+    def rollback(self):
+        self.server.rollbacks += 1
+        self._check()
+
+    def close(self):
+        self.closed = True
+
+
+class FakeServer(object):
+    """
+    替身服务, 所有连接共享状态, 计数在多线程下不保证精确:
+    rows 为每条查询返回的行, description 为游标的 description;
+    down 为 True 时连接、ping 和 rollback 都失败; errors 中的异常按顺序在之后的 execute 中抛出;
+    fetch_error 不为空时读取结果抛出该异常; executemany 写入的行记录在 inserted 中
+    需要按语句返回不同结果或按数据失败时, 在子类中覆盖 execute / executemany
+    """
+
+    def __init__(self, rows=(), description=(('id',),)):
+        self.rows = list(rows)
+        self.description = description
+        self.down = False
+        self.errors = []
+        self.fetch_error = None
+        self.executed = []
+        self.inserted = []
+        self.connects = self.pings = self.commits = self.rollbacks = 0
+        self.lock = threading.Lock()
+
+    def connect(self, **kwargs):
+        self.connects += 1
+        self.kwargs = kwargs
+        if self.down:
+            raise MySQLdb.OperationalError(2003, "Can't connect to MySQL server")
+        return FakeConnection(self)
+
+    def install(self, test):
+        """用本服务替换 MySQLdb.connect(mysql_tool、mysql_pool 引用的是同一个模块), test 结束后恢复"""
+        test.addCleanup(setattr, MySQLdb, 'connect', MySQLdb.connect)
+        MySQLdb.connect = self.connect
+        return self
+
+    def execute(self, sql, args=None):
+        """返回查询结果"""
+        with self.lock:
+            self.executed.append((sql, args))
+            if self.errors:
+                raise self.errors.pop(0)
+        return self.rows
+
+    def executemany(self, sql, values):
+        """返回写入的行数"""
+        with self.lock:
+            self.executed.append((sql, values))
+            if self.errors:
+                raise self.errors.pop(0)
+            self.inserted.extend(values)
+        return len(values)
@@ -0,0 +1,216 @@
+# coding: utf-8
+"""
+BoundedQueue 以及基于它的 parallel_scan、MySqlClient.stream_query、Exporter.write_sheets:
+结果完整, 生产方出错时由调用方抛出, 调用方提前结束时阻塞在队列上的生产方能退出
+python -m unittest discover -s tests -t .
+"""
+
+import time
+import threading
+import unittest
+import collections
+from utils.base import BoundedQueue
+from utils.orm_iter import parallel_scan
+from utils.mysql_tool import MySqlClient
+from utils.xlsx_tool import Exporter
+from tests.fake_mysql import FakeServer
+
+
+def produce_range(queue, start, end):
+    for i in xrange(start, end):
+        if not queue.put(i):
+            return
+
+
+def produce_error(queue):
+    queue.put(1)
+    raise ValueError('boom')
+
+
+class BoundedQueueTest(unittest.TestCase):
+
+    def check_all_items(self, processes):
+        with BoundedQueue(4, processes=processes) as queue:
+            queue.start(produce_range, args=(queue, 0, 100), workers=3)
+            self.assertEqual(sorted(queue), sorted(range(100) * 3))
+
+    def test_threads(self):
+        self.check_all_items(False)
+
+    def test_processes(self):
+        self.check_all_items(True)
+
+    def test_error(self):
+        with BoundedQueue(4) as queue:
+            queue.start(produce_error, args=(queue,))
+            self.assertRaises(ValueError, list, queue)
+
+    def test_process_error(self):
+        with BoundedQueue(4, processes=True, name='test worker') as queue:
+            queue.start(produce_error, args=(queue,))
+            with self.assertRaises(RuntimeError) as context:
+                list(queue)
+            self.assertIn('test worker failed', str(context.exception))
+            self.assertIn('boom', str(context.exception))
+
+    def test_close_stops_blocked_producers(self):
+        queue = BoundedQueue(2)
+        queue.start(produce_range, args=(queue, 0, 10 ** 6), workers=2)
+        self.assertEqual(next(iter(queue)), 0)
+        queue.close()
+        self.assertTrue(queue.stopped)
+        self.assertFalse(any(runner.is_alive() for runner in queue._runners))
+
+
+class RangeFetcher(object):
+    """id 为 1..count 的替身表"""
+
+    processes = True
+
+    def __init__(self, count, fail_at=None):
+        self.count = count
+        self.fail_at = fail_at
+        self.closed = 0
+
+    def min_max(self):
+        return 1, self.count
+
+    def fetch(self, start, end, limit):
+        if self.fail_at is not None and start < self.fail_at <= end:
+            raise ValueError('fetch failed')
+        return [dict(id=i) for i in xrange(start + 1, min(end, start + limit) + 1)]
+
+    @staticmethod
+    def key(row):
+        return row['id']
+
+    def reset(self):
+        pass
+
+    def close(self):
+        self.closed += 1
+
+
+class ParallelScanTest(unittest.TestCase):
+
+    def test_rows(self):
+        for processes in (False, True):
+            rows = parallel_scan(RangeFetcher(1000), workers=3, limit=7, processes=processes)
+            self.assertEqual(sorted(row['id'] for row in rows), range(1, 1001))
+
+    def test_error(self):
+        self.assertRaises(ValueError, list, parallel_scan(RangeFetcher(1000, fail_at=500), workers=3, limit=7))
+
+    def test_break(self):
+        threads = threading.active_count()
+        fetcher = RangeFetcher(10 ** 6)
+        rows = parallel_scan(fetcher, workers=3, limit=10, queue_size=2)
+        next(rows)
+        rows.close()
+        self.assertEqual(fetcher.closed, 1)
+        self.assertEqual(threading.active_count(), threads)
+
+
+class StreamQueryTest(unittest.TestCase):
+
+    def client(self, count=0, fail=False):
+        server = FakeServer(rows=[dict(id=i) for i in xrange(count)]).install(self)
+        if fail:
+            server.fetch_error = ValueError('fetch failed')
+        return MySqlClient(db='test')
+
+    def test_rows(self):
+        rows = self.client(1000).stream_query('select id from t', chunk_size=7, transform=lambda row: row['id'])
+        self.assertEqual(list(rows), range(1000))
+
+    def test_error(self):
+        self.assertRaises(ValueError, list, self.client(fail=True).stream_query('select id from t'))
+
+    def test_break(self):
+        threads = threading.active_count()
+        rows = self.client(10 ** 5).stream_query('select id from t', chunk_size=10, prefetch=1)
+        next(rows)
+        rows.close()
+        self.assertEqual(threading.active_count(), threads)
+
+
+class MemoryExporter(Exporter):
+
+    def __init__(self):
+        self.sheets = []
+
+    def sheet(self, sheet_name=None, **options):
+        writer = MemorySheet(sheet_name)
+        self.sheets.append(writer)
+        return writer
+
+    def close(self):
+        pass
+
+
+class MemorySheet(object):
+
+    def __init__(self, name):
+        self.name = name
+        self.rows = []
+
+    def write(self, row):
+        self.rows.append(row)
+
+    def write_rows(self, rows):
+        self.rows.extend(rows)
+
+    def finish(self):
+        pass
+
+
+def fetch_rows(count):
+    return [collections.OrderedDict(id=i) for i in xrange(count)]
+
+
+def fetch_slowly():
+    for i in xrange(10 ** 6):
+        yield [i]
+
+
+def fetch_error():
+    raise ValueError('fetch failed')
+
+
+class WriteSheetsTest(unittest.TestCase):
+
+    def test_sheets(self):
+        for processes in (False, True):
+            book = MemoryExporter()
+            sheets = [('a', lambda: fetch_rows(10)), ('b', lambda: fetch_rows(2500), ['x']), ('c', lambda: []),
+                      ('d', lambda: [dict(id=1, name='n')], None, ['name', 'id'])]
+            counts = book.write_sheets(sheets, workers=2, chunk_size=100, processes=processes)
+            self.assertEqual(counts, [10, 2500, 0, 1])
+            self.assertEqual([s.name for s in book.sheets], ['a', 'b', 'c', 'd'])
+            self.assertEqual(book.sheets[0].rows, [['id']] + [[i] for i in range(10)])
+            self.assertEqual(book.sheets[1].rows, [['x']] + [[i] for i in range(2500)])
+            self.assertEqual(book.sheets[2].rows, [])
+            self.assertEqual(book.sheets[3].rows, [['name', 'id'], ['n', 1]])
+
+    def test_plain_dict_rows_need_columns(self):
+        book = MemoryExporter()
+        self.assertRaises(ValueError, book.write_sheets, [('a', lambda: [dict(id=1, name='n')])])
+
+    def test_error(self):
+        threads = threading.active_count()
+        book = MemoryExporter()
+        start = time.time()
+        self.assertRaises(ValueError, book.write_sheets, [('a', fetch_slowly), ('b', fetch_error)], chunk_size=10,
+                          queue_size=1)
+        self.assertLess(time.time() - start, 5)
+        self.assertEqual(threading.active_count(), threads)
+
+    def test_process_error(self):
+        book = MemoryExporter()
+        with self.assertRaises(RuntimeError) as context:
+            book.write_sheets([('a', fetch_error)], processes=True)
+        self.assertIn('sheet a failed', str(context.exception))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+# coding: utf-8
+"""
+MySqlClient.bulk_insert: MySQLError 按块记录, 其他异常停止读取 rows 并抛给调用方, 不会因 worker 退出而阻塞
+用替身代替 MySQLdb.connect, 不需要 MySQL 服务
+python -m unittest discover -s tests -t .
+"""
+
+import threading
+import unittest
+import MySQLdb
+from utils.mysql_tool import MySqlClient
+from tests.fake_mysql import FakeServer
+
+
+class BulkInsertServer(FakeServer):
+    """按块的第一个值注入 MySQLError 或其他异常"""
+
+    def __init__(self, mysql_errors=(), type_errors=()):
+        super(BulkInsertServer, self).__init__()
+        self.mysql_errors = set(mysql_errors)
+        self.type_errors = set(type_errors)
+
+    def executemany(self, sql, values):
+        first = values[0][0]
+        if first in self.mysql_errors:
+            raise MySQLdb.MySQLError('duplicate entry {}'.format(first))
+        if first in self.type_errors:
+            raise TypeError('not all arguments converted during string formatting')
+        return super(BulkInsertServer, self).executemany(sql, values)
+
+
+class BulkInsertTest(unittest.TestCase):
+
+    sql = 'insert into t (id) values (%s)'
+
+    def setUp(self):
+        self.threads = threading.active_count()
+
+    def tearDown(self):
+        self.assertEqual(threading.active_count(), self.threads)
+
+    def client(self, server):
+        server.install(self)
+        return MySqlClient(db='test')
+
+    def test_rows(self):
+        server = BulkInsertServer()
+        result = self.client(server).bulk_insert(self.sql, ((i,) for i in xrange(1000)), chunk_size=30, workers=3)
+        self.assertEqual(result['rows'], 1000)
+        self.assertEqual(result['chunks'], 34)
+        self.assertEqual(sorted(server.inserted), [(i,) for i in xrange(1000)])
+
+    def test_mysql_errors_recorded(self):
+        server = BulkInsertServer(mysql_errors=[0, 300])
+        result = self.client(server).bulk_insert(self.sql, ((i,) for i in xrange(1000)), chunk_size=100, workers=3)
+        self.assertEqual([index for index, _ in result['errors']], [0, 3])
+        self.assertEqual(result['rows'], 800)
+
+    def test_other_error_stops_producer(self):
+        server = BulkInsertServer(type_errors=[100])
+        read = []
+
+        def rows():
+            for i in xrange(10 ** 6):
+                read.append(i)
+                yield (i,)
+        client = self.client(server)
+        self.assertRaises(TypeError, client.bulk_insert, self.sql, rows(), chunk_size=10, workers=2)
+        self.assertLess(len(read), 10 ** 6)
+
+    def test_every_worker_fails(self):
+        server = BulkInsertServer(type_errors=range(0, 10 ** 4, 10))
+        client = self.client(server)
+        self.assertRaises(TypeError, client.bulk_insert, self.sql, ((i,) for i in xrange(10 ** 4)), chunk_size=10,
+                          workers=2)
+
+    def test_rows_error(self):
+        def rows():
+            yield (1,)
+            raise ValueError('bad row')
+        client = self.client(BulkInsertServer())
+        self.assertRaises(ValueError, client.bulk_insert, self.sql, rows(), chunk_size=1)
+
+
+if __name__ == '__main__':
+    unittest.main()
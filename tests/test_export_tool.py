@@ -0,0 +1,112 @@
+# coding: utf-8
+"""
+CsvTool / ParquetTool 导出的文件名和内容: 已有的扩展名不重复添加, 值按 _u 的规则转换,
+write_columns 按最长的列写出, Parquet 以写入的第一行为列名
+python -m unittest discover -s tests -t .
+"""
+
+import os
+import csv
+import gzip
+import shutil
+import datetime
+import tempfile
+import unittest
+import collections
+from utils.export_tool import CsvTool, ParquetTool, open_exporter, pyarrow
+
+
+class ExportTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def path(self, name):
+        return os.path.join(self.dir, name)
+
+
+class FilenameTest(ExportTestCase):
+
+    def test_known_suffix_not_repeated(self):
+        cases = [('x.csv', dict(), 'x.csv'), ('x.csv', dict(compress=True), 'x.csv.gz'),
+                 ('x.csv.gz', dict(compress=True), 'x.csv.gz'), ('x.tsv', dict(delimiter='\t'), 'x.tsv'),
+                 ('x', dict(delimiter='\t', compress=True), 'x.tsv.gz'), ('x.txt', dict(), 'x.txt.csv')]
+        for filename, kwargs, expected in cases:
+            tool = CsvTool(self.path(filename), **kwargs)
+            self.assertEqual(tool._filename(None), self.path(expected))
+        self.assertEqual(CsvTool(self.path('x.csv'))._filename(u'a/b'), self.path(u'x_a_b.csv'))
+
+    def test_parquet_suffix(self):
+        if pyarrow is None:
+            return
+        self.assertEqual(ParquetTool(self.path('x.parquet'))._filename(None), self.path('x.parquet'))
+
+
+class CsvTest(ExportTestCase):
+
+    def read(self, filename, compress=False):
+        with (gzip.open if compress else open)(filename, 'rb') as f:
+            return list(csv.reader(f))
+
+    def test_rows(self):
+        with CsvTool(self.path('x'), compress=True) as tool:
+            sheet = tool.sheet(u'level1')
+            rows = [collections.OrderedDict([('id', 1), ('name', u' 行业 '), ('day', datetime.date(2020, 1, 2))]),
+                    collections.OrderedDict([('id', 2), ('name', None), ('day', None)])]
+            self.assertEqual(sheet.write_iter(rows), 2)
+        self.assertEqual(self.read(self.path(u'x_level1.csv.gz'), compress=True),
+                         [['id', 'name', 'day'], ['1', '行业', '2020-01-02'], ['2', '', '']])
+
+    def test_write_columns(self):
+        tool = open_exporter(self.path('x'), format='tsv')
+        tool.sheet().write_columns([[1, 2, 3], [u'a']], first_col=1, header=[u'x', u'y'])
+        tool.close()
+        rows = [line.rstrip('\n').split('\t') for line in open(self.path('x.tsv'))]
+        self.assertEqual(rows, [['', 'x', 'y'], ['', '1', 'a'], ['', '2', ''], ['', '3', '']])
+
+    def test_row_order(self):
+        with CsvTool(self.path('x')) as tool:
+            sheet = tool.sheet()
+            sheet.write([1], row=2)
+            self.assertRaises(ValueError, sheet.write, [2], row=1)
+        self.assertEqual(self.read(self.path('x.csv')), [[], [], ['1']])
+
+
+class ParquetTest(ExportTestCase):
+
+    def setUp(self):
+        if pyarrow is None:
+            self.skipTest('pyarrow is not installed')
+        super(ParquetTest, self).setUp()
+
+    def read(self, filename):
+        return pyarrow.parquet.read_table(filename)
+
+    def test_row_groups(self):
+        with ParquetTool(self.path('x'), row_group_size=10) as tool:
+            tool.sheet().write_iter(([i, u'n{}'.format(i), None] for i in xrange(25)), header=[u'id', u'name', u'x'])
+        table = self.read(self.path('x.parquet'))
+        self.assertEqual(table.column_names, [u'id', u'name', u'x'])
+        self.assertEqual(pyarrow.parquet.ParquetFile(self.path('x.parquet')).num_row_groups, 3)
+        self.assertEqual(table.to_pydict(), dict(id=range(25), name=[u'n{}'.format(i) for i in xrange(25)],
+                                                 x=[None] * 25))
+        self.assertEqual(table.column(2).type, pyarrow.string())
+
+    def test_first_row_is_header(self):
+        with ParquetTool(self.path('x')) as tool:
+            tool.sheet().write_rows([[u'a', u'b'], [1, datetime.datetime(2020, 1, 2, 3, 4, 5)]])
+        self.assertEqual(self.read(self.path('x.parquet')).to_pydict(), dict(a=[1], b=[u'2020-01-02 03:04:05']))
+
+    def test_header_only(self):
+        with ParquetTool(self.path('x')) as tool:
+            tool.sheet().write_iter([], columns=['id', 'name'])
+        table = self.read(self.path('x.parquet'))
+        self.assertEqual(table.column_names, [u'id', u'name'])
+        self.assertEqual(table.num_rows, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+# coding: utf-8
+"""
+import_industry_data: 逐行读取数据文件, 二级行业和职位按 (一级行业 id, 名称) 去重后用 load_file 写入,
+跳过列数不足或一级行业不存在的行; local_infile 被禁用时按 batch_size 行一条 insert 写入
+python -m unittest discover -s tests -t .
+"""
+
+import os
+import re
+import shutil
+import tempfile
+import unittest
+import MySQLdb
+import import_industry_data
+from import_industry_data import ImportIndustryData
+from utils.mysql_tool import MySqlClient, _split_fields
+from tests.fake_mysql import FakeServer
+
+LINES = ['O2O\tCEO\tIT互联网', '新零售\t产品\tIT互联网', 'O2O\t产品\tIT互联网', '', 'aaaa\t研发\t金融',
+         '银行\taaaa\t金融', 'O2O\tCEO\t金融', '  O2O \t CEO \tIT互联网', '缺少列\t产品', '游戏\t策划\t不存在']
+
+
+class IndustryServer(FakeServer):
+    """一级行业查询返回 industry1, LOAD DATA 按表记录导入的行"""
+
+    def __init__(self):
+        super(IndustryServer, self).__init__(rows=[dict(id=1, industry_name=u'IT互联网'),
+                                                   dict(id=2, industry_name=u'金融')])
+        self.loaded = {}
+
+    def execute(self, sql, args=None):
+        rows = super(IndustryServer, self).execute(sql, args)
+        if sql.startswith('select'):
+            return rows
+        if sql.startswith('load data'):
+            path, delimiter = args
+            with open(path, 'rb') as f:
+                lines = [tuple(_split_fields(line.rstrip('\n'), delimiter)) for line in f]
+        else:
+            width = sql.count('%s') / sql.count('(%s')
+            lines = [tuple(str(v) for v in args[i:i + width]) for i in xrange(0, len(args), width)]
+        self.loaded.setdefault(re.search('`(\\w+)`', sql).group(1), []).extend(lines)
+        return lines
+
+
+class ImportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = IndustryServer().install(self)
+        self.addCleanup(setattr, import_industry_data, 'db_industry', import_industry_data.db_industry)
+        import_industry_data.db_industry = MySqlClient(db='test', local_infile=True)
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+
+    def data_file(self, lines):
+        path = os.path.join(self.dir, 'data')
+        with open(path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        return path
+
+    def test_industry2_dedup(self):
+        result = ImportIndustryData.import_new_industry2(self.data_file(LINES))
+        self.assertEqual(result, dict(industry=4, position=4, skipped=2))
+        self.assertEqual(self.server.loaded['industry_new'], [('2', '1', 'O2O'), ('2', '1', '新零售'),
+                                                              ('2', '2', '银行'), ('2', '2', 'O2O')])
+        self.assertEqual(self.server.loaded['position_new'], [('1', 'CEO'), ('1', '产品'), ('2', '研发'),
+                                                              ('2', 'CEO')])
+        self.assertEqual(len(self.server.executed), 3)
+
+    def test_insert_batches(self):
+        lines = ['行业{}\t职位{}\tIT互联网'.format(i, i % 3) for i in xrange(25)]
+        path = self.data_file(lines)
+        import_industry_data.db_industry = MySqlClient(db='test')
+        result = ImportIndustryData.import_new_industry2(path, batch_size=10)
+        self.assertEqual(result, dict(industry=25, position=3, skipped=0))
+        inserts = [(sql, args) for sql, args in self.server.executed if sql.startswith('insert')]
+        self.assertEqual([len(args) for _, args in inserts], [30, 30, 15, 6])
+        self.assertEqual(self.server.loaded['industry_new'], [('2', '1', '行业{}'.format(i)) for i in xrange(25)])
+
+    def test_local_infile_disabled(self):
+        self.server.errors.append(MySQLdb.OperationalError(1148, 'The used command is not allowed'))
+        self.assertEqual(ImportIndustryData.import_new_industry1(self.data_file(['IT互联网\tx', '金融']),
+                                                                 batch_size=1), 2)
+        self.assertEqual([sql.split()[0] for sql, _ in self.server.executed], ['load', 'insert', 'insert'])
+        self.assertEqual(self.server.loaded['industry_new'], [('IT互联网',), ('金融',)])
+
+    def test_query_failed(self):
+        self.server.errors.append(MySQLdb.OperationalError(1146, "Table 'industry_new' doesn't exist"))
+        self.assertRaises(RuntimeError, ImportIndustryData.import_new_industry2, self.data_file(LINES))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,172 @@
+# coding: utf-8
+"""
+IntervalMerge: add / add_many 合并后的区间和总长度与逐个添加后整体排序合并的结果相同, 首尾相接的区间合并;
+contains / covers / coverage 与逐个区间计算的结果相同;
+merge_intervals 按 key 批量合并的结果与每个 key 一个 IntervalMerge 相同, 没有 numpy 时抛出 ImportError
+python -m unittest discover -s tests -t .
+"""
+
+import random
+import unittest
+from collections import defaultdict
+from utils import base
+from utils.base import IntervalMerge, IntervalUnion, merge_intervals
+
+
+def merge_sorted(pairs):
+    """改为有序列表之前的实现: 每次添加后整体排序, 顺序合并"""
+    intervals = []
+    for start, end in pairs:
+        start, end = (start, end) if start < end else (end, start)
+        intervals.append(dict(st=start, et=end))
+        intervals.sort(key=lambda x: x['st'])
+        tmp = [intervals[0]]
+        for item in intervals:
+            if tmp[-1]['st'] <= item['st'] <= tmp[-1]['et']:
+                tmp[-1]['et'] = max(item['et'], tmp[-1]['et'])
+            else:
+                tmp.append(dict(st=item['st'], et=item['et']))
+        intervals = tmp
+    return intervals
+
+
+def make_pairs(count, seed=0, low=0, high=200, width=20, floats=False):
+    r = random.Random(seed)
+    pairs = []
+    for _ in xrange(count):
+        start = r.uniform(low, high) if floats else r.randint(low, high)
+        end = start + (r.uniform(0, width) if floats else r.randint(0, width))
+        pairs.append((start, end) if r.random() < 0.8 else (end, start))
+    return pairs
+
+
+class IntervalMergeTest(unittest.TestCase):
+
+    def check(self, merge, pairs):
+        expected = merge_sorted(pairs)
+        self.assertEqual(merge.intervals, expected)
+        self.assertAlmostEqual(merge.length, sum(x['et'] - x['st'] for x in expected))
+
+    def test_add_same_as_before(self):
+        for seed in xrange(20):
+            pairs = make_pairs(random.Random(seed).randint(1, 60), seed=seed, floats=seed % 2)
+            merge = IntervalMerge()
+            for i, (start, end) in enumerate(pairs):
+                merge.add(start, end)
+                self.check(merge, pairs[:i + 1])
+
+    def test_add_many_same_as_before(self):
+        for seed in xrange(20):
+            pairs = make_pairs(100, seed=seed, floats=seed % 2)
+            merge = IntervalMerge(pairs[:30])
+            merge.add(*pairs[30])
+            merge.add_many(pairs[31:])
+            merge.add_many([])
+            self.check(merge, pairs)
+
+    def test_touching(self):
+        merge = IntervalMerge([(1, 3), (5, 7)])
+        merge.add(3, 5)
+        self.assertEqual(merge.intervals, [dict(st=1, et=7)])
+        merge.add(9, 9)
+        merge.add(7, 7)
+        self.assertEqual((merge.intervals, merge.length), ([dict(st=1, et=7), dict(st=9, et=9)], 6))
+
+    def test_empty(self):
+        merge = IntervalMerge()
+        self.assertEqual((merge.intervals, merge.length), ([], 0))
+        self.assertFalse(merge.contains(1))
+        self.assertFalse(merge.covers(1, 2))
+        self.assertEqual(merge.coverage(1, 2), 0)
+
+    def test_queries(self):
+        r = random.Random(1)
+        for seed in xrange(10):
+            merge = IntervalMerge(make_pairs(30, seed=seed))
+            intervals = merge.intervals
+            for _ in xrange(100):
+                start, end = r.randint(-10, 230), r.randint(-10, 230)
+                low, high = min(start, end), max(start, end)
+                self.assertEqual(merge.contains(start), any(x['st'] <= start <= x['et'] for x in intervals))
+                self.assertEqual(merge.covers(start, end), any(x['st'] <= low and high <= x['et'] for x in intervals))
+                self.assertEqual(merge.coverage(start, end),
+                                 sum(max(0, min(high, x['et']) - max(low, x['st'])) for x in intervals))
+            merge.add(-5, 0)
+            self.assertEqual(merge.coverage(-10, 0), 5)
+
+
+@unittest.skipIf(base.numpy is None, 'numpy is not installed')
+class MergeIntervalsTest(unittest.TestCase):
+
+    def check(self, keys, starts, ends):
+        union = merge_intervals(keys, starts, ends)
+        merges = defaultdict(IntervalMerge)
+        for key, start, end in zip(keys, starts, ends):
+            merges[key].add(start, end)
+        expected = sorted(merges)
+        self.assertEqual(union.keys.tolist(), expected)
+        for length, key in zip(union.lengths.tolist(), expected):
+            self.assertAlmostEqual(length, merges[key].length)
+        self.assertEqual(zip(union.interval_keys.tolist(), union.starts.tolist(), union.ends.tolist()),
+                         [(k, x['st'], x['et']) for k in expected for x in merges[k].intervals])
+        return union
+
+    def rows(self, count, seed=0, users=20, **kwargs):
+        r = random.Random(seed)
+        pairs = make_pairs(count, seed=seed, **kwargs)
+        return [r.randint(1, users) for _ in pairs], [p[0] for p in pairs], [p[1] for p in pairs]
+
+    def test_doc_example(self):
+        union = self.check([1, 1, 2, 1], [0, 2, 5, 10], [3, 4, 6, 11])
+        self.assertIsInstance(union, IntervalUnion)
+        self.assertEqual(union.lengths.tolist(), [5, 1])
+
+    def test_same_as_interval_merge(self):
+        for seed in xrange(10):
+            self.check(*self.rows(500, seed=seed))
+            self.check(*self.rows(500, seed=seed, floats=True))
+        self.check(*self.rows(100, users=1))
+
+    def test_touching_and_swapped(self):
+        union = self.check(['b', 'a', 'a', 'b', 'a'], [3, 5, 1, 2, 9], [1, 3, 3, 4, 9])
+        self.assertEqual(union.starts.tolist(), [1, 9, 1])
+
+    def test_rank_fallback(self):
+        # 值的范围乘以 key 数超出 int64 时按排序取名次
+        keys, starts, ends = self.rows(200, users=5)
+        self.check(keys, [s * 2 ** 58 for s in starts], [e * 2 ** 58 for e in ends])
+        big = base.numpy.array([10, 1, 4], dtype=base.numpy.uint64) + base.numpy.uint64(2 ** 63)
+        union = merge_intervals([1, 1, 1], big, big + base.numpy.uint64(3))
+        self.assertEqual((union.starts - 2 ** 63).tolist(), [1, 10])
+        self.assertEqual((union.ends - 2 ** 63).tolist(), [7, 13])
+        self.assertEqual(union.lengths.tolist(), [9])
+
+    def test_datetime64(self):
+        numpy = base.numpy
+        keys, starts, ends = self.rows(300, seed=3)
+        epoch = numpy.datetime64('2024-01-01T00:00:00')
+        union = merge_intervals(keys, epoch + numpy.array(starts, dtype='timedelta64[s]'),
+                                epoch + numpy.array(ends, dtype='timedelta64[s]'))
+        expected = self.check(keys, starts, ends)
+        self.assertEqual(union.lengths.astype(int).tolist(), expected.lengths.tolist())
+        self.assertEqual((union.starts - epoch).astype(int).tolist(), expected.starts.tolist())
+
+    def test_empty(self):
+        union = merge_intervals([], [], [])
+        self.assertEqual([len(v) for v in union], [0] * 5)
+
+    def test_length_mismatch(self):
+        self.assertRaises(ValueError, merge_intervals, [1, 2], [0], [1, 2])
+
+
+class WithoutNumpyTest(unittest.TestCase):
+
+    def test_import_error(self):
+        self.addCleanup(setattr, base, 'numpy', base.numpy)
+        base.numpy = None
+        self.assertRaises(ImportError, merge_intervals, [1], [0], [1])
+        self.assertEqual(IntervalMerge([(0, 1), (1, 3)]).length, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
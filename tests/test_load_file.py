@@ -0,0 +1,100 @@
+# coding: utf-8
+"""
+MySqlClient.load_file: 字段按 LOAD DATA 的转义规则写入临时文件, local_infile 被禁用时拆回字段改用 insert,
+两条路径导入的数据相同; 分隔符只支持单个字符
+python -m unittest discover -s tests -t .
+"""
+
+import os
+import itertools
+import unittest
+import MySQLdb
+from utils.mysql_tool import MySqlClient, _escape_field, _split_fields
+from tests.fake_mysql import FakeServer
+
+ROWS = [(1, u'行业', None), (2, 'a\tb', ''), (3, 'back\\slash\\N', '\\N'), (4, 'line\nbreak\r', 'x,y'),
+        (5, 1.5, '\0')]
+
+
+def expected(rows, charset='utf8'):
+    """导入后各字段的字符串值"""
+    return [tuple(None if v is None else v.encode(charset) if isinstance(v, unicode) else str(v) for v in row)
+            for row in rows]
+
+
+class LoadServer(FakeServer):
+    """执行 LOAD DATA 时按 MySQL 的规则读取文件, 记录导入的行"""
+
+    def __init__(self):
+        super(LoadServer, self).__init__()
+        self.loaded = []
+
+    def execute(self, sql, args=None):
+        rows = super(LoadServer, self).execute(sql, args)
+        if not sql.startswith('load data'):
+            return rows
+        path, delimiter = args
+        with open(path, 'rb') as f:
+            self.loaded = [tuple(_split_fields(line.rstrip('\n'), delimiter)) for line in f]
+        return self.loaded
+
+
+class EscapeTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        for delimiter in ('\t', ',', '|'):
+            for row in expected(ROWS) + [('',), (None,), ('\\',), ('a' + delimiter,)]:
+                line = delimiter.join(_escape_field(v, delimiter, 'utf8') for v in row)
+                self.assertNotIn('\n', line)
+                self.assertEqual(tuple(_split_fields(line, delimiter)), row)
+
+    def test_null_only_whole_field(self):
+        self.assertEqual(_split_fields('\\N\t\\Nx\tx\\N', '\t'), [None, 'Nx', 'xN'])
+
+
+class LoadFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = LoadServer().install(self)
+
+    def insert_params(self):
+        """回退为 insert 时写入的行"""
+        params = list(itertools.chain.from_iterable(args for sql, args in self.server.executed
+                                                    if sql.startswith('insert')))
+        return [tuple(params[i:i + 3]) for i in xrange(0, len(params), 3)]
+
+    def test_load_data(self):
+        client = MySqlClient(db='test', local_infile=True)
+        self.assertEqual(client.load_file('t', ROWS, ['id', 'name', 'note'], chunk_size=2), len(ROWS))
+        sql, (path, delimiter) = self.server.executed[0]
+        self.assertIn('load data local infile', sql)
+        self.assertEqual(self.server.loaded, expected(ROWS))
+        self.assertFalse(os.path.exists(path))
+
+    def test_insert_when_local_infile_disabled(self):
+        client = MySqlClient(db='test', local_infile=True)
+        self.server.errors.append(MySQLdb.OperationalError(1148, 'The used command is not allowed'))
+        self.assertEqual(client.load_file('t', ROWS, ['id', 'name', 'note'], delimiter=',', chunk_size=2), len(ROWS))
+        self.assertEqual(len(self.server.executed), 4)
+        self.assertEqual(self.insert_params(), expected(ROWS))
+
+    def test_insert_without_local_infile(self):
+        client = MySqlClient(db='test')
+        self.assertEqual(client.load_file('t', ROWS, ['id', 'name', 'note']), len(ROWS))
+        self.assertEqual(self.insert_params(), expected(ROWS))
+
+    def test_other_error(self):
+        client = MySqlClient(db='test', local_infile=True)
+        self.server.errors.append(MySQLdb.OperationalError(1062, 'Duplicate entry'))
+        self.assertRaises(MySQLdb.OperationalError, client.load_file, 't', ROWS, ['id', 'name', 'note'])
+        self.assertEqual(len(self.server.executed), 1)
+
+    def test_delimiter(self):
+        client = MySqlClient(db='test', local_infile=True)
+        for delimiter in ('||', '', '\\', '\n'):
+            self.assertRaises(ValueError, client.load_file, 't', ROWS, ['id', 'name', 'note'], delimiter=delimiter)
+        self.assertEqual(self.server.executed, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+# coding: utf-8
+"""
+AsyncMySqlClient: 未读完的迭代器占用连接时其他语句仍能执行, 迭代器数受限, 借用连接超时时返回错误而不是一直等待
+用替身代替 MySQLdb.connect, 不需要 MySQL 服务
+python -m unittest discover -s tests -t .
+"""
+
+import unittest
+import MySQLdb
+from utils.mysql_pool import MySqlPool
+from utils.mysql_async import AsyncMySqlClient
+from tests.fake_mysql import FakeServer
+
+ROWS = [dict(id=i) for i in range(5)]
+
+
+class AsyncClientTest(unittest.TestCase):
+
+    def setUp(self):
+        FakeServer(rows=ROWS).install(self)
+        self.clients = []
+
+    def tearDown(self):
+        for client in self.clients:
+            client.close()
+
+    def client(self, **kwargs):
+        client = AsyncMySqlClient(db='test', **kwargs)
+        self.clients.append(client)
+        return client
+
+    def test_queries_while_iterators_open(self):
+        client = self.client(max_concurrency=2, max_iterators=2, acquire_timeout=5)
+        iterators = [client.iter_query('select id from t', chunk_size=2) for _ in range(2)]
+        for rows in iterators:
+            self.assertEqual(rows.next().result(timeout=5), ROWS[:2])
+        futures = [client.query('select id from t') for _ in range(10)]
+        for future in futures:
+            self.assertEqual(future.result(timeout=5), ROWS)
+        for rows in iterators:
+            rows.close().result(timeout=5)
+
+    def test_max_iterators(self):
+        client = self.client(max_concurrency=2, max_iterators=1, acquire_timeout=5)
+        rows = client.iter_query('select id from t', chunk_size=2)
+        self.assertRaises(MySQLdb.MySQLError, client.iter_query, 'select id from t')
+        chunks = []
+        while 1:
+            chunk = rows.next().result(timeout=5)
+            if not chunk:
+                break
+            chunks.extend(chunk)
+        self.assertEqual(chunks, ROWS)
+        rows = client.iter_query('select id from t')
+        rows.close().result(timeout=5)
+        client.iter_query('select id from t').close().result(timeout=5)
+
+    def test_acquire_timeout(self):
+        pool = MySqlPool(db='test', max_size=2)
+        client = self.client(pool=pool, max_iterators=1, acquire_timeout=0.1)
+        held = [pool.acquire(), pool.acquire()]
+        self.assertRaises(MySQLdb.MySQLError, client.execute('update t set id = 1').result, 5)
+        # query 同 MySqlClient, 出错时记录日志并返回 None
+        self.assertIsNone(client.query('select id from t').result(timeout=5))
+        for conn in held:
+            pool.release(conn)
+        self.assertEqual(client.query('select id from t').result(timeout=5), ROWS)
+        pool.close()
+
+    def test_pool_too_small(self):
+        pool = MySqlPool(db='test', max_size=2)
+        self.assertRaises(ValueError, AsyncMySqlClient, pool=pool, max_iterators=2)
+        pool.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
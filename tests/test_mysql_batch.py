@@ -0,0 +1,84 @@
+# coding: utf-8
+"""
+MySqlClient.batch: 每 max_statements 条或超过 max_ms 毫秒提交一次, 正常退出时提交剩余语句,
+出错时只回滚尚未提交的语句; 提交后使查询缓存中涉及的表失效
+python -m unittest discover -s tests -t .
+"""
+
+import time
+import unittest
+import MySQLdb
+from utils.query_cache import QueryCache
+from utils.mysql_tool import MySqlClient
+from tests.fake_mysql import FakeServer
+
+
+class BatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeServer(rows=[dict(id=1)]).install(self)
+        self.client = MySqlClient(db='test')
+
+    def test_commit_every_max_statements(self):
+        with self.client.batch(max_statements=3, max_ms=None) as batch:
+            for i in range(7):
+                batch.execute('insert into t (id) values (%s)', i)
+            self.assertEqual((self.server.commits, batch.pending), (2, 1))
+        self.assertEqual(self.server.commits, 3)
+        self.assertEqual((batch.statements, batch.commits, batch.rolled_back), (7, 3, 0))
+        self.assertEqual([args for _, args in self.server.executed], [(i,) for i in range(7)])
+
+    def test_commit_after_max_ms(self):
+        with self.client.batch(max_statements=100, max_ms=20) as batch:
+            batch.execute('insert into t (id) values (%s)', 1)
+            time.sleep(0.03)
+            batch.insert_many('insert into t (id) values (%s)', (2,), (3,))
+            self.assertEqual((self.server.commits, batch.pending), (1, 0))
+            batch.execute('insert into t (id) values (%s)', 4)
+        self.assertEqual((batch.statements, batch.commits), (3, 2))
+        self.assertEqual(self.server.inserted, [(2,), (3,)])
+
+    def test_rollback_pending_on_error(self):
+        with self.assertRaises(MySQLdb.OperationalError):
+            with self.client.batch(max_statements=2, max_ms=None) as batch:
+                for i in range(3):
+                    batch.execute('insert into t (id) values (%s)', i)
+                self.server.errors.append(MySQLdb.OperationalError(1213, 'Deadlock found'))
+                batch.execute('insert into t (id) values (%s)', 3)
+        self.assertEqual((self.server.commits, self.server.rollbacks), (1, 1))
+        self.assertEqual((batch.statements, batch.rolled_back, batch.pending), (2, 1, 0))
+
+    def test_rollback_on_caller_error(self):
+        with self.assertRaises(ValueError):
+            with self.client.batch() as batch:
+                batch.execute('insert into t (id) values (%s)', 1)
+                raise ValueError('bad row')
+        self.assertEqual((self.server.commits, self.server.rollbacks, batch.rolled_back), (0, 1, 1))
+
+    def test_explicit_rollback(self):
+        with self.client.batch(max_statements=100, max_ms=None) as batch:
+            batch.execute('insert into t (id) values (%s)', 1)
+            batch.rollback()
+            batch.execute('insert into t (id) values (%s)', 2)
+        self.assertEqual((self.server.commits, self.server.rollbacks), (1, 1))
+        self.assertEqual((batch.statements, batch.rolled_back), (1, 1))
+
+    def test_empty_batch(self):
+        with self.client.batch():
+            pass
+        self.assertEqual((self.server.commits, self.server.rollbacks), (0, 0))
+
+    def test_invalidate_cache_on_commit(self):
+        client = MySqlClient(db='test', cache=QueryCache())
+        self.assertEqual(client.query('select id from t'), [dict(id=1)])
+        with client.batch(max_statements=2, max_ms=None) as batch:
+            batch.execute('update t set id = %s', 2)
+            self.assertEqual(client.cache.stats()['hits'], 0)
+            client.query('select id from t')
+            self.assertEqual(client.cache.stats()['hits'], 1)
+        client.query('select id from t')
+        self.assertEqual(client.cache.stats()['hits'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
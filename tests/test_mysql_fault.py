@@ -0,0 +1,203 @@
+# coding: utf-8
+"""
+MySqlClient 连接重试、熔断和 ping 的故障注入测试, 用可按需失败的替身代替 MySQLdb.connect, 不需要 MySQL 服务
+python -m unittest discover -s tests -t .
+"""
+
+import time
+import unittest
+import MySQLdb
+from utils import mysql_tool, retrying
+from utils.circuit_breaker import CircuitBreaker
+from utils.mysql_tool import MySqlClient, CircuitOpenError
+from tests.fake_mysql import FakeServer
+
+
+class FakeTime(object):
+    """替换 retrying 中的 time 模块, 记录每次重试前等待的秒数而不真正等待"""
+
+    def __init__(self):
+        self.sleeps = []
+
+    def time(self):
+        return time.time()
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+
+
+class FaultTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeServer().install(self)
+        self.clock = FakeTime()
+        self._time, retrying.time = retrying.time, self.clock
+
+    def tearDown(self):
+        retrying.time = self._time
+
+    def client(self, **kwargs):
+        kwargs.setdefault('retry_jitter_ms', 0)
+        return MySqlClient(db='test', **kwargs)
+
+    def go_down(self, client):
+        """服务端宕机, 客户端的连接已断开"""
+        self.server.down = True
+        client._discard()
+        self.server.connects = 0
+
+
+class BackoffTest(FaultTestCase):
+
+    def test_exponential_backoff(self):
+        client = self.client(max_retry=4, retry_wait_ms=100, breaker=CircuitBreaker(failure_threshold=100))
+        self.go_down(client)
+        self.assertRaises(MySQLdb.OperationalError, client.connect)
+        self.assertEqual(self.server.connects, 5)
+        self.assertEqual(self.clock.sleeps, [0.1, 0.2, 0.4, 0.8])
+
+    def test_backoff_capped(self):
+        client = self.client(max_retry=5, retry_wait_ms=100, retry_wait_max_ms=300,
+                             breaker=CircuitBreaker(failure_threshold=100))
+        self.go_down(client)
+        self.assertRaises(MySQLdb.OperationalError, client.connect)
+        self.assertEqual(self.clock.sleeps, [0.1, 0.2, 0.3, 0.3, 0.3])
+
+    def test_jitter(self):
+        client = self.client(max_retry=3, retry_wait_ms=100, retry_jitter_ms=50,
+                             breaker=CircuitBreaker(failure_threshold=100))
+        self.go_down(client)
+        self.assertRaises(MySQLdb.OperationalError, client.connect)
+        for sleep, base in zip(self.clock.sleeps, [0.1, 0.2, 0.4]):
+            self.assertTrue(base <= sleep <= base + 0.05, (sleep, base))
+
+    def test_recovers_after_retry(self):
+        client = self.client(max_retry=3, retry_wait_ms=100, breaker=CircuitBreaker(failure_threshold=100))
+        self.go_down(client)
+        connect = self.server.connect
+
+        def flaky(**kwargs):
+            if self.server.connects == 2:
+                self.server.down = False
+            return connect(**kwargs)
+        mysql_tool.MySQLdb.connect = flaky
+        client.connect()
+        self.assertEqual(self.server.connects, 3)
+        self.assertEqual(len(self.clock.sleeps), 2)
+        self.assertEqual(client.breaker.state, CircuitBreaker.CLOSED)
+
+
+class BreakerTest(FaultTestCase):
+
+    def test_opens_after_threshold(self):
+        client = self.client(max_retry=0, retry_wait_ms=1, breaker=CircuitBreaker(failure_threshold=3))
+        self.go_down(client)
+        self.assertRaises(CircuitOpenError, client.connect)
+        self.assertEqual(self.server.connects, 3)
+        self.assertEqual(client.breaker.state, CircuitBreaker.OPEN)
+
+    def test_fail_fast_while_open(self):
+        client = self.client(max_retry=0, retry_wait_ms=1, breaker=CircuitBreaker(failure_threshold=3))
+        self.go_down(client)
+        self.assertRaises(CircuitOpenError, client.connect)
+        self.server.connects, self.clock.sleeps = 0, []
+        self.server.down = False
+        for _ in range(3):
+            self.assertRaises(CircuitOpenError, client.connect)
+        self.assertEqual(self.server.connects, 0)
+        self.assertEqual(self.clock.sleeps, [])
+
+    def test_clone_shares_breaker(self):
+        client = self.client(max_retry=0, retry_wait_ms=1, breaker=CircuitBreaker(failure_threshold=2))
+        self.go_down(client)
+        self.assertRaises(CircuitOpenError, client.connect)
+        self.assertRaises(CircuitOpenError, client.clone)
+        self.assertEqual(self.server.connects, 2)
+
+    def test_half_open_probe_success(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+        client = self.client(max_retry=0, retry_wait_ms=1, breaker=breaker)
+        self.go_down(client)
+        self.assertRaises(CircuitOpenError, client.connect)
+        self.server.down = False
+        self.server.connects = 0
+        breaker._opened_at -= 31
+        client.connect()
+        self.assertEqual(self.server.connects, 1)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_half_open_probe_failure(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+        client = self.client(max_retry=0, retry_wait_ms=1, breaker=breaker)
+        self.go_down(client)
+        self.assertRaises(CircuitOpenError, client.connect)
+        self.server.connects = 0
+        breaker._opened_at -= 31
+        self.assertRaises(CircuitOpenError, client.connect)
+        self.assertEqual(self.server.connects, 1)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+
+class PingTest(FaultTestCase):
+
+    def test_no_ping_within_interval(self):
+        client = self.client(ping_interval=30)
+        for _ in range(5):
+            client.connect()
+        self.assertEqual(self.server.pings, 0)
+        self.assertEqual(self.server.connects, 1)
+
+    def test_ping_after_interval(self):
+        client = self.client(ping_interval=30)
+        client._last_used -= 31
+        client.connect()
+        self.assertEqual(self.server.pings, 1)
+        client.connect()
+        self.assertEqual(self.server.pings, 1)
+        self.assertEqual(self.server.connects, 1)
+
+    def test_reconnect_when_ping_fails(self):
+        client = self.client(ping_interval=30, max_retry=2, retry_wait_ms=1)
+        conn = client._conn
+        client._last_used -= 31
+        self.server.down = True
+        connect = self.server.connect
+
+        def recover(**kwargs):
+            self.server.down = False
+            return connect(**kwargs)
+        mysql_tool.MySQLdb.connect = recover
+        client.connect()
+        self.assertEqual(self.server.pings, 1)
+        self.assertTrue(conn.closed)
+        self.assertIsNot(client._conn, conn)
+        self.assertEqual(self.server.connects, 2)
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def test_state_transitions(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+        self.assertTrue(breaker.allow())
+        breaker.failure()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        breaker.failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow())
+        breaker._opened_at -= 31
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertFalse(breaker.allow())
+        breaker.success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_success_resets_failures(self):
+        breaker = CircuitBreaker(failure_threshold=2)
+        breaker.failure()
+        breaker.success()
+        breaker.failure()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+
+if __name__ == '__main__':
+    unittest.main()
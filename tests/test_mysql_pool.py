@@ -0,0 +1,152 @@
+# coding: utf-8
+"""
+MySqlPool 借出、归还和后台检查: 连接数不超过 max_size, 连接已断开时丢弃, 锁等待超时、死锁等错误回滚后归还,
+check() 关闭空闲过久的连接、ping 空闲连接并补足 min_size
+python -m unittest discover -s tests -t .
+"""
+
+import time
+import threading
+import unittest
+import MySQLdb
+from utils.mysql_pool import MySqlPool
+from tests.fake_mysql import FakeServer
+
+
+class PoolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeServer().install(self)
+
+    def pool(self, **kwargs):
+        kwargs.setdefault('check_interval', 3600)
+        pool = MySqlPool(db='test', **kwargs)
+        self.addCleanup(pool.close)
+        return pool
+
+    @staticmethod
+    def age(pool, seconds):
+        """空闲连接的归还时间提前 seconds 秒"""
+        pool._idle = type(pool._idle)((conn, last_used - seconds) for conn, last_used in pool._idle)
+
+
+class AcquireTest(PoolTestCase):
+
+    def test_reuse_idle(self):
+        pool = self.pool(min_size=1, max_size=2)
+        self.assertEqual(self.server.connects, 1)
+        conn = pool.acquire()
+        pool.release(conn)
+        self.assertIs(pool.acquire(), conn)
+        self.assertEqual(self.server.connects, 1)
+        stats = pool.stats()
+        self.assertEqual((stats['size'], stats['idle'], stats['in_use'], stats['acquired']), (1, 0, 1, 2))
+
+    def test_timeout(self):
+        pool = self.pool(min_size=0, max_size=2)
+        held = [pool.acquire(), pool.acquire()]
+        start = time.time()
+        self.assertRaises(MySQLdb.MySQLError, pool.acquire, 0.05)
+        self.assertGreaterEqual(time.time() - start, 0.05)
+        self.assertEqual(pool.stats()['timeouts'], 1)
+        self.assertEqual(self.server.connects, 2)
+        for conn in held:
+            pool.release(conn)
+
+    def test_wait_for_release(self):
+        pool = self.pool(min_size=0, max_size=1)
+        conn = pool.acquire()
+        timer = threading.Timer(0.05, pool.release, args=(conn,))
+        timer.start()
+        self.assertIs(pool.acquire(5), conn)
+        timer.join()
+        self.assertEqual(pool.stats()['waits'], 1)
+
+    def test_connect_timeout(self):
+        self.pool(connect_timeout=3)
+        self.assertEqual(self.server.kwargs['connect_timeout'], 3)
+        self.pool(connect_timeout=None)
+        self.assertNotIn('connect_timeout', self.server.kwargs)
+
+    def test_closed(self):
+        pool = self.pool()
+        pool.close()
+        self.assertRaises(MySQLdb.MySQLError, pool.acquire)
+
+
+class ConnectionTest(PoolTestCase):
+
+    def test_discard_lost_connection(self):
+        pool = self.pool(min_size=1, max_size=2)
+        for code in (2006, 2013):
+            error = MySQLdb.OperationalError(code, 'Lost connection to MySQL server')
+            with self.assertRaises(MySQLdb.OperationalError):
+                with pool.connection():
+                    raise error
+        stats = pool.stats()
+        self.assertEqual((stats['size'], stats['discarded']), (0, 2))
+        self.assertEqual(self.server.rollbacks, 0)
+
+    def test_keep_after_lock_errors(self):
+        pool = self.pool(min_size=1, max_size=2)
+        conn = pool.acquire()
+        pool.release(conn)
+        for error in (MySQLdb.OperationalError(1205, 'Lock wait timeout exceeded'),
+                      MySQLdb.OperationalError(1213, 'Deadlock found'), ValueError('bad row')):
+            with self.assertRaises(type(error)):
+                with pool.connection():
+                    raise error
+            self.assertIs(pool.acquire(), conn)
+            pool.release(conn)
+        self.assertEqual(self.server.rollbacks, 3)
+        self.assertEqual(pool.stats()['discarded'], 0)
+
+    def test_discard_when_rollback_fails(self):
+        pool = self.pool(min_size=1, max_size=2)
+        with self.assertRaises(MySQLdb.OperationalError) as context:
+            with pool.connection():
+                self.server.down = True
+                raise MySQLdb.OperationalError(1205, 'Lock wait timeout exceeded')
+        self.assertEqual(context.exception.args[0], 2006)
+        self.assertEqual(pool.stats()['size'], 0)
+
+
+class CheckTest(PoolTestCase):
+
+    def test_evict_idle(self):
+        pool = self.pool(min_size=1, max_size=3, idle_timeout=300, check_interval=3600)
+        held = [pool.acquire() for _ in range(3)]
+        for conn in held:
+            pool.release(conn)
+        self.age(pool, 301)
+        pool.check()
+        stats = pool.stats()
+        self.assertEqual((stats['size'], stats['idle'], stats['evicted']), (1, 1, 2))
+        self.assertEqual(sum(conn.closed for conn in held), 2)
+
+    def test_ping_stale(self):
+        pool = self.pool(min_size=2, max_size=3, idle_timeout=300, check_interval=30)
+        self.age(pool, 10)
+        pool.check()
+        self.assertEqual(self.server.pings, 0)
+        self.age(pool, 31)
+        pool.check()
+        self.assertEqual(self.server.pings, 2)
+        self.assertEqual(pool.stats()['idle'], 2)
+
+    def test_failed_ping_refills(self):
+        pool = self.pool(min_size=2, max_size=3, check_interval=30)
+        self.age(pool, 31)
+        self.server.down = True
+        pool.check()
+        stats = pool.stats()
+        self.assertEqual((stats['size'], stats['check_failed']), (0, 2))
+        self.server.down = False
+        pool.check()
+        self.assertEqual(pool.stats()['idle'], 2)
+        # 2 个初始连接, 服务宕机时补足失败 1 次, 恢复后补足 2 个
+        self.assertEqual(self.server.connects, 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+# coding: utf-8
+"""
+QueryStats: 语句指纹聚合同类语句, 延迟直方图和百分位, 慢查询日志及 EXPLAIN, 与 MySqlClient 的集成
+python -m unittest discover -s tests -t .
+"""
+
+import json
+import unittest
+import MySQLdb
+from utils.mysql_stats import QueryStats, fingerprint, LATENCY_BUCKETS_MS
+from utils.mysql_tool import MySqlClient
+from tests.fake_mysql import FakeServer
+
+
+class FingerprintTest(unittest.TestCase):
+
+    def test_literals(self):
+        cases = [
+            ("select * from t where id = 1 and name = 'a''b'", 'select * from t where id = ? and name = ??'),
+            ('SELECT *\n  FROM t WHERE id = %s', 'select * from t where id = ?'),
+            ('select * from t where x = -1.5e3 and s = "q\\"x"', 'select * from t where x = ? and s = ?'),
+            ('select * from t where id in (1, 2, 3)', 'select * from t where id in (?+)'),
+            ('select * from t where id in (%s,%s)', 'select * from t where id in (?+)'),
+            ('select * from t2 where `col1` = 1', 'select * from t2 where `col1` = ?'),
+        ]
+        for sql, expected in cases:
+            self.assertEqual(fingerprint(sql), expected)
+
+    def test_same_statement(self):
+        self.assertEqual(fingerprint("select * from t where id in (1, 2) and name = 'x'"),
+                         fingerprint("select  * from t where id in (3,4,5) and name = 'yy'"))
+
+
+class RecordTest(unittest.TestCase):
+
+    def test_aggregate(self):
+        stats = QueryStats(slow_ms=None)
+        for i in range(10):
+            stats.record('query', 'select * from t where id = {}'.format(i), (), 0.001 * (i + 1), rows=i)
+        stats.record('execute', 'update t set a = 1', (), 0.5, rows=-1, error=True)
+        statements = stats.snapshot()['statements']
+        self.assertEqual([s['fingerprint'] for s in statements], ['update t set a = ?', 'select * from t where id = ?'])
+        select = statements[1]
+        self.assertEqual((select['count'], select['rows'], select['errors'], select['kinds']),
+                         (10, 45, 0, {'query': 10}))
+        self.assertAlmostEqual(select['total_ms'], 55)
+        self.assertAlmostEqual(select['max_ms'], 10)
+        self.assertEqual(select['sample'], 'select * from t where id = 0')
+        self.assertEqual((statements[0]['errors'], statements[0]['rows']), (1, 0))
+        self.assertEqual(len(stats.snapshot(top=1)['statements']), 1)
+
+    def test_histogram(self):
+        stats = QueryStats(slow_ms=None)
+        for ms in [0.5, 1, 1.5, 3, 7, 7, 7, 40, 900, 20000]:
+            stats.record('query', 'select 1', (), ms / 1000.0)
+        item = stats.snapshot()['statements'][0]
+        histogram = dict(item['histogram'])
+        self.assertEqual([b for b, _ in item['histogram']], list(LATENCY_BUCKETS_MS[:-1]) + ['inf'])
+        self.assertEqual((histogram[1], histogram[2], histogram[5], histogram[10], histogram[50], histogram[1000],
+                          histogram['inf']), (2, 1, 1, 3, 1, 1, 1))
+        self.assertEqual(sum(histogram.values()), 10)
+        self.assertEqual((item['p50_ms'], item['p95_ms']), (10, 20000))
+        self.assertEqual(QueryStats().snapshot()['statements'], [])
+
+    def test_max_statements(self):
+        stats = QueryStats(slow_ms=None, max_statements=2)
+        for table in ('a', 'b', 'c', 'd'):
+            stats.record('query', 'select * from {}'.format(table), (), 0.001)
+        stats.record('query', 'select * from a', (), 0.001)
+        counts = dict((s['fingerprint'], s['count']) for s in stats.snapshot()['statements'])
+        self.assertEqual(counts, {'select * from a': 2, 'select * from b': 1, 'other': 2})
+
+    def test_measure_bytes(self):
+        stats = QueryStats(slow_ms=None, measure_bytes=True)
+        stats.record('query', 'select * from t where a = %s', ('abc', None, 1), 0.001, rows=1,
+                     result=[dict(id=1, name='xyz')])
+        item = stats.snapshot()['statements'][0]
+        self.assertEqual((item['bytes_sent'], item['bytes_received']), (28 + 3 + 8, 8 + 3))
+
+    def test_slow_log(self):
+        stats = QueryStats(slow_ms=100, slow_log_size=2)
+        stats.record('query', 'select 1', (), 0.05)
+        for i in range(3):
+            stats.record('query', 'select {}'.format(i + 2), (i,), 0.2, rows=i)
+        slow = stats.snapshot()['slow_queries']
+        self.assertEqual([item['sql'] for item in slow], ['select 3', 'select 4'])
+        self.assertEqual((slow[0]['args'], slow[0]['rows'], slow[0]['explain']), ((1,), 1, None))
+        self.assertAlmostEqual(slow[0]['ms'], 200)
+        json.loads(stats.to_json())
+        stats.reset()
+        self.assertEqual(stats.snapshot()['slow_queries'], [])
+        self.assertEqual(stats.snapshot()['statements'], [])
+
+
+class ClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeServer(rows=[dict(id=1), dict(id=2)]).install(self)
+        self.stats = QueryStats(slow_ms=0)
+        self.client = MySqlClient(db='test', instrument=self.stats)
+
+    def test_client_records(self):
+        self.client.query('select id from t where id > %s', 0)
+        self.server.errors.append(MySQLdb.OperationalError(1205, 'Lock wait timeout exceeded'))
+        self.assertRaises(MySQLdb.OperationalError, self.client.execute, 'update t set id = %s', 1)
+        statements = dict((s['fingerprint'], s) for s in self.stats.snapshot()['statements'])
+        select = statements['select id from t where id > ?']
+        self.assertEqual((select['kinds'], select['rows'], select['errors']), ({'query': 1}, 2, 0))
+        self.assertEqual(statements['update t set id = ?']['errors'], 1)
+
+    def test_explain(self):
+        self.client.query('select id from t where id > %s', 0)
+        self.client.execute('update t set id = %s', 1)
+        self.server.rows = [dict(id=1, select_type='SIMPLE', key=None)]
+        slow = self.stats.explain(self.client)
+        self.assertEqual([item['explain'] for item in slow], [self.server.rows, None])
+        self.assertEqual(self.server.executed[-1], ('explain select id from t where id > %s', (0,)))
+        self.stats.explain(self.client)
+        self.assertEqual(len(self.server.executed), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
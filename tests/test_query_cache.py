@@ -0,0 +1,140 @@
+# coding: utf-8
+"""
+QueryCache 的磁盘层、读穿透期间的写入和结果复制
+python -m unittest discover -s tests -t .
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from utils.query_cache import QueryCache
+from utils.mysql_tool import MySqlClient
+from tests.fake_mysql import FakeServer
+
+
+class QueryCacheDiskTest(unittest.TestCase):
+
+    def setUp(self):
+        self.parent = tempfile.mkdtemp()
+        self.other = os.path.join(self.parent, 'other.txt')
+        with open(self.other, 'w') as f:
+            f.write('keep')
+
+    def tearDown(self):
+        shutil.rmtree(self.parent)
+
+    def test_keeps_existing_files(self):
+        cache = QueryCache(disk_path=self.parent)
+        self.assertTrue(os.path.exists(self.other))
+        self.assertEqual(os.path.dirname(cache.disk_path), self.parent)
+        cache.close()
+        self.assertTrue(os.path.exists(self.other))
+        self.assertEqual(os.listdir(self.parent), ['other.txt'])
+
+    def test_instances_use_own_directories(self):
+        first, second = QueryCache(disk_path=self.parent), QueryCache(disk_path=self.parent)
+        self.assertNotEqual(first.disk_path, second.disk_path)
+        first.set('query', 'select * from user', (), [{'id': 1}])
+        second.close()
+        self.assertEqual(len(os.listdir(first.disk_path)), 1)
+        first.close()
+
+    def test_disk_hit_and_invalidate(self):
+        cache = QueryCache(maxsize=1, disk_path=self.parent)
+        cache.set('query', 'select * from user', (), [{'id': 1}])
+        cache.set('query', 'select * from orders', (), [{'id': 2}])
+        self.assertEqual(cache.get('query', 'select * from user', ()), (True, [{'id': 1}]))
+        self.assertEqual(cache.stats()['disk_hits'], 1)
+        cache.invalidate('update user set name = 1')
+        self.assertEqual(cache.get('query', 'select * from user', ()), (False, None))
+        self.assertEqual(cache.get('query', 'select * from orders', ()), (True, [{'id': 2}]))
+        cache.clear()
+        self.assertEqual(os.listdir(cache.disk_path), [])
+        cache.close()
+
+    def test_creates_missing_parent(self):
+        cache = QueryCache(disk_path=os.path.join(self.parent, 'a', 'b'))
+        self.assertTrue(os.path.isdir(cache.disk_path))
+        cache.close()
+        self.assertTrue(os.path.isdir(os.path.join(self.parent, 'a', 'b')))
+
+
+class WriteDuringReadServer(FakeServer):
+    """执行查询时模拟另一个线程写入同一张表"""
+
+    def __init__(self, rows):
+        super(WriteDuringReadServer, self).__init__(rows=rows)
+        self.on_select = None
+
+    def execute(self, sql, args=None):
+        rows = super(WriteDuringReadServer, self).execute(sql, args)
+        if sql.startswith('select') and self.on_select is not None:
+            self.on_select()
+        return rows
+
+
+class GenerationTest(unittest.TestCase):
+
+    def test_stale_set_skipped(self):
+        cache = QueryCache()
+        generation = cache.generation('select * from user')
+        cache.invalidate('update user set name = 1')
+        cache.set('query', 'select * from user', (), [{'id': 1}], generation)
+        self.assertEqual(cache.get('query', 'select * from user', ()), (False, None))
+        self.assertEqual(cache.stats()['stale'], 1)
+
+    def test_other_table_write(self):
+        cache = QueryCache()
+        generation = cache.generation('select * from user')
+        cache.invalidate('update orders set status = 1')
+        cache.set('query', 'select * from user', (), [{'id': 1}], generation)
+        self.assertEqual(cache.get('query', 'select * from user', ()), (True, [{'id': 1}]))
+
+    def test_clear_during_read(self):
+        cache = QueryCache()
+        generation = cache.generation('select * from user')
+        cache.clear()
+        cache.set('query', 'select * from user', (), [{'id': 1}], generation)
+        self.assertEqual(cache.get('query', 'select * from user', ()), (False, None))
+
+    def test_client_write_during_read(self):
+        server = WriteDuringReadServer(rows=[dict(id=1)]).install(self)
+        client = MySqlClient(db='test', cache=QueryCache())
+        server.on_select = lambda: client.cache.invalidate('update user set name = 1')
+        self.assertEqual(client.query('select * from user'), [dict(id=1)])
+        server.on_select = None
+        server.rows = [dict(id=2)]
+        self.assertEqual(client.query('select * from user'), [dict(id=2)])
+        self.assertEqual(client.query('select * from user'), [dict(id=2)])
+        self.assertEqual(len([sql for sql, _ in server.executed if sql.startswith('select')]), 2)
+
+
+class CopyTest(unittest.TestCase):
+
+    def test_results_are_copies(self):
+        cache = QueryCache()
+        rows = [{'id': 1}]
+        cache.set('query', 'select * from user', (), rows)
+        rows[0]['id'] = 2
+        rows.append({'id': 3})
+        hit, cached = cache.get('query', 'select * from user', ())
+        self.assertEqual(cached, [{'id': 1}])
+        cached[0]['id'] = 4
+        cached.append({'id': 5})
+        self.assertEqual(cache.get('query', 'select * from user', ()), (True, [{'id': 1}]))
+
+    def test_single_row(self):
+        cache = QueryCache()
+        cache.set('first', 'select * from user', (1,), {'id': 1})
+        cache.get('first', 'select * from user', (1,))[1]['id'] = 2
+        self.assertEqual(cache.get('first', 'select * from user', (1,)), (True, {'id': 1}))
+
+    def test_unhashable_params(self):
+        cache = QueryCache()
+        self.assertEqual(cache.set('query', 'select * from user', ([1],), [{'id': 1}]), [{'id': 1}])
+        self.assertEqual(cache.get('query', 'select * from user', ([1],)), (False, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
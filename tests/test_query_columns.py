@@ -0,0 +1,62 @@
+# coding: utf-8
+"""
+MySqlClient.query_columns 按列返回结果, 结果为空时仍按 description 返回所有字段
+用替身代替 MySQLdb.connect, 不需要 MySQL 服务
+python -m unittest discover -s tests -t .
+"""
+
+import unittest
+from MySQLdb.constants import FIELD_TYPE
+from utils import mysql_tool
+from utils.mysql_tool import MySqlClient
+from tests.fake_mysql import FakeServer
+
+# (name, type_code, display_size, internal_size, precision, scale, null_ok)
+DESCRIPTION = (('id', FIELD_TYPE.LONG, None, None, None, None, 0),
+               ('score', FIELD_TYPE.DOUBLE, None, None, None, None, 0),
+               ('name', FIELD_TYPE.VAR_STRING, None, None, None, None, 1))
+
+
+class QueryColumnsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeServer(description=DESCRIPTION).install(self)
+        self._numpy = mysql_tool.numpy
+
+    def tearDown(self):
+        mysql_tool.numpy = self._numpy
+
+    def query(self, rows, **kwargs):
+        self.server.rows = rows
+        return MySqlClient(db='test').query_columns('select id, score, name from t', **kwargs)
+
+    def test_columns(self):
+        rows = [(i, i / 2.0, 'n{}'.format(i)) for i in range(25)]
+        columns = self.query(rows, chunk_size=10)
+        self.assertEqual(columns.keys(), ['id', 'score', 'name'])
+        self.assertEqual(list(columns['id']), range(25))
+        self.assertEqual(list(columns['score']), [i / 2.0 for i in range(25)])
+        self.assertEqual(columns['name'], ['n{}'.format(i) for i in range(25)])
+
+    def test_empty(self):
+        for numpy in (self._numpy, None):
+            mysql_tool.numpy = numpy
+            columns = self.query([])
+            self.assertEqual(columns.keys(), ['id', 'score', 'name'])
+            self.assertTrue(all(len(values) == 0 for values in columns.values()))
+            self.assertEqual(columns['name'], [])
+
+    def test_empty_dtypes(self):
+        if self._numpy is None:
+            return
+        columns = self.query([], dtypes=dict(name='U8'))
+        self.assertEqual(columns['id'].dtype, self._numpy.dtype('i8'))
+        self.assertEqual(columns['score'].dtype, self._numpy.dtype('f8'))
+        self.assertEqual(columns['name'].dtype, self._numpy.dtype('U8'))
+
+    def test_iter_query_chunks_empty(self):
+        self.assertEqual(list(MySqlClient(db='test').iter_query_chunks('select id from t')), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,162 @@
+# coding: utf-8
+"""
+SQL 构造: 多行 insert / upsert 按 max_packet 和 max_params 拆分, 按转义后的长度计算, 拼接出的语句不超过 max_packet;
+单行语句按 (操作, 表名, 字段) 缓存编译结果, 命中缓存时参数仍取本次调用的值
+python -m unittest discover -s tests -t .
+"""
+
+import random
+import decimal
+import datetime
+import unittest
+from utils import mysql_tool
+from utils.base import LRUCache
+from utils.mysql_tool import SQL, SqlTool
+
+ESCAPES = {'\\': '\\\\', "'": "\\'", '"': '\\"', '\0': '\\0', '\n': '\\n', '\r': '\\r', '\x1a': '\\Z'}
+
+
+def literal(value):
+    """按 MySQLdb 的规则转义参数"""
+    if value is None:
+        return 'NULL'
+    if isinstance(value, unicode):
+        value = value.encode('utf8')
+    if isinstance(value, str):
+        return "'{}'".format(''.join(ESCAPES.get(c, c) for c in value))
+    if isinstance(value, (bool, int, long, float, decimal.Decimal)):
+        return str(int(value) if isinstance(value, bool) else value)
+    return "'{}'".format(value)
+
+
+def render(sql, params):
+    return sql % tuple(map(literal, params))
+
+
+class SplitValuesTest(unittest.TestCase):
+
+    head = 'insert into `t` (`a`, `b`) '
+
+    def check(self, statements, rows, max_packet):
+        params = []
+        for sql, values in statements:
+            self.assertLessEqual(len(render(sql, values)), max_packet)
+            params.extend(values)
+        self.assertEqual(params, [v for row in rows for v in row])
+
+    def test_single_statement(self):
+        statements = SQL.split_values(self.head, '', 2, [(1, 'a'), (2, None)])
+        self.assertEqual(statements, [('insert into `t` (`a`, `b`) values (%s, %s), (%s, %s)', (1, 'a', 2, None))])
+
+    def test_row_width(self):
+        self.assertRaises(ValueError, SQL.split_values, self.head, '', 2, [(1, 'a'), (2,)])
+
+    def test_empty(self):
+        self.assertEqual(SQL.split_values(self.head, '', 2, []), [])
+
+    def test_max_params(self):
+        statements = SQL.split_values(self.head, '', 2, [(i, 'x') for i in range(10)], max_params=6)
+        self.assertEqual([len(params) for _, params in statements], [6, 6, 6, 2])
+
+    def test_max_packet_with_escapes(self):
+        r = random.Random(0)
+        chars = 'ab\\\'"\0\n\r\x1a'
+        rows = [(i, ''.join(r.choice(chars) for _ in xrange(r.randint(0, 60)))) for i in xrange(500)]
+        rows += [(i, '\\' * 50) for i in xrange(50)] + [(u'行业' * 10, None), (decimal.Decimal('1.50'), 2.5),
+                                                       (datetime.datetime(2020, 1, 2), True)]
+        statements = SQL.split_values(self.head, '', 2, rows, max_packet=1024)
+        self.assertGreater(len(statements), 1)
+        self.check(statements, rows, 1024)
+
+    def test_oversized_row(self):
+        statements = SQL.split_values(self.head, '', 2, [(1, 'x' * 100), (2, 'y')], max_packet=50)
+        self.assertEqual([len(params) for _, params in statements], [2, 2])
+
+
+class InsertManyTest(unittest.TestCase):
+
+    rows = [dict(id=i, name="n'{}".format(i)) for i in xrange(100)]
+
+    def test_insert_many(self):
+        statements = SQL.insert_many('t', self.rows, max_packet=500)
+        self.assertGreater(len(statements), 1)
+        for sql, params in statements:
+            self.assertTrue(sql.startswith('insert into `t` (`id`, `name`) values (%s, %s)'))
+            self.assertLessEqual(len(render(sql, params)), 500)
+        params = [v for _, values in statements for v in values]
+        self.assertEqual(params, [v for row in self.rows for v in (row['id'], row['name'])])
+
+    def test_upsert_many(self):
+        statements = SQL.upsert_many('t', self.rows, max_packet=500, max_params=20)
+        tail = ' on duplicate key update `id` = values(`id`), `name` = values(`name`)'
+        self.assertEqual(len(statements), 10)
+        for sql, params in statements:
+            self.assertTrue(sql.endswith(tail))
+            self.assertEqual(len(params), 20)
+            self.assertLessEqual(len(render(sql, params)), 500)
+
+    def test_update_insert_many(self):
+        sql, params = SQL.update_insert_many('t', ['id'], self.rows[:2])[0]
+        self.assertEqual(sql, 'insert into `t` (`id`, `name`) values (%s, %s), (%s, %s) '
+                              'on duplicate key update `name` = values(`name`)')
+        self.assertEqual(params, (0, "n'0", 1, "n'1"))
+
+    def test_mismatched_rows(self):
+        self.assertRaises(ValueError, SQL.insert_many, 't', [dict(id=1), dict(name='a')])
+        self.assertRaises(ValueError, SQL.insert_many, 't', [dict(id=1), dict(id=2, name='a')])
+        self.assertRaises(ValueError, SQL.insert_many, 't', [])
+
+
+class StatementCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self._cache = mysql_tool.statement_cache
+        self.cache = mysql_tool.statement_cache = LRUCache(maxsize=4)
+
+    def tearDown(self):
+        mysql_tool.statement_cache = self._cache
+
+    def test_hits(self):
+        sql = 'insert into `t` (`id`, `name`) values(%s, %s)'
+        self.assertEqual(SQL.insert('t', id=1, name='a'), (sql, (1, 'a')))
+        self.assertEqual(SQL.insert('t', name='b', id=2), (sql, (2, 'b')))
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        self.assertEqual(SQL.upsert('t', id=3, name='c'),
+                         (sql + ' on duplicate key update `id` = %s, `name` = %s', (3, 'c', 3, 'c')))
+        self.assertEqual(SQL.insert('u', id=1, name='a')[0], 'insert into `u` (`id`, `name`) values(%s, %s)')
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 3))
+
+    def test_builders(self):
+        for _ in range(2):
+            self.assertEqual(SQL.update('t', dict(name='a', status=1), dict(id=1)),
+                             ('update `t` set `name` = %s, `status` = %s where `id` = %s', ('a', 1, 1)))
+            self.assertEqual(SQL.delete('t', id=1, status=0),
+                             ('delete from `t` where `id` = %s and `status` = %s', (1, 0)))
+            self.assertEqual(SQL.select('t', 'id', status=1), ('select id from `t` where `status` = %s', (1,)))
+            self.assertEqual(SQL.update_insert('t', dict(id=1), name='a'),
+                             ('insert into `t` (`id`, `name`) values(%s, %s) on duplicate key update `name` = %s',
+                              (1, 'a', 'a')))
+        self.assertEqual(self.cache.hits, 4)
+
+    def test_sql_tool_missing_values(self):
+        tool = SqlTool('t').primary_key('id').columns('id', 'name', 'status')
+        self.assertEqual(tool.data(id=1, name='a').update_query,
+                         ('update t set name = %s, status = %s where id = %s ', ('a', None, 1)))
+        self.assertEqual(tool.data(id=2, status=0).update_query[1], (None, 0, 2))
+        self.assertEqual(tool.data(id=3).insert_query,
+                         ('insert into t(id, name, status) values (%s, %s, %s)', (3, None, None)))
+        self.assertEqual(self.cache.hits, 1)
+
+    def test_eviction(self):
+        for i in range(10):
+            table = 't{}'.format(i % 6)
+            self.assertEqual(SQL.insert(table, id=i), ('insert into `{}` (`id`) values(%s)'.format(table), (i,)))
+        self.assertEqual(len(self.cache.keys()), 4)
+        self.assertEqual(self.cache.evictions, 6)
+
+    def test_missing_value(self):
+        self.assertRaises(KeyError, mysql_tool._compile_update('t', ('a', 'b'), ('id',))[1], dict(a=1), dict(id=1))
+
+
+if __name__ == '__main__':
+    unittest.main()
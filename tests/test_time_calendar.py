@@ -0,0 +1,104 @@
+# coding: utf-8
+"""
+TimeTool 日历表: month_info 及 get_month_* / get_quarter_* / 周边界 / get_date_tips 与改为日历表之前逐次计算的结果相同,
+包括日历表范围外的年份; 9999 年末无法表示的边界与之前一样抛出 ValueError
+python -m unittest discover -s tests -t .
+"""
+
+import random
+import datetime
+import unittest
+from utils.time_tool import TimeTool
+
+ONE = datetime.timedelta(microseconds=1)
+
+
+def next_month_first(d):
+    """改为日历表之前的 get_next_month_first"""
+    if d.month == 12:
+        return datetime.datetime(year=d.year + 1, month=1, day=1)
+    return datetime.datetime(year=d.year, month=d.month + 1, day=1)
+
+
+def quarter_first(d):
+    return datetime.datetime(year=d.year, month=(d.month - 1) / 3 * 3 + 1, day=1)
+
+
+def quarter_last(d):
+    return next_month_first(datetime.datetime(year=d.year, month=(d.month - 1) / 3 * 3 + 3, day=1)) - ONE
+
+
+def make_dates(count, seed=0):
+    r = random.Random(seed)
+    dates = [datetime.datetime(y, m, 1) for y in (1, 1899, 1900, 2000, 2024, 2100, 2101, 9998) for m in xrange(1, 13)]
+    dates += [datetime.date(2024, 2, 29), datetime.datetime(2023, 12, 31, 23, 59, 59, 999999)]
+    dates += [datetime.datetime.fromordinal(r.randint(1, datetime.date(9998, 12, 31).toordinal())) +
+              datetime.timedelta(seconds=r.randint(0, 86399)) for _ in xrange(count)]
+    return dates
+
+
+class MonthInfoTest(unittest.TestCase):
+
+    def setUp(self):
+        self.months = TimeTool.calendar_months.copy()
+        TimeTool.calendar_months.clear()
+        self.addCleanup(TimeTool.calendar_months.update, self.months)
+
+    def test_same_as_before(self):
+        for d in make_dates(2000):
+            expected = (datetime.datetime(d.year, d.month, 1), next_month_first(d) - ONE, next_month_first(d),
+                        quarter_first(d), quarter_last(d))
+            self.assertEqual(tuple(TimeTool.month_info(d.year, d.month)[:5]), expected, msg=repr(d))
+            self.assertEqual((TimeTool.get_month_first(d), TimeTool.get_month_last(d), TimeTool.get_next_month_first(d),
+                              TimeTool.get_quarter_first(d), TimeTool.get_quarter_last(d)), expected, msg=repr(d))
+            self.assertEqual(TimeTool.get_next_quarter_first(d), quarter_last(d) + ONE)
+            self.assertEqual(TimeTool.get_date_tips(d, 'month'), '%d年%02d月' % (d.year, d.month))
+            self.assertEqual(TimeTool.get_date_tips(d, 'quarter'), '%d年%02d季度' % (d.year, (d.month - 1) / 3 + 1))
+            self.assertEqual(TimeTool.get_date_tips(d, 'week'), '%d年第%02d周' % d.isocalendar()[:2])
+
+    def test_cached_years(self):
+        TimeTool.month_info(2024, 5)
+        TimeTool.month_info(1899, 5)
+        TimeTool.month_info(2101, 5)
+        self.assertEqual(sorted(TimeTool.calendar_months), [(2024, m) for m in xrange(1, 13)])
+        self.assertIs(TimeTool.month_info(2024, 7), TimeTool.calendar_months[(2024, 7)])
+
+    def test_max_year(self):
+        for month in xrange(1, 13):
+            d = datetime.datetime(9999, month, 15)
+            info = TimeTool.month_info(9999, month)
+            self.assertEqual(TimeTool.get_month_first(d), datetime.datetime(9999, month, 1))
+            self.assertEqual(TimeTool.get_quarter_first(d), quarter_first(d))
+            self.assertEqual(TimeTool.get_date_tips(d, 'month'), '9999年%02d月' % month)
+            if month < 12:
+                self.assertEqual(TimeTool.get_month_last(d), next_month_first(d) - ONE)
+            else:
+                self.assertIsNone(info.next_first)
+                self.assertRaises(ValueError, TimeTool.get_month_last, d)
+                self.assertRaises(ValueError, TimeTool.get_next_month_first, d)
+            if month < 10:
+                self.assertEqual(TimeTool.get_quarter_last(d), quarter_last(d))
+            else:
+                self.assertRaises(ValueError, TimeTool.get_quarter_last, d)
+
+    def test_not_date(self):
+        self.assertIsNone(TimeTool.get_month_first('2024-01-01'))
+        self.assertRaises(TypeError, TimeTool.get_quarter_first, '2024-01-01')
+        self.assertRaises(TypeError, TimeTool.get_quarter_last, None)
+
+
+class WeekNumberTest(unittest.TestCase):
+
+    def test_same_as_before(self):
+        for year in (1, 1900, 2021, 2024, 2100, 2200):
+            first = datetime.datetime(year, 1, 1)
+            for week in xrange(53):
+                monday = first + datetime.timedelta(days=week * 7 - first.weekday())
+                self.assertEqual(TimeTool.get_first_last_date_by_week_number(year, week),
+                                 (monday, monday + datetime.timedelta(days=7) - ONE))
+        self.assertEqual(TimeTool.get_first_last_date_by_week_number(2024, 53), (None, None))
+        self.assertEqual(TimeTool.get_first_last_date_by_week_number('2024', 1), (None, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+# coding: utf-8
+"""
+TimeTool 时间戳批量转换与逐个调用标量方法的结果相同, 以及 current_millis 前后 days 天的计算
+python -m unittest discover -s tests -t .
+"""
+
+import os
+import time
+import random
+import calendar
+import datetime
+import unittest
+from utils import time_tool
+from utils.time_tool import TimeTool
+
+TIMEZONES = ['Asia/Shanghai', 'America/New_York', 'Europe/London', 'Australia/Lord_Howe']
+
+
+class FakeTime(object):
+    """替换 time_tool 中的 time 模块, time() 返回固定值"""
+
+    def __init__(self, now):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+
+def make_millis(count, seed=0):
+    r = random.Random(seed)
+    millis = [r.randint(0, 2 ** 31 - 1) * 1000 + r.randint(0, 999) for _ in xrange(count)]
+    return millis + [0, None, 1.5, 86400 * 1000 + 0.5]
+
+
+def ambiguous(value):
+    """夏令时切换时重复或不存在的本地时间, mktime 的结果与之前的调用有关, 不参与比较"""
+    d = TimeTool.str_to_datetime(value) if isinstance(value, str) else value
+    if not isinstance(d, datetime.date):
+        return False
+    t = d.timetuple()[:6]
+    local = calendar.timegm(t)
+    offsets = set(TimeTool._utc_offset(local + delta) for delta in (-86400, 86400))
+    return len(offsets) > 1 and sum(time.localtime(local - offset)[:6] == t for offset in offsets) != 1
+
+
+class CurrentMillisTest(unittest.TestCase):
+
+    def setUp(self):
+        self._time, time_tool.time = time_tool.time, FakeTime(1500000000.123)
+
+    def tearDown(self):
+        time_tool.time = self._time
+
+    def test_now(self):
+        self.assertEqual(TimeTool.current_millis(), 1500000000123)
+        self.assertEqual(TimeTool.current_millis(0), 1500000000123)
+
+    def test_days(self):
+        self.assertEqual(TimeTool.current_millis(1), 1500000000123 + 86400 * 1000)
+        self.assertEqual(TimeTool.current_millis(-1), 1500000000123 - 86400 * 1000)
+        self.assertEqual(TimeTool.current_millis(30), 1500000000123 + 30 * 86400 * 1000)
+
+    def test_invalid_days(self):
+        self.assertEqual(TimeTool.current_millis('1'), 1500000000123)
+        self.assertEqual(TimeTool.current_millis(None), 1500000000123)
+
+
+class BulkEpochTest(unittest.TestCase):
+
+    def setUp(self):
+        self.numpy = time_tool.numpy
+        self.tz = os.environ.get('TZ')
+        self.stats = dict(TimeTool.parse_stats)
+
+    def tearDown(self):
+        time_tool.numpy = self.numpy
+        if self.tz is None:
+            os.environ.pop('TZ', None)
+        else:
+            os.environ['TZ'] = self.tz
+        time.tzset()
+
+    def assertSameAsScalar(self, scalar, bulk, values):
+        result = bulk(values)
+        self.assertEqual(len(result), len(values))
+        for v, y in zip(values, result):
+            x = scalar(v)
+            self.assertTrue(x == y or ambiguous(v), (v, x, y))
+
+    def check(self):
+        millis = make_millis(3000)
+        seconds = [m / 1000 if m else m for m in millis]
+        strings = TimeTool.millis_to_strs(millis)
+        strings += [s[:10] for s in strings[:300] if s] + ['2020/01/02 10:00:00', '']
+        datetimes = [TimeTool.str_to_datetime(s) for s in strings]
+        datetimes += [d.date() for d in datetimes[:300] if d]
+        self.assertSameAsScalar(TimeTool.millis_to_datetime, TimeTool.millis_to_datetimes, millis)
+        self.assertSameAsScalar(TimeTool.millis_to_str, TimeTool.millis_to_strs, millis)
+        self.assertSameAsScalar(lambda m: TimeTool.millis_to_str(m, '%Y%m%d'),
+                                lambda v: TimeTool.millis_to_strs(v, '%Y%m%d'), millis)
+        self.assertSameAsScalar(TimeTool.seconds_to_str, TimeTool.seconds_to_strs, seconds)
+        self.assertSameAsScalar(TimeTool.datetime_to_millis, TimeTool.datetimes_to_millis, datetimes)
+        self.assertSameAsScalar(TimeTool.str_to_millis, TimeTool.strs_to_millis, strings)
+        self.assertSameAsScalar(lambda s: TimeTool.datetime_to_millis(TimeTool.str_to_datetime(s)) / 1000,
+                                lambda v: list(TimeTool.query_to_millis(*v, second=True)), strings)
+
+    def test_bulk_equals_scalar(self):
+        self.check()
+
+    def test_without_numpy(self):
+        time_tool.numpy = None
+        self.check()
+
+    def test_timezones(self):
+        for tz in TIMEZONES:
+            os.environ['TZ'] = tz
+            time.tzset()
+            self.check()
+
+    def test_offset(self):
+        self.assertEqual(TimeTool.millis_to_strs([86400 * 1000], offset=0), ['1970-01-02 00:00:00'])
+        self.assertEqual(TimeTool.datetimes_to_millis([datetime.datetime(1970, 1, 2, 8)], offset=8 * 3600),
+                         [86400 * 1000])
+        self.assertEqual(TimeTool.strs_to_millis(['1970-01-02 08:00:00'], offset=8 * 3600), [86400 * 1000])
+
+    def test_parse_stats_untouched(self):
+        TimeTool.strs_to_millis(['2020-01-02 10:00:00'] * 10)
+        self.assertEqual(TimeTool.parse_stats, self.stats)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+# coding: utf-8
+"""
+TimeTool.bucket_dates / group_dates 与逐个调用 format_group_date 的结果相同
+python -m unittest discover -s tests -t .
+"""
+
+import os
+import time
+import random
+import datetime
+import unittest
+from utils import time_tool
+from utils.time_tool import TimeTool, GROUP_TYPES
+
+TIMEZONES = ['Asia/Shanghai', 'America/New_York', 'Europe/London', 'Australia/Lord_Howe']
+
+
+def make_datetimes(count, seed=0):
+    r = random.Random(seed)
+    start = datetime.datetime(1971, 1, 1)
+    return [start + datetime.timedelta(seconds=r.randint(0, 86400 * 365 * 60)) for _ in xrange(count)]
+
+
+class GroupDatesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.numpy = time_tool.numpy
+        self.tz = os.environ.get('TZ')
+        TimeTool.group_labels.clear()
+
+    def tearDown(self):
+        time_tool.numpy = self.numpy
+        if self.tz is None:
+            os.environ.pop('TZ', None)
+        else:
+            os.environ['TZ'] = self.tz
+        time.tzset()
+
+    def check(self, values, datetimes):
+        """values 为 group_dates 的输入, datetimes[i] 为 values[i] 对应的本地时间"""
+        for _type in GROUP_TYPES:
+            keys, labels = TimeTool.group_dates(values, _type)
+            self.assertEqual(labels, [TimeTool.format_group_date(d, _type) for d in datetimes], _type)
+            first = {
+                'day': lambda d: datetime.datetime(d.year, d.month, d.day),
+                'week': TimeTool.get_monday,
+                'month': TimeTool.get_month_first,
+                'quarter': TimeTool.get_quarter_first,
+            }[_type]
+            self.assertEqual(keys, [first(d) for d in datetimes], _type)
+            starts, index = TimeTool.bucket_dates(values, _type)
+            self.assertEqual(starts, sorted(set(keys)))
+            self.assertEqual([starts[i] for i in index], keys)
+
+    def check_all_inputs(self):
+        datetimes = make_datetimes(3000)
+        self.check(datetimes, datetimes)
+        self.check([d.date() for d in datetimes], datetimes)
+        self.check([TimeTool.datetime_to_str(d) for d in datetimes], datetimes)
+        millis = [TimeTool.datetime_to_millis(d) + random.Random(1).randint(0, 999) for d in datetimes]
+        self.check(millis, [TimeTool.millis_to_datetime(m) for m in millis])
+        if time_tool.numpy is not None:
+            numpy = time_tool.numpy
+            self.check(numpy.array(datetimes, dtype='datetime64[s]'), datetimes)
+            self.check(numpy.array(datetimes, dtype='datetime64[us]'), datetimes)
+            self.check(numpy.array(millis, dtype=numpy.int64), [TimeTool.millis_to_datetime(m) for m in millis])
+
+    def test_group_dates(self):
+        self.check_all_inputs()
+
+    def test_without_numpy(self):
+        time_tool.numpy = None
+        self.check_all_inputs()
+
+    def test_timezones(self):
+        for tz in TIMEZONES:
+            os.environ['TZ'] = tz
+            time.tzset()
+            self.check_all_inputs()
+
+    def test_invalid_values(self):
+        self.assertRaises(ValueError, TimeTool.group_dates, [datetime.datetime.now()], 'year')
+        self.assertRaises(ValueError, TimeTool.group_dates, [None], 'day')
+
+    def test_empty(self):
+        self.assertEqual(TimeTool.group_dates([], 'week'), ([], []))
+
+
+if __name__ == '__main__':
+    unittest.main()
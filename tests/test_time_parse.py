@@ -0,0 +1,45 @@
+# coding: utf-8
+"""
+TimeTool.str_to_datetime 的解析缓存: 只缓存包含完整日期的字符串, dateutil 用今天补全日期的结果不缓存
+python -m unittest discover -s tests -t .
+"""
+
+import datetime
+import unittest
+from utils.time_tool import TimeTool
+
+
+class ParseCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        TimeTool.parse_cache.clear()
+        TimeTool.reset_parse_stats()
+
+    def test_full_date_cached(self):
+        for s in ['02/01/2020 10:00', 'Mar 3 2019', '20200102', '2 Jan 2020 10:30:05', '2020-01-02T10:00:00+08:00']:
+            d = TimeTool.str_to_datetime(s)
+            self.assertIn(s, TimeTool.parse_cache)
+            self.assertEqual(TimeTool.str_to_datetime(s), d)
+        self.assertEqual(TimeTool.parse_stats['cache'], 5)
+        self.assertEqual(TimeTool.parse_stats['dateutil'], 5)
+
+    def test_partial_date_not_cached(self):
+        today = datetime.date.today()
+        for s in ['10:30', 'Jan 5', '5', '2019-12', 'Tue']:
+            TimeTool.str_to_datetime(s)
+            TimeTool.str_to_datetime(s)
+            self.assertNotIn(s, TimeTool.parse_cache)
+        self.assertEqual(TimeTool.parse_stats['cache'], 0)
+        self.assertEqual(TimeTool.parse_stats['dateutil'], 10)
+        expected = datetime.datetime(today.year, today.month, today.day, 10, 30)
+        self.assertEqual(TimeTool.str_to_datetime('10:30'), expected)
+
+    def test_fast_path(self):
+        for s in ['2020-01-02 10:00:00', '2020/01/02 10:00', '2020.01.02T10:00:00.000']:
+            self.assertEqual(TimeTool.str_to_datetime(s), datetime.datetime(2020, 1, 2, 10))
+        self.assertEqual(TimeTool.parse_stats['fast'], 3)
+        self.assertEqual(len(TimeTool.parse_cache), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
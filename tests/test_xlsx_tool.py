@@ -0,0 +1,146 @@
+# coding: utf-8
+"""
+SheetWriter 写入单元格时的类型判断和格式: 公式、数组公式、链接仍交给 worksheet.write,
+流式模式下 write_columns 的 formats 与非流式相同, 按 first_col 之后的列序号对应,
+first_col 之前的列不写入也不计算列宽, 各列长度不同时按最长的列写出;
+write_iter 的 dict 行按 columns 或 OrderedDict 的键顺序写入;
+列宽计算与逐字符累加的结果相同, 文本宽度缓存超过上限后清空
+python -m unittest discover -s tests -t .
+"""
+
+import shutil
+import decimal
+import tempfile
+import unittest
+import collections
+from datetime import datetime
+from utils import xlsx_tool
+from utils.xlsx_tool import XlsxTool, SheetWriter, _u, _text_width, _count_width
+
+
+def char_width(text):
+    """逐字符累加的文本宽度"""
+    return sum(1 if ord(c) < 256 else 2.4 for c in unicode(_u(text)))
+
+
+class XlsxTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.books = []
+
+    def tearDown(self):
+        for book in self.books:
+            book.close()
+        shutil.rmtree(self.dir)
+
+    def sheet(self, streaming):
+        book = XlsxTool('{}/{}.xlsx'.format(self.dir, len(self.books)), streaming=streaming)
+        self.books.append(book)
+        writer = book.sheet('test')
+        # 记录 SheetWriter 对 worksheet 的调用, 不含 write 内部再调用的 write_string 等
+        writer.calls, nested = [], []
+        sheet = writer._sheet
+        for name in ('write', 'write_number', 'write_string'):
+            def record(row, col, value, cell_format=None, _name=name, _method=getattr(sheet, name)):
+                if not nested:
+                    writer.calls.append((_name, row, col, value, cell_format))
+                nested.append(_name)
+                try:
+                    return _method(row, col, value, cell_format)
+                finally:
+                    nested.pop()
+            setattr(sheet, name, record)
+        return writer
+
+
+class SpecialStringTest(XlsxTestCase):
+
+    def test_special_strings_use_write(self):
+        values = [u'=A1+1', u'{=SUM(A1:A2*B1:B2)}', u'http://example.com', u'mailto:a@example.com', u'']
+        writer = self.sheet(streaming=True)
+        writer.write_rows([values + [u'plain', u'{not formula']])
+        methods = [call[0] for call in writer.calls]
+        self.assertEqual(methods, ['write'] * len(values) + ['write_string', 'write_string'])
+
+
+class WriteColumnsTest(XlsxTestCase):
+
+    def cells(self, streaming, **kwargs):
+        writer = self.sheet(streaming)
+        columns = [[1, 2, 3], [u'a', u'b', u'c'], [4.5, 5.5, 6.5]]
+        writer.write_columns(columns, header=[u'x', u'y', u'z'], **kwargs)
+        formats = dict((id(f), key) for key, f in writer._cache_format.iteritems())
+        self.assertEqual(sorted(writer._col_width), range(kwargs.get('first_col', 0), kwargs.get('first_col', 0) + 3))
+        return sorted((row, col, value, formats.get(id(f))) for _, row, col, value, f in writer.calls)
+
+    def test_formats_with_first_col(self):
+        kwargs = dict(first_col=2, formats=[dict(bold=True), None], italic=True)
+        streaming, normal = self.cells(True, **kwargs), self.cells(False, **kwargs)
+        self.assertEqual(streaming, normal)
+        self.assertIn((1, 2, 1, 'bold-True'), normal)
+        self.assertIn((1, 3, u'a', None), normal)
+        self.assertIn((1, 4, 4.5, 'italic-True'), normal)
+
+    def test_properties_with_first_col(self):
+        kwargs = dict(first_col=1, italic=True)
+        self.assertEqual(self.cells(True, **kwargs), self.cells(False, **kwargs))
+
+    def test_uneven_columns(self):
+        writer = self.sheet(streaming=True)
+        self.assertEqual(writer.write_columns([[1, 2, 3], [u'a']], header=False), 3)
+        self.assertEqual([(row, col, value) for _, row, col, value, _ in writer.calls],
+                         [(0, 0, 1), (0, 1, u'a'), (1, 0, 2), (1, 1, None), (2, 0, 3), (2, 1, None)])
+        self.assertEqual(writer.row, 3)
+
+
+class WriteIterTest(XlsxTestCase):
+
+    def rows(self, writer):
+        return [(row, col, value) for _, row, col, value, _ in writer.calls]
+
+    def test_plain_dict_rows_need_columns(self):
+        writer = self.sheet(streaming=True)
+        self.assertRaises(ValueError, writer.write_iter, [dict(id=1, name=u'a')])
+
+    def test_columns(self):
+        writer = self.sheet(streaming=True)
+        writer.write_iter([dict(id=1, name=u'a'), dict(id=2)], columns=['name', 'id'])
+        self.assertEqual(self.rows(writer), [(0, 0, u'name'), (0, 1, u'id'), (1, 0, u'a'), (1, 1, 1),
+                                             (2, 0, None), (2, 1, 2)])
+
+    def test_ordered_dict_rows(self):
+        writer = self.sheet(streaming=True)
+        rows = [collections.OrderedDict([('name', u'a'), ('id', 1)]), collections.OrderedDict([('id', 2)])]
+        writer.write_iter(rows, header=[u'名称', u'编号'])
+        self.assertEqual(self.rows(writer), [(0, 0, u'名称'), (0, 1, u'编号'), (1, 0, u'a'), (1, 1, 1),
+                                             (2, 0, None), (2, 1, 2)])
+
+
+class TextWidthTest(unittest.TestCase):
+
+    values = [u'', u'abc', u'é ü ÿ', u'行业分类', u'a行b业', u'\u0100', u'😀', u'  x  ', 'utf8 字节', 0, 12345, -1.5,
+              1e20, True, 10 ** 20, decimal.Decimal('1.50'), datetime(2020, 1, 2, 3, 4, 5), None]
+
+    def test_same_as_char_loop(self):
+        for value in self.values:
+            self.assertAlmostEqual(_text_width(_u(value)), char_width(value), msg=repr(value))
+            self.assertAlmostEqual(SheetWriter.get_text_width(value), char_width(value), msg=repr(value))
+            if isinstance(_u(value), unicode):
+                self.assertAlmostEqual(_count_width(_u(value)), char_width(value), msg=repr(value))
+        self.assertEqual(SheetWriter.get_text_widths(self.values), map(SheetWriter.get_text_width, self.values))
+
+    def test_cache(self):
+        size = xlsx_tool.TEXT_WIDTH_CACHE_SIZE
+        self.addCleanup(setattr, xlsx_tool, 'TEXT_WIDTH_CACHE_SIZE', size)
+        xlsx_tool.TEXT_WIDTH_CACHE_SIZE = 3
+        xlsx_tool._text_widths.clear()
+        for text in (u'a', u'行', u'a', 1, u'bb'):
+            _text_width(text)
+        self.assertEqual(xlsx_tool._text_widths, {u'a': 1, u'行': 2.4, u'bb': 2})
+        self.assertEqual(_text_width(u'ccc'), 3)
+        self.assertEqual(xlsx_tool._text_widths, {u'ccc': 3})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,6 @@
 # coding: utf-8
 
-from base import IntervalMerge
+from base import BoundedQueue, IntervalMerge, LRUCache, merge_intervals
 from string_tool import StringTool
 from time_tool import TimeTool
 # from mysql_tool import MySqlClient, SQL
@@ -1,30 +1,371 @@
 # coding: utf-8
 
+import Queue
+import bisect
+import itertools
+import threading
+import traceback
+import collections
+import multiprocessing
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 class IntervalMerge(object):
+    """
+    区间合并, 首尾相接的区间合并为一个; 合并后的区间按起点升序存为起点、终点两个有序列表
+    add 用 bisect 找到与新区间相交的相邻区间并只合并这一段, 总长度随之维护
+    >>> merge = IntervalMerge()
+    >>> merge.add_many([(1, 3), (2, 5), (8, 9)])
+    >>> merge.intervals
+    [{'et': 5, 'st': 1}, {'et': 9, 'st': 8}]
+    >>> merge.length, merge.contains(4), merge.coverage(4, 8.5)
+    (5, True, 1.5)
+    """
+
+    def __init__(self, intervals=None):
+        self._starts = []
+        self._ends = []
+        self._length = 0
+        self._intervals = None    # intervals 的缓存, 区间变化后重建
+        self._prefix = None    # 前 i 个区间的长度之和, 供 coverage 使用, 区间变化后重建
+        if intervals:
+            self.add_many(intervals)
 
-    def __init__(self):
-        self._intervals = []
+    def _changed(self):
+        self._intervals = None
+        self._prefix = None
 
     def add(self, start, end):
         start, end = (start, end) if start < end else (end, start)
-        self._intervals.append(dict(st=start, et=end))
-        self._intervals.sort(key=lambda x: x['st'])
-        tmp = [self._intervals[0]]
-        index = 0
-        for item in self._intervals:
-            st, et = item['st'], item['et']
-            if tmp[index]['st'] <= st <= tmp[index]['et']:
-                tmp[index]['et'] = max(et, tmp[index]['et'])
+        starts, ends = self._starts, self._ends
+        # 终点 >= start 且起点 <= end 的区间与 [start, end] 相交或相接
+        lo = bisect.bisect_left(ends, start)
+        hi = bisect.bisect_right(starts, end, lo)
+        if lo < hi:
+            self._length -= sum(ends[i] - starts[i] for i in xrange(lo, hi))
+            start, end = min(start, starts[lo]), max(end, ends[hi - 1])
+        starts[lo:hi] = [start]
+        ends[lo:hi] = [end]
+        self._length += end - start
+        self._changed()
+
+    def add_many(self, intervals):
+        """
+        批量添加区间, 与已有区间一起排序一次后顺序合并
+        :param intervals: (start, end) 的序列
+        """
+        pairs = [(st, et) if st < et else (et, st) for st, et in intervals]
+        if not pairs:
+            return
+        pairs.extend(itertools.izip(self._starts, self._ends))
+        pairs.sort()
+        starts, ends = [pairs[0][0]], [pairs[0][1]]
+        for st, et in pairs:
+            if st <= ends[-1]:
+                if et > ends[-1]:
+                    ends[-1] = et
             else:
-                tmp.append(dict(st=st, et=et))
-                index += 1
-        self._intervals = tmp
+                starts.append(st)
+                ends.append(et)
+        self._starts, self._ends = starts, ends
+        self._length = sum(et - st for st, et in itertools.izip(starts, ends))
+        self._changed()
+
+    def contains(self, point):
+        """point 是否在某个区间内(含端点)"""
+        i = bisect.bisect_right(self._starts, point) - 1
+        return i >= 0 and point <= self._ends[i]
+
+    def covers(self, start, end):
+        """[start, end] 是否完全在某个区间内"""
+        start, end = (start, end) if start < end else (end, start)
+        i = bisect.bisect_right(self._starts, start) - 1
+        return i >= 0 and end <= self._ends[i]
+
+    def coverage(self, start, end):
+        """[start, end] 中被区间覆盖的长度"""
+        start, end = (start, end) if start < end else (end, start)
+        starts, ends = self._starts, self._ends
+        lo = bisect.bisect_right(ends, start)
+        hi = bisect.bisect_left(starts, end, lo)
+        if lo >= hi:
+            return 0
+        if self._prefix is None:
+            prefix = self._prefix = [0]
+            for st, et in itertools.izip(starts, ends):
+                prefix.append(prefix[-1] + et - st)
+        covered = self._prefix[hi] - self._prefix[lo]
+        return covered - max(start - starts[lo], 0) - max(ends[hi - 1] - end, 0)
 
     @property
     def intervals(self):
+        if self._intervals is None:
+            self._intervals = [dict(st=st, et=et) for st, et in itertools.izip(self._starts, self._ends)]
         return self._intervals
 
     @property
     def length(self):
-        return sum(map(lambda x: x['et'] - x['st'], self._intervals))
+        return self._length
+
+
+# merge_intervals 的结果: 各 key 合并后的总长度, 以及合并后的区间
+IntervalUnion = collections.namedtuple('IntervalUnion', ['keys', 'lengths', 'interval_keys', 'starts', 'ends'])
+
+
+def merge_intervals(keys, starts, ends):
+    """
+    按 key 批量合并区间, 结果同每个 key 一个 IntervalMerge, 依赖 numpy
+    key 和起点、终点都换成整数名次, 按 key 名次 * 值名次的范围 + 起点名次排序; 每行终点在同一 key 的起点中
+    searchsorted 得到能与之合并的最后一行, 该行号的累计最大值即判断每行是否与之前的行相交或相接,
+    行号不会超出本 key 的范围, 累计最大值不会跨 key
+    >>> union = merge_intervals([1, 1, 2, 1], [0, 2, 5, 10], [3, 4, 6, 11])
+    >>> union.keys, union.lengths
+    (array([1, 2]), array([5, 1]))
+    >>> union.interval_keys, union.starts, union.ends
+    (array([1, 1, 2]), array([ 0, 10,  5]), array([ 4, 11,  6]))
+    :param keys: 每行的 key, 如 user_id
+    :param starts: 每行的起点, 与 ends 顺序颠倒的行会交换
+    :param ends: 每行的终点
+    :return: IntervalUnion, keys 为升序去重的 key, lengths[i] 为 keys[i] 合并后的总长度;
+        interval_keys/starts/ends 为合并后的区间, 按 (key, 起点) 升序
+    """
+    if numpy is None:
+        raise ImportError('numpy is required for merge_intervals')
+    keys, starts, ends = numpy.asarray(keys), numpy.asarray(starts), numpy.asarray(ends)
+    if not len(keys) == len(starts) == len(ends):
+        raise ValueError('keys, starts and ends must have the same length')
+    starts, ends = numpy.minimum(starts, ends), numpy.maximum(starts, ends)
+    count = len(keys)
+    if not count:
+        return IntervalUnion(keys, ends - starts, keys, starts, ends)
+
+    unique_keys, key_ranks = numpy.unique(keys, return_inverse=True)
+    values = numpy.concatenate((starts, ends))
+    value_ranks = None
+    if values.dtype.kind in 'iumM':
+        # 整数和日期时间与最小值的差即可作为名次, 不需要排序; 组合后超出 int64 时仍按排序取名次
+        numbers = values.view(numpy.int64) if values.dtype.kind in 'mM' else values
+        lowest, highest = int(numbers.min()), int(numbers.max())
+        span = highest - lowest + 1
+        if highest < 2 ** 63 and span * len(unique_keys) < 2 ** 62:
+            value_ranks = numbers.astype(numpy.int64) - lowest
+    if value_ranks is None:
+        values, value_ranks = numpy.unique(values, return_inverse=True)
+        span = len(values)
+    base = key_ranks.astype(numpy.int64) * span
+    start_ranks, end_ranks = base + value_ranks[:count], base + value_ranks[count:]
+    order = numpy.argsort(start_ranks)
+    start_ranks, end_ranks = start_ranks[order], end_ranks[order]
+    starts, ends = starts[order], ends[order]
+
+    last = numpy.searchsorted(start_ranks, end_ranks, side='right') - 1
+    reach = numpy.maximum.accumulate(last)
+    first = numpy.ones(count, dtype=bool)
+    first[1:] = numpy.arange(1, count) > reach[:-1]
+    heads = numpy.flatnonzero(first)
+    interval_keys, interval_starts = key_ranks[order][heads], starts[heads]
+    interval_ends = numpy.maximum.reduceat(ends, heads)
+
+    key_heads = numpy.flatnonzero(numpy.concatenate(([True], interval_keys[1:] != interval_keys[:-1])))
+    lengths = numpy.add.reduceat(interval_ends - interval_starts, key_heads)
+    return IntervalUnion(unique_keys, lengths, unique_keys[interval_keys], interval_starts, interval_ends)
+
+
+class LRUCache(object):
+    """
+    线程安全的 LRU 缓存, maxsize <= 0 时不缓存任何数据; 链表节点为 [prev, next, key, value]
+    on_evict(key, value) 在因容量不足淘汰数据后调用
+    """
+
+    def __init__(self, maxsize=1024, on_evict=None):
+        self.maxsize = maxsize
+        self.on_evict = on_evict
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = {}
+        self._root = []    # 双向循环链表的哨兵节点, root[NEXT] 为最久未使用的节点
+        self._root[:] = [self._root, self._root, None, None]
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            link = self._data.get(key)
+            if link is None:
+                self.misses += 1
+                return default
+            prev, _next = link[0], link[1]
+            prev[1], _next[0] = _next, prev
+            root = self._root
+            last = root[0]
+            last[1] = root[0] = link
+            link[0], link[1] = last, root
+            self.hits += 1
+            return link[3]
+
+    def set(self, key, value):
+        """写入缓存并返回 value"""
+        if self.maxsize <= 0:
+            return value
+        oldest = None
+        with self._lock:
+            link = self._data.get(key)
+            if link is not None:
+                link[0][1], link[1][0] = link[1], link[0]
+                del self._data[key]
+            elif len(self._data) >= self.maxsize:
+                oldest = self._root[1]
+                oldest[0][1], oldest[1][0] = oldest[1], oldest[0]
+                del self._data[oldest[2]]
+                self.evictions += 1
+            root = self._root
+            last = root[0]
+            link = [last, root, key, value]
+            last[1] = root[0] = self._data[key] = link
+        if oldest is not None and self.on_evict is not None:
+            self.on_evict(oldest[2], oldest[3])
+        return value
+
+    def pop(self, key, default=None):
+        with self._lock:
+            link = self._data.pop(key, None)
+            if link is None:
+                return default
+            link[0][1], link[1][0] = link[1], link[0]
+            return link[3]
+
+    def keys(self):
+        """按最久未使用到最近使用的顺序返回全部 key"""
+        with self._lock:
+            keys, link = [], self._root[1]
+            while link is not self._root:
+                keys.append(link[2])
+                link = link[1]
+            return keys
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._root[:] = [self._root, self._root, None, None]
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    @property
+    def stats(self):
+        return dict(hits=self.hits, misses=self.misses, evictions=self.evictions, size=len(self._data),
+                    maxsize=self.maxsize)
+
+
+class _Done(object):
+    """生产方结束的标记, 进程模式下经 pickle 传递, 按类型判断"""
+
+
+class _Failed(object):
+    """生产方出错的标记, value 为异常, 进程模式下为 traceback 文本"""
+
+    def __init__(self, value):
+        self.value = value
+
+
+def _produce(queue, target, args):
+    try:
+        target(*args)
+    except Exception, e:
+        queue.put(_Failed(traceback.format_exc() if queue.processes else e))
+    finally:
+        queue.put(_Done())
+
+
+class BoundedQueue(object):
+    """
+    生产者/消费者共用的有界队列: start() 启动的线程(或进程)通过 put 写入, 队列满时阻塞(背压), 调用方迭代读取;
+    所有生产方结束后迭代停止, 生产方出错时迭代抛出该异常(进程模式下为带 traceback 的 RuntimeError)
+    消费方提前结束或出错时 close() 通知生产方停止写入, 并取出剩余数据直到生产方全部退出
+    >>> queue = BoundedQueue(8)
+    >>> queue.start(produce, args=(queue,), workers=4)
+    >>> try:
+    ...     for item in queue:
+    ...         handle(item)
+    ... finally:
+    ...     queue.close()
+    """
+
+    def __init__(self, maxsize, processes=False, name='worker'):
+        """
+        :param maxsize: 队列中最多缓存的数据数
+        :param processes: 生产方为进程
+        :param name: 线程(或进程)名, 也用于出错信息
+        """
+        self.processes = processes
+        self.name = name
+        if processes:
+            self._queue, self._stop = multiprocessing.Queue(maxsize), multiprocessing.Event()
+        else:
+            self._queue, self._stop = Queue.Queue(maxsize), threading.Event()
+        self._runners = []
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_runners'] = []
+        return state
+
+    @property
+    def stopped(self):
+        return self._stop.is_set()
+
+    def put(self, item):
+        """写入一条数据, 队列满时等待; close() 后放弃写入并返回 False"""
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except Queue.Full:
+                pass
+        return False
+
+    def start(self, target, args=(), workers=1):
+        """启动 workers 个线程(或进程)执行 target(*args), target 返回或出错后写入结束标记"""
+        create = multiprocessing.Process if self.processes else threading.Thread
+        for _ in xrange(workers):
+            runner = create(target=_produce, args=(self, target, args), name=self.name)
+            runner.daemon = True
+            runner.start()
+            self._runners.append(runner)
+
+    def __iter__(self):
+        running = len(self._runners)
+        while running:
+            item = self._queue.get()
+            if isinstance(item, _Done):
+                running -= 1
+            elif isinstance(item, _Failed):
+                if isinstance(item.value, BaseException):
+                    raise item.value
+                raise RuntimeError('{} failed\n{}'.format(self.name, item.value))
+            else:
+                yield item
+
+    def close(self):
+        """通知生产方停止, 取出队列中剩余的数据直到生产方全部退出"""
+        self._stop.set()
+        for runner in self._runners:
+            while runner.is_alive():
+                try:
+                    self._queue.get(timeout=0.1)
+                except Queue.Empty:
+                    pass
+                runner.join(0.1)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
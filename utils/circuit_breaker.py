@@ -0,0 +1,60 @@
+# coding: utf-8
+
+import time
+import threading
+
+
+class CircuitBreaker(object):
+    """
+    熔断器: 连续失败 failure_threshold 次后打开, reset_timeout 秒内拒绝所有调用;
+    超时后进入半开状态, 只放行一次试探, 试探成功则关闭, 失败则重新打开
+    >>> breaker = CircuitBreaker(failure_threshold=5, reset_timeout=30)
+    >>> if breaker.allow():
+    ...     try:
+    ...         connect()
+    ...     except Exception:
+    ...         breaker.failure()
+    ...     else:
+    ...         breaker.success()
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        return self._state
+
+    def allow(self):
+        """是否允许本次调用"""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN and time.time() - self._opened_at >= self.reset_timeout:
+                self._state = self.HALF_OPEN
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+
+    def failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = time.time()
+
+    def reset(self):
+        self.success()
@@ -0,0 +1,288 @@
+# coding: utf-8
+
+import csv
+import gzip
+import itertools
+from xlsx_tool import _u, _convert_row, _iter_rows, _column_lists, Exporter, XlsxTool
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+class RowSheetWriter(object):
+    """
+    按行顺序写出的 sheet, 接口同 SheetWriter, 值按 _u 的规则转换(日期/时间转为字符串, 去除首尾空白)
+    不支持格式、列宽和合并单元格, 相关参数被忽略; 只能按行号顺序写入
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.row = 0
+        self.finished = False
+
+    @property
+    def current_row(self):
+        return self.row
+
+    def _write_row(self, values):
+        """写出一行已转换的值"""
+        raise NotImplementedError
+
+    def _close(self):
+        raise NotImplementedError
+
+    def _skip_to(self, row):
+        if row is None:
+            return
+        if row < self.row:
+            raise ValueError('{} must be written in row order, row {} already written'.format(self.filename, row))
+        while self.row < row:
+            self._write_row([])
+            self.row += 1
+
+    def write(self, values=None, row=None, **properties):
+        """
+        写入一行数据, 参数同 SheetWriter.write, 格式参数被忽略
+        :param values: 数据列表
+        :param row: 写入数据的行号, 默认在尾部写入, 不能小于已写入的行号
+        """
+        if values is None:
+            values = []
+        if not isinstance(values, list):
+            raise TypeError('values must be list object')
+        self._skip_to(row)
+        self._write_row(_convert_row(values))
+        self.row += 1
+
+    def write_merge(self, value, first_row=0, last_row=0, first_col=0, last_col=0, **properties):
+        """值写入合并区域左上角的单元格"""
+        self.write([None] * min(first_col, last_col) + [value], row=min(first_row, last_row))
+
+    def write_rows(self, rows, row=None, **properties):
+        """批量写入多行, 参数同 SheetWriter.write_rows, 格式参数被忽略"""
+        self._skip_to(row)
+        count = 0
+        for values in rows:
+            self._write_row(_convert_row(values))
+            count += 1
+        self.row += count
+        return count
+
+    def write_iter(self, rows, columns=None, header=None, **properties):
+        """逐行写入可迭代的数据, 参数同 SheetWriter.write_iter"""
+        header, rows = _iter_rows(rows, columns, header)
+        if header:
+            self.write(header)
+        return self.write_rows(rows)
+
+    def write_columns(self, columns, row=None, first_col=0, header=None, **properties):
+        """按列写入数据, 参数同 SheetWriter.write_columns"""
+        header, columns = _column_lists(columns, header)
+        if header:
+            self.write([None] * first_col + header, row=row)
+            row = None
+        if first_col and columns:
+            columns = [[]] * first_col + columns
+        # 各列长度不同时按最长的列写出, 缺少的值为空
+        return self.write_rows(itertools.izip_longest(*columns), row=row)
+
+    def finish(self):
+        if not self.finished:
+            self.finished = True
+            self._close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.finish()
+
+
+class CsvSheetWriter(RowSheetWriter):
+
+    def __init__(self, filename, delimiter=',', compress=False, charset='utf-8'):
+        super(CsvSheetWriter, self).__init__(filename)
+        self.charset = charset
+        self._file = gzip.open(filename, 'wb', compresslevel=6) if compress else open(filename, 'wb')
+        self._writer = csv.writer(self._file, delimiter=delimiter, lineterminator='\n')
+
+    def _encode(self, values):
+        charset = self.charset
+        return [v.encode(charset) if isinstance(v, unicode) else v for v in values]
+
+    def _write_row(self, values):
+        self._writer.writerow(self._encode(values))
+
+    def write_rows(self, rows, row=None, **properties):
+        self._skip_to(row)
+        # izip 在 rows 耗尽时不再从 counter 取值, 结束后 counter 的下一个值即行数
+        counter = itertools.count()
+        self._writer.writerows(self._encode(_convert_row(values)) for values, _ in itertools.izip(rows, counter))
+        count = next(counter)
+        self.row += count
+        return count
+
+    def _close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+
+class ParquetSheetWriter(RowSheetWriter):
+    """
+    写入的第一行总是作为列名, 之后每 row_group_size 行写出一个 row group, 各列类型由第一个 row group 推断
+    write_iter / write_columns 先写出表头, 需给出 header 或 columns(或使用 OrderedDict 行、dict 列);
+    直接调用 write / write_rows 时第一行应为列名, 否则第一行数据会被当作列名
+    """
+
+    def __init__(self, filename, row_group_size=10000):
+        super(ParquetSheetWriter, self).__init__(filename)
+        self.row_group_size = row_group_size
+        self.columns = None
+        self._rows = []
+        self._writer = None
+        self._types = None
+
+    def _write_row(self, values):
+        if self.columns is None:
+            self.columns = [unicode(c) for c in values]
+            return
+        # _u 转换的日期/时间为 str, 按 string 类型写出而不是 binary
+        self._rows.append([v.decode('utf-8') if type(v) is str else v for v in values])
+        if len(self._rows) >= self.row_group_size:
+            self._flush()
+
+    def _flush(self):
+        if not self._rows:
+            return
+        width = max(len(self.columns), max(len(values) for values in self._rows))
+        if len(self.columns) < width:
+            self.columns += [u'c{}'.format(i) for i in xrange(len(self.columns), width)]
+        data = [list(c) for c in itertools.izip_longest(*self._rows)]
+        data += [[None] * len(self._rows)] * (width - len(data))
+        if self._writer is None:
+            # 第一组中全为空的列按字符串处理
+            self._types = [pyarrow.string() if a.type == pyarrow.null() else a.type
+                           for a in (pyarrow.array(c) for c in data)]
+            schema = pyarrow.schema([pyarrow.field(n, t) for n, t in zip(self.columns, self._types)])
+            self._writer = pyarrow.parquet.ParquetWriter(self.filename, schema)
+        arrays = [pyarrow.array(c, type=t) for c, t in zip(data, self._types)]
+        self._writer.write_table(pyarrow.Table.from_arrays(arrays, names=self.columns))
+        self._rows = []
+
+    def _close(self):
+        if self.columns is None:
+            self.columns = []
+        self._flush()
+        if self._writer is None and self.columns:
+            schema = pyarrow.schema([pyarrow.field(name, pyarrow.string()) for name in self.columns])
+            self._writer = pyarrow.parquet.ParquetWriter(self.filename, schema)
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+class FileExporter(Exporter):
+    """
+    每个 sheet 写入单独的文件: sheet_name 为空时为 filename 本身, 否则为 "{filename 去掉扩展名}_{sheet_name}.{扩展名}"
+    """
+
+    extension = None
+    # filename 末尾依次去掉的扩展名, 如 CsvTool('x.csv', compress=True) 写入 x.csv.gz 而不是 x.csv.csv.gz
+    suffixes = ()
+
+    def __init__(self, filename):
+        filename = _u(filename)
+        for suffix in self.suffixes:
+            if filename.endswith(suffix):
+                filename = filename[:-len(suffix)]
+        self.base = filename.replace(u':', u'：')
+        self.filenames = []
+        self._writers = []
+
+    def _filename(self, sheet_name):
+        if sheet_name:
+            return u'{}_{}{}'.format(self.base, _u(sheet_name).replace(u'/', u'_'), self.extension)
+        return self.base + self.extension
+
+    def _create(self, filename, **options):
+        raise NotImplementedError
+
+    def sheet(self, sheet_name=None, **options):
+        filename = self._filename(sheet_name)
+        if filename in self.filenames:
+            raise ValueError(u'sheet {} already exists'.format(_u(sheet_name)))
+        writer = self._create(filename, **options)
+        self.filenames.append(filename)
+        self._writers.append(writer)
+        return writer
+
+    def close(self):
+        writers, self._writers = self._writers, []
+        for writer in writers:
+            writer.finish()
+
+
+class CsvTool(FileExporter):
+    """
+    CSV 导出, 接口同 XlsxTool, 逐行写出, 内存占用不随行数增长
+    >>> with CsvTool('industry.csv.gz', compress=True) as tool:
+    ...     tool.sheet().write_iter(client.iter_query('select * from industry_new'), columns=['id', 'name'])
+    """
+
+    suffixes = ('.gz', '.csv', '.tsv')
+
+    def __init__(self, filename, delimiter=',', compress=False, charset='utf-8'):
+        self.extension = ('.tsv' if delimiter == '\t' else '.csv') + ('.gz' if compress else '')
+        super(CsvTool, self).__init__(filename)
+        self.delimiter = delimiter
+        self.compress = compress
+        self.charset = charset
+
+    def _create(self, filename, **options):
+        return CsvSheetWriter(filename, delimiter=self.delimiter, compress=self.compress, charset=self.charset)
+
+
+class ParquetTool(FileExporter):
+    """Parquet 导出, 依赖 pyarrow; 每个 sheet 写入的第一行为列名, 见 ParquetSheetWriter"""
+
+    extension = '.parquet'
+    suffixes = ('.parquet',)
+
+    def __init__(self, filename, row_group_size=10000):
+        if pyarrow is None:
+            raise ImportError('pyarrow is required for parquet export')
+        super(ParquetTool, self).__init__(filename)
+        self.row_group_size = row_group_size
+
+    def _create(self, filename, **options):
+        return ParquetSheetWriter(filename, row_group_size=self.row_group_size)
+
+
+FORMATS = {
+    'xlsx': XlsxTool,
+    'csv': CsvTool,
+    'tsv': lambda filename, **kwargs: CsvTool(filename, delimiter='\t', **kwargs),
+    'csv.gz': lambda filename, **kwargs: CsvTool(filename, compress=True, **kwargs),
+    'tsv.gz': lambda filename, **kwargs: CsvTool(filename, delimiter='\t', compress=True, **kwargs),
+    'parquet': ParquetTool,
+}
+
+
+def open_exporter(filename, format='xlsx', **kwargs):
+    """
+    按 format 创建导出文件, 返回的对象提供相同的 sheet() / write_sheets() / close() 接口
+    >>> tool = open_exporter(u'行业', format='csv.gz')
+    >>> sql, params = SQL.select('industry_new', industry_level=1)
+    >>> rows = client.iter_query(sql, *params)
+    >>> tool.sheet(u'一级行业').write_iter(rows, columns=['id', 'name'])
+    >>> tool.close()
+    :param format: xlsx, csv, tsv, csv.gz, tsv.gz, parquet
+    :param kwargs: 传给对应导出类的参数, 如 XlsxTool 的 streaming
+    """
+    if format not in FORMATS:
+        raise ValueError('unsupported export format {!r}, expected one of {}'.format(format, sorted(FORMATS)))
+    return FORMATS[format](filename, **kwargs)
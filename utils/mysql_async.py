@@ -0,0 +1,128 @@
+# coding: utf-8
+
+import itertools
+import threading
+import MySQLdb
+from concurrent.futures import ThreadPoolExecutor
+from mysql_pool import MySqlPool
+from mysql_tool import MySqlClient
+
+
+class AsyncMySqlClient(object):
+    """
+    非阻塞 MySQL 客户端, 接口同 MySqlClient, 各方法立即返回 concurrent.futures.Future, 可在 tornado 协程中 yield
+    语句在受管线程池中使用 MySqlPool 的连接执行, 同时执行的语句数不超过 max_concurrency
+    未读完的 AsyncRowIterator 会一直占用一个连接, 同时打开的迭代器不超过 max_iterators,
+    连接池比迭代器至少多一个连接, 其他语句总能拿到连接, 不会因迭代器占满连接池而互相等待
+    >>> client = AsyncMySqlClient(host='localhost', user='dever', password='dever', db='user')
+    >>> @gen.coroutine
+    ... def handler():
+    ...     sql, params = SQL.select('industry_new', industry_level=1)
+    ...     rows = yield client.query(sql, *params)
+    """
+
+    def __init__(self, host='localhost', port=3306, user=None, password=None, db=None, charset='utf8',
+                 max_concurrency=10, pool=None, max_iterators=None, acquire_timeout=30):
+        """
+        :param max_iterators: 同时打开的 AsyncRowIterator 数上限, 默认 max_concurrency / 2, 至少为 1
+        :param acquire_timeout: 借用连接的最长等待秒数, 超时后同 MySqlClient 出错: execute 等抛出 MySQLError,
+            query/first 返回 None
+        :param pool: 使用已有的 MySqlPool, 其 max_size 需大于 max_iterators
+        """
+        if max_iterators is None:
+            max_iterators = max(1, max_concurrency / 2)
+        self._own_pool = pool is None
+        if pool is None:
+            pool = MySqlPool(host=host, port=port, user=user, password=password, db=db, charset=charset,
+                             min_size=1, max_size=max_concurrency + max_iterators, wait_timeout=acquire_timeout)
+        elif pool.max_size <= max_iterators:
+            raise ValueError('pool.max_size must be greater than max_iterators')
+        self.pool = pool
+        self.max_concurrency = max_concurrency
+        self.max_iterators = max_iterators
+        self.acquire_timeout = acquire_timeout
+        self._client = MySqlClient(pool=pool, pool_timeout=acquire_timeout)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency)
+        self._iterators = threading.BoundedSemaphore(max_iterators)
+
+    def _submit(self, func, *args):
+        return self._executor.submit(func, *args)
+
+    def query(self, sql, *args):
+        return self._submit(self._client.query, sql, *args)
+
+    def first(self, sql, *args):
+        return self._submit(self._client.first, sql, *args)
+
+    def execute(self, sql, *args):
+        return self._submit(self._client.execute, sql, *args)
+
+    def insert_many(self, sql, *values):
+        return self._submit(self._client.insert_many, sql, *values)
+
+    def iter_query(self, sql, *args, **kwargs):
+        """
+        iter_query 的异步版本, 返回 AsyncRowIterator, 读取完毕、出错或 close() 后才释放连接
+        已打开 max_iterators 个迭代器时直接抛出 MySQLError, 不等待
+        :param chunk_size: 每次 next() 返回的最多行数, 默认 1000
+        """
+        if not self._iterators.acquire(False):
+            raise MySQLdb.MySQLError('too many open iterators (max_iterators={})'.format(self.max_iterators))
+        return AsyncRowIterator(self._executor, self._client.iter_query(sql, *args), kwargs.get('chunk_size', 1000),
+                                on_close=self._iterators.release)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        if self._own_pool:
+            self.pool.close()
+
+
+class AsyncRowIterator(object):
+    """
+    异步逐块读取查询结果, 每次 next() 返回一个 Future, 结果为下一批行(list), 读取完毕时为空列表
+    >>> rows = client.iter_query('select * from position_new')
+    >>> while True:
+    ...     chunk = yield rows.next()
+    ...     if not chunk:
+    ...         break
+    """
+
+    def __init__(self, executor, generator, chunk_size=1000, on_close=None):
+        """:param on_close: 读取完毕、出错或 close() 后调用一次"""
+        self._executor = executor
+        self._generator = generator
+        self.chunk_size = chunk_size
+        self._lock = threading.Lock()
+        self._on_close = on_close
+
+    def _finish(self):
+        on_close, self._on_close = self._on_close, None
+        if on_close is not None:
+            on_close()
+
+    def _next_chunk(self):
+        with self._lock:
+            try:
+                chunk = list(itertools.islice(self._generator, self.chunk_size))
+            except BaseException:
+                self._finish()
+                raise
+            if not chunk:
+                self._finish()
+            return chunk
+
+    def next(self):
+        return self._executor.submit(self._next_chunk)
+
+    def close(self):
+        """提前结束读取, 关闭服务端游标并归还连接"""
+        def _close():
+            with self._lock:
+                try:
+                    self._generator.close()
+                finally:
+                    self._finish()
+        return self._executor.submit(_close)
+
+    def __del__(self):
+        self._finish()
@@ -0,0 +1,238 @@
+# coding: utf-8
+
+import time
+import logging
+import threading
+import contextlib
+import collections
+import MySQLdb
+
+
+log = logging.getLogger()
+# 连接已断开: MySQL server has gone away / Lost connection to MySQL server
+CONNECTION_LOST_ERRORS = (2006, 2013, 2055)
+
+
+class MySqlPool(object):
+    """
+    线程安全的 MySQL 连接池
+    连接的健康检查由后台线程对空闲连接进行, 借出连接时不再 ping
+    >>> pool = MySqlPool(host='localhost', user='dever', password='dever', db='user', max_size=8)
+    >>> client = MySqlClient(pool=pool)
+    >>> with pool.connection() as conn:
+    ...     conn.cursor().execute('select 1')
+    """
+
+    def __init__(self, host='localhost', port=3306, user=None, password=None, db=None, charset='utf8',
+                 local_infile=False, min_size=1, max_size=10, idle_timeout=300, check_interval=30,
+                 wait_timeout=None, connect_timeout=10):
+        """
+        :param min_size: 保持的最少连接数
+        :param max_size: 最多连接数, 连接全部借出时借用方等待
+        :param idle_timeout: 空闲超过该秒数且连接数多于 min_size 时关闭连接
+        :param check_interval: 后台检查空闲连接的间隔(秒), 空闲超过该时间的连接会被 ping
+        :param wait_timeout: 借用连接的默认最长等待秒数, None 表示一直等待
+        :param connect_timeout: 建立连接的超时秒数, None 表示使用 MySQLdb 的默认值
+        """
+        if not 0 <= min_size <= max_size or max_size < 1:
+            raise ValueError('require 0 <= min_size <= max_size and max_size >= 1')
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.db = db
+        self.charset = charset
+        self.local_infile = local_infile
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.check_interval = check_interval
+        self.wait_timeout = wait_timeout
+        self.connect_timeout = connect_timeout
+
+        self._cond = threading.Condition()
+        self._idle = collections.deque()    # (conn, 归还时间), 右端为最近归还的连接
+        self._size = 0
+        self._closed = False
+        self._stopped = threading.Event()
+        self._stats = dict(acquired=0, waits=0, wait_seconds=0.0, max_wait_seconds=0.0, timeouts=0,
+                           created=0, discarded=0, evicted=0, check_failed=0)
+
+        self._fill()
+        self._checker = threading.Thread(target=self._check_loop, name='mysql-pool-checker')
+        self._checker.daemon = True
+        self._checker.start()
+
+    def _connect(self):
+        kwargs = dict(connect_timeout=self.connect_timeout) if self.connect_timeout is not None else {}
+        conn = MySQLdb.connect(host=self.host, port=self.port, user=self.user, passwd=self.password, db=self.db,
+                               charset=self.charset, local_infile=int(bool(self.local_infile)), **kwargs)
+        with self._cond:
+            self._stats['created'] += 1
+        return conn
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except MySQLdb.MySQLError:
+            pass
+
+    def _fill(self):
+        """补足 min_size 个连接"""
+        while 1:
+            with self._cond:
+                if self._closed or self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                conn = self._connect()
+            except MySQLdb.MySQLError, e:
+                log.error(u'mysql pool connect failed {}'.format(e))
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                return
+            self.release(conn)
+
+    def acquire(self, timeout=None):
+        """借出一个连接, 超过 timeout 秒仍无可用连接时抛出 MySQLError"""
+        timeout = self.wait_timeout if timeout is None else timeout
+        start = time.time()
+        conn = None
+        with self._cond:
+            waited = False
+            while 1:
+                if self._closed:
+                    raise MySQLdb.MySQLError('mysql pool is closed')
+                if self._idle:
+                    conn = self._idle.pop()[0]
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    break
+                remaining = None if timeout is None else start + timeout - time.time()
+                if remaining is not None and remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise MySQLdb.MySQLError('mysql pool wait timeout after {}s'.format(timeout))
+                waited = True
+                self._cond.wait(remaining)
+            self._stats['acquired'] += 1
+            if waited:
+                cost = time.time() - start
+                self._stats['waits'] += 1
+                self._stats['wait_seconds'] += cost
+                self._stats['max_wait_seconds'] = max(self._stats['max_wait_seconds'], cost)
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+        return conn
+
+    def release(self, conn, discard=False):
+        """归还连接, discard 为 True 时直接关闭(如连接已断开)"""
+        with self._cond:
+            if discard or self._closed:
+                self._size -= 1
+                self._stats['discarded'] += 1
+            else:
+                self._idle.append((conn, time.time()))
+                conn = None
+            self._cond.notify()
+        if conn is not None:
+            self._close_quietly(conn)
+
+    @contextlib.contextmanager
+    def connection(self, timeout=None):
+        """
+        借用连接的上下文, 退出时归还; 连接已断开(CONNECTION_LOST_ERRORS)时丢弃该连接,
+        其他错误(如锁等待超时 1205、死锁 1213)回滚后归还, 回滚也失败时丢弃
+        """
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        except MySQLdb.OperationalError, e:
+            if e.args and e.args[0] in CONNECTION_LOST_ERRORS:
+                self.release(conn, discard=True)
+                raise
+            self._rollback_release(conn)
+            raise
+        except BaseException:
+            self._rollback_release(conn)
+            raise
+        else:
+            self.release(conn)
+
+    def _rollback_release(self, conn):
+        """出错后回滚并归还连接, 回滚失败时丢弃连接并抛出回滚的错误"""
+        try:
+            conn.rollback()
+        except MySQLdb.MySQLError:
+            self.release(conn, discard=True)
+            raise
+        self.release(conn)
+
+    def check(self):
+        """关闭空闲过久的多余连接, ping 空闲超过 check_interval 的连接, 并补足 min_size"""
+        now = time.time()
+        with self._cond:
+            keep, stale, evict = collections.deque(), [], []
+            for conn, last_used in self._idle:
+                if now - last_used > self.idle_timeout and self._size - len(evict) > self.min_size:
+                    evict.append(conn)
+                elif now - last_used > self.check_interval:
+                    stale.append(conn)
+                else:
+                    keep.append((conn, last_used))
+            self._idle = keep
+            self._size -= len(evict)
+            self._stats['evicted'] += len(evict)
+
+        for conn in evict:
+            self._close_quietly(conn)
+        for conn in stale:
+            try:
+                conn.ping()
+            except MySQLdb.MySQLError, e:
+                log.error(u'mysql pool health check failed {}'.format(e))
+                with self._cond:
+                    self._stats['check_failed'] += 1
+                self.release(conn, discard=True)
+            else:
+                self.release(conn)
+        self._fill()
+
+    def _check_loop(self):
+        while not self._stopped.wait(self.check_interval):
+            try:
+                self.check()
+            except Exception, e:
+                log.error(u'mysql pool check error {}'.format(e))
+
+    def stats(self):
+        """连接池状态及等待指标"""
+        with self._cond:
+            stats = dict(self._stats, size=self._size, idle=len(self._idle), in_use=self._size - len(self._idle),
+                         min_size=self.min_size, max_size=self.max_size)
+        stats['avg_wait_seconds'] = stats['wait_seconds'] / stats['waits'] if stats['waits'] else 0.0
+        return stats
+
+    def close(self):
+        self._stopped.set()
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, collections.deque()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._close_quietly(conn)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,176 @@
+# coding: utf-8
+
+import re
+import json
+import time
+import logging
+import threading
+import collections
+from base import LRUCache
+
+
+log = logging.getLogger()
+
+# 延迟直方图的桶上界(毫秒), 最后一个桶收集其余所有值
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, float('inf'))
+
+_STRING_PATTERN = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+_NUMBER_PATTERN = re.compile(r'(?<![\w`])-?\d+(?:\.\d+)?(?:e[+-]?\d+)?\b', re.I)
+_IN_LIST_PATTERN = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_SPACE_PATTERN = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """将字符串/数字字面量和 %s 占位符替换为 ?, 合并 in (...) 列表和空白, 用于对同类语句聚合"""
+    sql = _STRING_PATTERN.sub('?', sql)
+    sql = sql.replace('%s', '?')
+    sql = _NUMBER_PATTERN.sub('?', sql)
+    sql = _IN_LIST_PATTERN.sub('(?+)', sql)
+    return _SPACE_PATTERN.sub(' ', sql).strip().lower()
+
+
+def _size(value):
+    if value is None:
+        return 0
+    if isinstance(value, basestring):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(_size(v) for v in value.itervalues())
+    if isinstance(value, (list, tuple)):
+        return sum(_size(v) for v in value)
+    return 8
+
+
+class _StatementStats(object):
+
+    __slots__ = ('kinds', 'count', 'errors', 'rows', 'bytes_sent', 'bytes_received', 'seconds', 'max_seconds',
+                 'buckets', 'sample')
+
+    def __init__(self, sample):
+        self.kinds = collections.Counter()
+        self.count = 0
+        self.errors = 0
+        self.rows = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.buckets = [0] * len(LATENCY_BUCKETS_MS)
+        self.sample = sample
+
+    def percentile(self, p):
+        """按直方图估算百分位延迟(毫秒), 返回所在桶的上界"""
+        if not self.count:
+            return 0
+        target = self.count * p / 100.0
+        total = 0
+        for bound, n in zip(LATENCY_BUCKETS_MS, self.buckets):
+            total += n
+            if total >= target:
+                return bound if bound != float('inf') else self.max_seconds * 1000
+        return self.max_seconds * 1000
+
+    def snapshot(self):
+        return dict(kinds=dict(self.kinds), count=self.count, errors=self.errors, rows=self.rows,
+                    bytes_sent=self.bytes_sent, bytes_received=self.bytes_received,
+                    total_ms=self.seconds * 1000, avg_ms=self.seconds * 1000 / self.count if self.count else 0,
+                    max_ms=self.max_seconds * 1000, p50_ms=self.percentile(50), p95_ms=self.percentile(95),
+                    p99_ms=self.percentile(99), sample=self.sample,
+                    histogram=[('inf' if b == float('inf') else b, n)
+                               for b, n in zip(LATENCY_BUCKETS_MS, self.buckets)])
+
+
+class QueryStats(object):
+    """
+    MySqlClient 的统计钩子, 按语句指纹记录调用次数、行数、延迟直方图和传输字节数, 并记录慢查询
+    >>> stats = QueryStats(slow_ms=500)
+    >>> client = MySqlClient(db='user', instrument=stats)
+    >>> stats.explain(client)    # 按需为慢查询补充 EXPLAIN 结果
+    >>> stats.to_json()
+    """
+
+    def __init__(self, slow_ms=1000, slow_log_size=100, measure_bytes=False, max_statements=1000):
+        """
+        :param slow_ms: 慢查询阈值(毫秒), 为 None 时不记录慢查询
+        :param slow_log_size: 保留最近的慢查询条数
+        :param measure_bytes: 是否估算发送/接收的字节数, 需要遍历参数和结果
+        :param max_statements: 最多统计的语句指纹数, 超出后计入 'other'
+        """
+        self.slow_ms = slow_ms
+        self.measure_bytes = measure_bytes
+        self.max_statements = max_statements
+        self.slow_queries = collections.deque(maxlen=slow_log_size)
+        self._fingerprints = LRUCache(maxsize=4096)
+        self._statements = {}
+        self._lock = threading.Lock()
+        self.started = time.time()
+
+    def fingerprint(self, sql):
+        fp = self._fingerprints.get(sql)
+        if fp is None:
+            fp = self._fingerprints.set(sql, fingerprint(sql))
+        return fp
+
+    def record(self, kind, sql, args, seconds, rows=None, result=None, error=False):
+        """由 MySqlClient 在每条语句结束后调用"""
+        fp = self.fingerprint(sql)
+        sent = received = 0
+        if self.measure_bytes:
+            sent, received = len(sql) + _size(args), _size(result)
+        ms = seconds * 1000
+        index = 0
+        while ms > LATENCY_BUCKETS_MS[index]:
+            index += 1
+        with self._lock:
+            stats = self._statements.get(fp)
+            if stats is None:
+                if len(self._statements) >= self.max_statements:
+                    fp = 'other'
+                    stats = self._statements.get(fp)
+                if stats is None:
+                    stats = self._statements[fp] = _StatementStats(sql)
+            stats.kinds[kind] += 1
+            stats.count += 1
+            stats.errors += 1 if error else 0
+            stats.rows += rows if rows and rows > 0 else 0
+            stats.bytes_sent += sent
+            stats.bytes_received += received
+            stats.seconds += seconds
+            stats.max_seconds = max(stats.max_seconds, seconds)
+            stats.buckets[index] += 1
+        if self.slow_ms is not None and ms >= self.slow_ms:
+            self.slow_queries.append(dict(kind=kind, sql=sql, args=args, ms=ms, rows=rows, error=error,
+                                          time=time.time(), explain=None))
+            log.warning('mysql slow %s %.1fms rows=%r: %r, args=%r' % (kind, ms, rows, sql, args))
+
+    def explain(self, client, limit=None):
+        """对尚未 EXPLAIN 的慢 select 语句执行 EXPLAIN, 结果保存在慢查询记录的 explain 字段"""
+        for item in list(self.slow_queries)[:limit]:
+            if item['explain'] is not None or not item['sql'].lstrip().lower().startswith('select'):
+                continue
+            try:
+                # 直接使用游标, 不经过 instrument 和查询缓存
+                with client.cursor() as (conn, cursor):
+                    cursor.execute('explain ' + item['sql'], item['args'] or None)
+                    item['explain'] = list(cursor.fetchall())
+            except Exception, e:
+                item['explain'] = [dict(error=repr(e))]
+        return list(self.slow_queries)
+
+    def snapshot(self, top=None):
+        """导出统计数据, statements 按总耗时降序, top 限制返回的语句数"""
+        with self._lock:
+            statements = [(fp, stats.snapshot()) for fp, stats in self._statements.iteritems()]
+        statements.sort(key=lambda x: x[1]['total_ms'], reverse=True)
+        return dict(started=self.started, now=time.time(), slow_ms=self.slow_ms,
+                    statements=[dict(s, fingerprint=fp) for fp, s in statements[:top]],
+                    slow_queries=list(self.slow_queries))
+
+    def to_json(self, top=None):
+        return json.dumps(self.snapshot(top=top), default=repr)
+
+    def reset(self):
+        with self._lock:
+            self._statements = {}
+            self.slow_queries.clear()
+            self.started = time.time()
@@ -1,19 +1,164 @@
 # coding: utf-8
 
+import os
 import time
+import array
+import tempfile
+import logging
+import threading
+import operator
+import itertools
+import contextlib
+import collections
+from decimal import Decimal
 import MySQLdb
 import MySQLdb.cursors
-import logging
+from MySQLdb.constants import FIELD_TYPE
+from base import LRUCache, BoundedQueue
+from retrying import Retrying
+from circuit_breaker import CircuitBreaker
+from mysql_pool import CONNECTION_LOST_ERRORS
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 log = logging.getLogger()
 
+# 按列返回结果时, 可推断为整数/浮点数数组的字段类型
+INT_FIELD_TYPES = {FIELD_TYPE.TINY, FIELD_TYPE.SHORT, FIELD_TYPE.INT24, FIELD_TYPE.LONG, FIELD_TYPE.LONGLONG,
+                   FIELD_TYPE.YEAR}
+FLOAT_FIELD_TYPES = {FIELD_TYPE.FLOAT, FIELD_TYPE.DOUBLE}
+
+
+def _chunks(iterable, size):
+    """将可迭代对象按 size 切分为列表, 不会一次性读入全部数据"""
+    iterator = iter(iterable)
+    while 1:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _infer_dtype(description):
+    """根据游标 description 推断列类型, 可为 NULL 的字段不推断"""
+    type_code, null_ok = description[1], description[6]
+    if null_ok:
+        return None
+    if type_code in INT_FIELD_TYPES:
+        return 'i8' if numpy is not None else 'l'
+    if type_code in FLOAT_FIELD_TYPES:
+        return 'f8' if numpy is not None else 'd'
+    return None
+
+
+class _ColumnBuilder(object):
+    """按块累积一列数据, dtype 为 None 时使用 list"""
+
+    def __init__(self, dtype=None):
+        self.dtype = dtype
+        if dtype is None:
+            self._values = []
+        elif numpy is not None:
+            self._values = []    # 每块一个 numpy 数组, 最后拼接
+        else:
+            self._values = array.array(dtype)
+            # 与 numpy 一致, 浮点数列中的 NULL 转为 nan
+            self._cast = (lambda v: float('nan') if v is None else float(v)) if dtype in 'fd' else int
+
+    def extend(self, values):
+        if self.dtype is None:
+            self._values.extend(values)
+        elif numpy is not None:
+            self._values.append(numpy.array(values, dtype=self.dtype))
+        else:
+            self._values.extend(map(self._cast, values))
+
+    def build(self):
+        if self.dtype is not None and numpy is not None:
+            if not self._values:
+                return numpy.empty(0, dtype=self.dtype)
+            return numpy.concatenate(self._values)
+        return self._values
+
+
+# MySQLdb 转义字符串参数时前面加反斜杠的字符
+_ESCAPED_CHARS = '\\\'"\0\n\r\x1a'
+# LOAD DATA LOCAL INFILE 被客户端或服务端禁用时的错误码
+LOCAL_INFILE_DISABLED_ERRORS = (1148, 2068, 3948)
+
+
+def _escape_field(value, delimiter, charset):
+    """按 LOAD DATA 默认的转义规则(ESCAPED BY '\\\\')序列化字段, delimiter 为单个字符"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, unicode):
+        value = value.encode(charset)
+    elif not isinstance(value, str):
+        value = str(value)
+    return value.replace('\\', '\\\\').replace(delimiter, '\\' + delimiter) \
+        .replace('\n', '\\n').replace('\r', '\\r')
+
+
+def _split_fields(line, delimiter):
+    """_escape_field 的逆过程, 将文件中的一行拆分为字段列表"""
+    if '\\' not in line:
+        return line.split(delimiter)
+    escapes = {'n': '\n', 'r': '\r', 't': '\t', '0': '\0'}
+    fields, chars, index = [], [], 0
+    while index < len(line):
+        c = line[index]
+        if c == '\\' and index + 1 < len(line):
+            index += 1
+            c = line[index]
+            if c == 'N' and not chars and line[index + 1:index + 1 + len(delimiter)] in ('', delimiter):
+                chars = None
+            else:
+                chars.append(escapes.get(c, c))
+        elif line.startswith(delimiter, index):
+            fields.append(None if chars is None else ''.join(chars))
+            chars = []
+            index += len(delimiter)
+            continue
+        else:
+            chars.append(c)
+        index += 1
+    fields.append(None if chars is None else ''.join(chars))
+    return fields
+
+
+class CircuitOpenError(MySQLdb.OperationalError):
+    """熔断器打开, 连接请求被直接拒绝"""
+
 
 class MySqlClient(object):
+    """
+    MySQL 客户端, 默认独占一个连接; 传入 pool(MySqlPool) 时每条语句从连接池借用连接, 连接参数以连接池为准
+    """
 
     MySQLError = MySQLdb.MySQLError
 
-    def __init__(self, host='localhost', port=3306, user=None, password=None, db=None, charset='utf8', max_retry=0):
+    def __init__(self, host='localhost', port=3306, user=None, password=None, db=None, charset='utf8', max_retry=0,
+                 local_infile=False, pool=None, cache=None, instrument=None, breaker=None, ping_interval=30,
+                 connect_timeout=10, retry_wait_ms=100, retry_wait_max_ms=10000, retry_jitter_ms=500,
+                 pool_timeout=None):
+        """
+        :param max_retry: 连接失败后的最多重试次数, 0 表示一直重试, 直到熔断器打开
+        :param breaker: CircuitBreaker, 默认每个客户端新建一个, clone() 出的客户端共用;
+            连续连接失败后打开, 打开期间 connect 直接抛出 CircuitOpenError, 不再等待
+        :param ping_interval: 连接空闲超过该秒数后, 执行语句前才 ping 一次
+        :param connect_timeout: 建立连接的超时秒数
+        :param retry_wait_ms: 重试间隔的指数退避基数(毫秒), 第 n 次重试前等待 retry_wait_ms * 2 ** (n - 1)
+        :param retry_wait_max_ms: 重试间隔上限(毫秒)
+        :param retry_jitter_ms: 重试间隔上附加的随机抖动上限(毫秒), 避免多个客户端同时重连
+        :param pool_timeout: 从连接池借用连接的最长等待秒数, 默认使用连接池的 wait_timeout
+        """
+        if pool is not None:
+            host, port, user, password, db = pool.host, pool.port, pool.user, pool.password, pool.db
+            charset, local_infile = pool.charset, pool.local_infile
         self.host = host
         self.port = port
         self.user = user
@@ -21,102 +166,539 @@ class MySqlClient(object):
         self.db = db
         self.charset = charset
         self.max_retry = max_retry
+        self.local_infile = local_infile
+        self.pool = pool
+        self.cache = cache
+        self.instrument = instrument
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self.ping_interval = ping_interval
+        self.connect_timeout = connect_timeout
+        self.retry_wait_ms = retry_wait_ms
+        self.retry_wait_max_ms = retry_wait_max_ms
+        self.retry_jitter_ms = retry_jitter_ms
+        self.pool_timeout = pool_timeout
+        self._retrying = Retrying(stop_max_attempt_number=max_retry + 1 if max_retry > 0 else None,
+                                  wait_exponential_multiplier=retry_wait_ms / 2.0,
+                                  wait_exponential_max=retry_wait_max_ms, wait_jitter_max=retry_jitter_ms,
+                                  retry_on_exception=self._should_retry)
 
         self._conn = None
-        self._cursor = None
+        self._last_used = 0
         self.connect()
 
     def clone(self):
         return MySqlClient(host=self.host, port=self.port, user=self.user, password=self.password, db=self.db,
-                           charset=self.charset)
+                           charset=self.charset, max_retry=self.max_retry, local_infile=self.local_infile,
+                           pool=self.pool, cache=self.cache, instrument=self.instrument, breaker=self.breaker,
+                           ping_interval=self.ping_interval, connect_timeout=self.connect_timeout,
+                           retry_wait_ms=self.retry_wait_ms, retry_wait_max_ms=self.retry_wait_max_ms,
+                           retry_jitter_ms=self.retry_jitter_ms, pool_timeout=self.pool_timeout)
 
     def __del__(self):
         self.close()
 
     def close(self):
-        if self._cursor:
-            self._cursor.close()
-            self._cursor = None
         if self._conn:
-            self._conn.close()
-            self._conn = None
+            conn, self._conn = self._conn, None
+            conn.close()
 
     def connect(self):
-        count = 0
-        while 1:
-            if self._conn:
+        """
+        确保连接可用: 连接空闲未超过 ping_interval 时直接使用, 否则 ping 一次, 失败则按指数退避重连
+        熔断器打开时立即抛出 CircuitOpenError
+        """
+        if self.pool is not None:
+            return
+        if self._conn:
+            if time.time() - self._last_used < self.ping_interval:
+                return
+            try:
+                self._conn.ping()
+                self._last_used = time.time()
+                return
+            except MySQLdb.MySQLError:
+                self._discard()
+        self._retrying.call(self._reconnect)
+
+    @staticmethod
+    def _should_retry(e):
+        return isinstance(e, MySQLdb.MySQLError) and not isinstance(e, CircuitOpenError)
+
+    def _reconnect(self, attempt_number=1):
+        if not self.breaker.allow():
+            raise CircuitOpenError('mysql {}:{} circuit breaker is open'.format(self.host, self.port))
+        try:
+            self._conn = MySQLdb.connect(host=self.host, port=self.port, user=self.user,
+                                         passwd=self.password, db=self.db, charset=self.charset,
+                                         local_infile=int(bool(self.local_infile)),
+                                         connect_timeout=self.connect_timeout)
+        except MySQLdb.MySQLError, e:
+            self.breaker.failure()
+            log.error(u'reconnect failed (attempt {}) {}'.format(attempt_number, e))
+            raise
+        self.breaker.success()
+        self._last_used = time.time()
+
+    def _discard(self):
+        """丢弃已断开的连接, 下次执行语句时重连"""
+        try:
+            self.close()
+        except MySQLdb.MySQLError:
+            pass
+        self._conn = None
+
+    @contextlib.contextmanager
+    def cursor(self, cursorclass=MySQLdb.cursors.DictCursor):
+        """获取连接和游标 (conn, cursor), 使用连接池时退出后归还连接; 出错时回滚"""
+        if self.pool is None:
+            self.connect()
+            conn = self._conn
+            cursor = conn.cursor(cursorclass)
+            try:
+                yield conn, cursor
+            except MySQLdb.OperationalError, e:
+                if e.args and e.args[0] in CONNECTION_LOST_ERRORS:
+                    self._discard()
+                else:
+                    self._rollback(conn)
+                raise
+            except BaseException:
+                self._rollback(conn)
+                raise
+            else:
+                self._last_used = time.time()
+            finally:
                 try:
-                    return self._conn.ping()
+                    cursor.close()
                 except MySQLdb.MySQLError:
                     pass
+        else:
+            with self.pool.connection(self.pool_timeout) as conn:
+                cursor = conn.cursor(cursorclass)
                 try:
-                    self.close()
-                except MySQLdb.MySQLError:
-                    pass
-            try:
-                count += 1
-                self._conn = MySQLdb.connect(host=self.host, port=self.port, user=self.user,
-                                             passwd=self.password, db=self.db, charset=self.charset)
-                self._cursor = self._conn.cursor(MySQLdb.cursors.DictCursor)
-            except MySQLdb.MySQLError, e:
-                log.error(u'reconnect failed {}'.format(e))
-                if 0 < self.max_retry < count:
-                    raise MySQLdb.MySQLError('connection failed')
-                time.sleep(5)
+                    yield conn, cursor
+                finally:
+                    cursor.close()
+
+    @staticmethod
+    def _rollback(conn):
+        try:
+            conn.rollback()
+        except MySQLdb.MySQLError:
+            pass
+
+    @contextlib.contextmanager
+    def _measure(self, kind, sql, args):
+        """将语句耗时、行数等交给 instrument 统计, 语句内通过 yield 的 dict 设置 rows 和 result"""
+        record = {}
+        if self.instrument is None:
+            yield record
+            return
+        start = time.time()
+        error = False
+        try:
+            yield record
+        except GeneratorExit:
+            raise
+        except BaseException:
+            error = True
+            raise
+        finally:
+            self.instrument.record(kind, sql, args, time.time() - start, record.get('rows'), record.get('result'),
+                                   error)
+
+    def _execute(self, sql, args, fetch=None, kind='execute'):
+        with self._measure(kind, sql, args) as record:
+            with self.cursor() as (conn, cursor):
+                cursor.execute(sql, args or None)
+                result = fetch(cursor) if fetch else True
+                conn.commit()
+            if fetch:
+                record['rows'] = len(result) if isinstance(result, (list, tuple)) else int(result is not None)
+                record['result'] = result
+            else:
+                record['rows'] = cursor.rowcount
+            return result
+
+    def _cached_execute(self, kind, sql, args, fetch):
+        if self.cache is None:
+            return self._execute(sql, args, fetch, kind)
+        hit, result = self.cache.get(kind, sql, args)
+        if hit:
+            return result
+        # 查询期间其他线程写入了涉及的表时, 查到的可能是旧数据, 不缓存
+        generation = self.cache.generation(sql)
+        result = self._execute(sql, args, fetch, kind)
+        return self.cache.set(kind, sql, args, result, generation)
+
+    def _invalidate(self, sql):
+        """写入成功后使查询缓存中涉及的表失效"""
+        if self.cache is not None:
+            self.cache.invalidate(sql)
 
     def query(self, sql, *args):
         try:
-            self.execute(sql, *args)
-            return self._cursor.fetchall()
+            return self._cached_execute('query', sql, args, lambda cursor: cursor.fetchall())
         except Exception, e:
             log.error('mysql client query %r, args=%r. error %r' % (sql, args, e))
             return None
 
     def first(self, sql, *args):
         try:
-            self.execute(sql, *args)
-            return self._cursor.fetchone()
+            return self._cached_execute('first', sql, args, lambda cursor: cursor.fetchone())
         except Exception, e:
             log.error('mysql client first %r, args=%r. error %r' % (sql, args, e))
             return None
 
     def execute(self, sql, *args):
-        self.connect()
         try:
-            args = args or None
-            self._cursor.execute(sql, args)
-            self._conn.commit()
-            return True
+            result = self._execute(sql, args)
         except Exception, e:
             log.error('mysql client execute %r, args=%r. error %r' % (sql, args, e))
             raise
+        self._invalidate(sql)
+        return result
+
+    @contextlib.contextmanager
+    def batch(self, max_statements=100, max_ms=200):
+        """
+        批量写入事务, 将多条语句合并为少量提交; 默认的 execute 仍然每条语句提交一次
+        语句在同一连接上立即执行但不提交, 每累计 max_statements 条, 或写入时距本组第一条已超过 max_ms 毫秒, 提交一次;
+        正常退出时提交剩余语句, 出错时回滚尚未提交的语句(已提交的组不受影响)
+        >>> with client.batch(max_statements=500) as batch:
+        ...     for row in rows:
+        ...         batch.execute(*SQL.insert('position_new', **row))
+        :param max_statements: 每组最多语句数
+        :param max_ms: 每组最长持续时间(毫秒), 为 None 时不按时间提交
+        """
+        with self.cursor() as (conn, cursor):
+            batch = MySqlBatch(self, conn, cursor, max_statements=max_statements, max_ms=max_ms)
+            try:
+                yield batch
+            except BaseException:
+                # 连接由 cursor() 回滚或丢弃, 这里只记录未提交的语句
+                batch.discard()
+                raise
+            batch.commit()
 
     def iter_query(self, sql, *args):
-        self.connect()
-        cursor = self._conn.cursor(MySQLdb.cursors.SSDictCursor)
         try:
-            args = args or None
-            cursor.execute(sql, args)
-            for item in cursor:
-                yield item
-                del item
-            self._conn.commit()
+            with self._measure('iter_query', sql, args) as record, \
+                    self.cursor(MySQLdb.cursors.SSDictCursor) as (conn, cursor):
+                args = args or None
+                cursor.execute(sql, args)
+                record['rows'] = 0
+                for item in cursor:
+                    record['rows'] += 1
+                    yield item
+                    del item
+                conn.commit()
+        except Exception, e:
+            log.error('mysql client query %r, args=%r. error %r' % (sql, args, e))
+            raise
+
+    def _iter_chunks(self, sql, args, chunk_size, cursorclass=MySQLdb.cursors.SSCursor, empty=False):
+        """
+        使用服务端游标按 fetchmany(chunk_size) 分块读取, 返回 (description, rows)
+        :param empty: 结果为空时也返回一次 (description, []), 供调用方取得字段
+        """
+        with self.cursor(cursorclass) as (conn, cursor):
+            cursor.execute(sql, args or None)
+            while 1:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                empty = False
+                yield cursor.description, rows
+            if empty:
+                yield cursor.description, []
+            conn.commit()
+
+    def stream_query(self, sql, *args, **kwargs):
+        """
+        流式读取查询结果: 后台线程通过服务端游标 fetchmany 分块读取并放入有界队列, 读取网络数据与调用方处理并行
+        提前结束迭代(break 或 close())时, 后台线程停止读取, 关闭游标(丢弃剩余行)并释放连接
+        未使用连接池时, 迭代结束前不要在其他线程使用该 client
+        :param chunk_size: 每次 fetchmany 的行数, 默认 1000
+        :param prefetch: 队列中最多缓存的块数, 默认 4
+        :param transform: 行转换函数, 在后台线程中对每行调用, 返回值代替原行
+        :param cursorclass: 游标类型, 默认 SSDictCursor
+        """
+        chunk_size = kwargs.get('chunk_size', 1000)
+        transform = kwargs.get('transform')
+        cursorclass = kwargs.get('cursorclass', MySQLdb.cursors.SSDictCursor)
+        queue = BoundedQueue(max(1, kwargs.get('prefetch', 4)), name='mysql-stream-query')
+
+        def _producer():
+            chunks = self._iter_chunks(sql, args, chunk_size, cursorclass)
+            try:
+                for _, rows in chunks:
+                    if transform is not None:
+                        rows = map(transform, rows)
+                    if not queue.put(rows):
+                        break
+            finally:
+                chunks.close()
+
+        queue.start(_producer)
+        try:
+            with self._measure('stream_query', sql, args) as record:
+                record['rows'] = 0
+                for rows in queue:
+                    record['rows'] += len(rows)
+                    for row in rows:
+                        yield row
         except Exception, e:
             log.error('mysql client query %r, args=%r. error %r' % (sql, args, e))
             raise
         finally:
-            cursor.close()
+            queue.close()
+
+    def query_tuples(self, sql, *args):
+        """
+        以 tuple 返回查询结果, 所有行共用一个字段名元组, 比 dict 节省内存
+        :return: (columns, rows), 出错时同 query 返回 None
+        """
+        try:
+            with self.cursor(MySQLdb.cursors.Cursor) as (conn, cursor):
+                cursor.execute(sql, args or None)
+                rows = cursor.fetchall()
+                conn.commit()
+                return tuple(d[0] for d in cursor.description or ()), rows
+        except Exception, e:
+            log.error('mysql client query %r, args=%r. error %r' % (sql, args, e))
+            return None
+
+    def iter_query_chunks(self, sql, *args, **kwargs):
+        """
+        使用服务端游标分块读取, 每块为 (columns, rows), rows 为不超过 chunk_size 个 tuple
+        :param chunk_size: 每块行数, 默认 10000
+        """
+        try:
+            for description, rows in self._iter_chunks(sql, args, kwargs.get('chunk_size', 10000)):
+                yield tuple(d[0] for d in description), rows
+        except Exception, e:
+            log.error('mysql client query %r, args=%r. error %r' % (sql, args, e))
+            raise
+
+    def query_columns(self, sql, *args, **kwargs):
+        """
+        按列返回查询结果 OrderedDict(字段名 -> 列), 分块读取服务端游标并填充到类型化数组
+        :param dtypes: dict 字段名 -> numpy dtype(未安装 numpy 时为 array.array 类型码);
+                       未指定时, 非空的整数/浮点数字段推断为 int64/float64, 其余字段为 list
+        :param chunk_size: 每次 fetchmany 的行数, 默认 10000
+        结果为空时仍按 description 返回所有字段, 每列为空的 list(或对应类型的空数组)
+        """
+        dtypes = kwargs.get('dtypes') or {}
+        columns = None
+        try:
+            for description, rows in self._iter_chunks(sql, args, kwargs.get('chunk_size', 10000), empty=True):
+                if columns is None:
+                    columns = collections.OrderedDict(
+                        (d[0], _ColumnBuilder(dtypes.get(d[0], _infer_dtype(d)))) for d in description or ())
+                for builder, values in itertools.izip(columns.itervalues(), itertools.izip(*rows)):
+                    builder.extend(values)
+        except Exception, e:
+            log.error('mysql client query %r, args=%r. error %r' % (sql, args, e))
+            raise
+        return collections.OrderedDict((k, builder.build()) for k, builder in (columns or {}).iteritems())
 
     def insert_many(self, sql, *values):
-        self.connect()
         try:
-            values = values or None
-            self._cursor.executemany(sql, values)
-            self._conn.commit()
-            return True
+            with self._measure('insert_many', sql, values) as record, self.cursor() as (conn, cursor):
+                cursor.executemany(sql, values or None)
+                conn.commit()
+                record['rows'] = len(values)
         except MySQLdb.MySQLError, e:
             log.error('insert many error, sql, e = {}'.format((sql, e)))
             raise
+        self._invalidate(sql)
+        return True
+
+    def bulk_insert(self, sql, rows, chunk_size=1000, workers=4):
+        """
+        将 rows 按 chunk_size 切块, 通过 workers 个 clone() 出的连接并发写入, 每块单独提交
+        :param sql: insert 语句, 同 insert_many
+        :param rows: 可迭代的参数序列, 按块读取, 不会一次性载入内存
+        :param chunk_size: 每块行数
+        :param workers: 并发连接数
+        :return: dict(rows, chunks, errors, seconds, rows_per_second), errors 为按块序号排序的 [(index, error)]
+        写入出现 MySQLError 以外的异常(如参数个数不对)时, 停止读取 rows, 等待已取出的块写完后抛出第一个异常
+        """
+        # 连接在主线程中建立, 连接失败直接抛给调用方
+        clients = [self.clone() for _ in xrange(max(1, workers))]
+        chunks = enumerate(_chunks(rows, chunk_size))
+        lock = threading.Lock()
+        results = BoundedQueue(len(clients) * 2, name='mysql-bulk-insert')
+        result = dict(rows=0, chunks=0, errors=[])
+
+        def _worker(client):
+            """各 worker 在锁内依次读取 rows 中的下一块, 写入结果 (index, rows, error)"""
+            while not results.stopped:
+                with lock:
+                    item = next(chunks, None)
+                if item is None:
+                    return
+                index, chunk = item
+                try:
+                    client.insert_many(sql, *chunk)
+                except MySQLdb.MySQLError, e:
+                    results.put((index, 0, e))
+                else:
+                    results.put((index, len(chunk), None))
+
+        for client in clients:
+            results.start(_worker, args=(client,))
+        start = time.time()
+        try:
+            for index, count, error in results:
+                result['chunks'] += 1
+                result['rows'] += count
+                if error is not None:
+                    result['errors'].append((index, error))
+        except Exception, e:
+            log.error('mysql client bulk insert {!r} failed, {}'.format(sql, e))
+            raise
+        finally:
+            results.close()
+            for client in clients:
+                client.close()
+
+        result['errors'].sort(key=lambda x: x[0])
+        result['seconds'] = time.time() - start
+        result['rows_per_second'] = result['rows'] / result['seconds'] if result['seconds'] else 0
+        log.info('mysql client bulk insert {rows} rows in {chunks} chunks, {seconds:.2f}s, '
+                 '{rows_per_second:.0f} rows/s, {failed} chunks failed'.format(failed=len(result['errors']), **result))
+        return result
+
+    def load_file(self, table, path, columns, delimiter='\t', ignore_lines=0, chunk_size=1000):
+        """
+        使用 LOAD DATA LOCAL INFILE 批量导入数据, local_infile 被禁用时自动改用多行 values 插入
+        :param table: 表名
+        :param path: 文件路径, 或可迭代的行数据(先写入临时文件再导入)
+        :param columns: 文件中各列对应的字段
+        :param delimiter: 字段分隔符, 只支持单个字符
+        :param ignore_lines: 跳过文件开头的行数(如表头)
+        :param chunk_size: 回退为 insert 时每条语句包含的行数
+        :return: 导入的行数
+        """
+        # 多字符分隔符的转义和拆分规则与 LOAD DATA 不一致(如 '||' 中的单个 '|'), 直接拒绝
+        if len(delimiter) != 1 or delimiter in '\\\n\r':
+            raise ValueError('delimiter must be a single character other than backslash and newline, got {!r}'
+                             .format(delimiter))
+        if isinstance(path, basestring):
+            return self._load_file(table, path, columns, delimiter, ignore_lines, chunk_size)
+
+        fd, tmp_path = tempfile.mkstemp(prefix='load_{}_'.format(table), suffix='.tsv')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for row in path:
+                    f.write(delimiter.join(_escape_field(v, delimiter, self.charset) for v in row))
+                    f.write('\n')
+            return self._load_file(table, tmp_path, columns, delimiter, 0, chunk_size)
+        finally:
+            os.remove(tmp_path)
+
+    def _load_file(self, table, path, columns, delimiter, ignore_lines, chunk_size):
+        if self.local_infile:
+            sql = "load data local infile %s into table `{table}` character set {charset} " \
+                  "fields terminated by %s escaped by '\\\\' lines terminated by '\\n' " \
+                  "ignore {ignore_lines} lines ({columns})" \
+                  "".format(table=table, charset=self.charset, ignore_lines=int(ignore_lines),
+                            columns=', '.join(map(lambda k: '`{}`'.format(k), columns)))
+            try:
+                with self._measure('load_file', sql, (path, delimiter)) as record, self.cursor() as (conn, cursor):
+                    count = record['rows'] = cursor.execute(sql, (path, delimiter))
+                    conn.commit()
+                self._invalidate(sql)
+                return count
+            except MySQLdb.MySQLError, e:
+                if not e.args or e.args[0] not in LOCAL_INFILE_DISABLED_ERRORS:
+                    log.error('mysql client load file %r into %r. error %r' % (path, table, e))
+                    raise
+                log.warning('local_infile is disabled, load %r into %r with insert. %r' % (path, table, e))
+
+        def _rows():
+            with open(path, 'rb') as f:
+                for line in itertools.islice(f, ignore_lines, None):
+                    line = line.rstrip('\r\n')
+                    if line:
+                        yield _split_fields(line, delimiter)
+
+        count = 0
+        head = 'insert into `{table}` ({columns}) '.format(
+            table=table, columns=', '.join(map(lambda k: '`{}`'.format(k), columns)))
+        for chunk in _chunks(_rows(), chunk_size):
+            for sql, params in SQL.split_values(head, '', len(columns), chunk):
+                self.execute(sql, *params)
+            count += len(chunk)
+        return count
+
+
+class MySqlBatch(object):
+    """MySqlClient.batch() 返回的批量写入事务, 接口同 MySqlClient.execute / insert_many"""
+
+    def __init__(self, client, conn, cursor, max_statements=100, max_ms=200):
+        self.client = client
+        self.conn = conn
+        self.cursor = cursor
+        self.max_statements = max_statements
+        self.max_ms = max_ms
+        self.statements = 0
+        self.commits = 0
+        self.rolled_back = 0
+        self._pending = []
+        self._started = None
+
+    def execute(self, sql, *args):
+        with self.client._measure('batch_execute', sql, args) as record:
+            self.cursor.execute(sql, args or None)
+            record['rows'] = self.cursor.rowcount
+        self._added(sql)
+        return True
+
+    def insert_many(self, sql, *values):
+        with self.client._measure('batch_insert_many', sql, values) as record:
+            self.cursor.executemany(sql, values or None)
+            record['rows'] = len(values)
+        self._added(sql)
+        return True
+
+    def _added(self, sql):
+        if not self._pending:
+            self._started = time.time()
+        self._pending.append(sql)
+        if len(self._pending) >= self.max_statements or \
+                (self.max_ms is not None and (time.time() - self._started) * 1000 >= self.max_ms):
+            self.commit()
+
+    @property
+    def pending(self):
+        """尚未提交的语句数"""
+        return len(self._pending)
+
+    def commit(self):
+        """提交当前组, 并使查询缓存中涉及的表失效"""
+        if not self._pending:
+            return
+        with self.client._measure('commit', 'commit', None) as record:
+            self.conn.commit()
+            record['rows'] = len(self._pending)
+        pending, self._pending = self._pending, []
+        self.statements += len(pending)
+        self.commits += 1
+        for sql in set(pending):
+            self.client._invalidate(sql)
+
+    def rollback(self):
+        """回滚当前组"""
+        self.client._rollback(self.conn)
+        self.discard()
+
+    def discard(self):
+        """丢弃当前组的记录, 不回滚连接"""
+        self.rolled_back += len(self._pending)
+        self._pending = []
 
 
 class SqlTool(object):
@@ -145,27 +727,250 @@ class SqlTool(object):
     @property
     def update_query(self):
         """返回更新语句和参数"""
-        update = ', '.join(map(lambda x: '{k} = %s'.format(k=x), self._columns))
-        primary = ' and '.join(map(lambda x: '{k} = %s'.format(k=x), self._primary_keys))
-        params = (map(lambda x: self._values.get(x), self._columns) +
-                  map(lambda x: self._values.get(x), self._primary_keys))
-
-        return 'update {table_name} set {update} where {primary} ' \
-               ''.format(table_name=self._table_name, update=update, primary=primary), tuple(params)
+        sql, params = _compiled(_compile_tool_update, self._table_name, tuple(self._columns),
+                                tuple(self._primary_keys))
+        return sql, params(self._values)
 
     @property
     def insert_query(self):
-        """返回插入语句和参数"""
-        keys = set(self._columns + self._primary_keys)
-        columns = ', '.join(keys)
-        values = ', '.join(['%s'] * len(keys))
-        params = map(lambda x: self._values.get(x), keys)
-        return 'insert into {table_name}({columns}) values ({values})' \
-               ''.format(table_name=self._table_name, columns=columns, values=values), tuple(params)
+        """返回插入语句和参数, 字段按名称排序"""
+        sql, params = _compiled(_compile_tool_insert, self._table_name,
+                                tuple(sorted(set(self._columns + self._primary_keys))))
+        return sql, params(self._values)
+
+
+# 已编译语句的缓存, key 为 (编译函数, 表名, 字段...), value 为 (sql 模板, 参数提取函数)
+statement_cache = LRUCache(maxsize=1024)
+
+
+def _compiled(compile_func, *args):
+    """返回缓存的 (sql, params_func), 未命中时调用 compile_func(*args) 编译"""
+    key = (compile_func,) + args
+    compiled = statement_cache.get(key)
+    if compiled is None:
+        compiled = statement_cache.set(key, compile_func(*args))
+    return compiled
+
+
+def _getter(columns, strict=True):
+    """返回按 columns 顺序从 dict 中取值组成 tuple 的函数, strict 为 False 时缺失的字段取 None"""
+    if not strict:
+        return lambda d: tuple(map(d.get, columns))
+    if len(columns) == 1:
+        key = columns[0]
+        return lambda d: (d[key],)
+    if not columns:
+        return lambda d: ()
+    return operator.itemgetter(*columns)
+
+
+def _quote_columns(columns, sep=', ', fmt='`{}`'):
+    return sep.join(map(lambda k: fmt.format(k), columns))
+
+
+def _compile_insert(table_name, columns):
+    sql = 'insert into `{table_name}` ({columns}) values({params})' \
+          ''.format(table_name=table_name, columns=_quote_columns(columns), params=', '.join(['%s'] * len(columns)))
+    return sql, _getter(columns)
+
+
+def _compile_upsert(table_name, columns):
+    sql = 'insert into `{table_name}` ({columns}) values({params}) ' \
+          'on duplicate key update {set_columns}' \
+          ''.format(table_name=table_name,
+                    columns=_quote_columns(columns),
+                    params=', '.join(['%s'] * len(columns)),
+                    set_columns=_quote_columns(columns, fmt='`{}` = %s'))
+    getter = _getter(columns)
+    return sql, lambda d: getter(d) * 2
+
+
+def _compile_update(table_name, set_columns, where_columns):
+    sql = 'update `{table_name}` set {set_columns} where {where_columns}'.format(
+        table_name=table_name,
+        set_columns=_quote_columns(set_columns, fmt='`{}` = %s'),
+        where_columns=_quote_columns(where_columns, sep=' and ', fmt='`{}` = %s')
+    )
+    set_getter, where_getter = _getter(set_columns), _getter(where_columns)
+    return sql, lambda values, where: set_getter(values) + where_getter(where)
+
+
+def _compile_delete(table_name, where_columns):
+    sql = 'delete from `{table_name}` where {where_columns}'.format(
+        table_name=table_name,
+        where_columns=_quote_columns(where_columns, sep=' and ', fmt='`{}` = %s')
+    )
+    return sql, _getter(where_columns)
+
+
+def _compile_select(table_name, columns, where_columns):
+    sql = 'select {columns} from `{table_name}` where {where}'.format(
+        columns=', '.join(columns),
+        table_name=table_name,
+        where=_quote_columns(where_columns, sep=' and ', fmt='`{}` = %s')
+    )
+    return sql, _getter(where_columns)
+
+
+def _compile_update_insert(table_name, insert_columns, upsert_columns):
+    sql = 'insert into `{table_name}` ({columns}) values({params}) ' \
+          'on duplicate key update {set_columns}' \
+          ''.format(table_name=table_name,
+                    columns=_quote_columns(insert_columns),
+                    params=', '.join(['%s'] * len(insert_columns)),
+                    set_columns=_quote_columns(upsert_columns, fmt='`{}` = %s'))
+    insert_getter, upsert_getter = _getter(insert_columns), _getter(upsert_columns)
+    return sql, lambda d: insert_getter(d) + upsert_getter(d)
+
+
+def _compile_tool_update(table_name, columns, primary_keys):
+    sql = 'update {table_name} set {update} where {primary} ' \
+          ''.format(table_name=table_name, update=_quote_columns(columns, fmt='{} = %s'),
+                    primary=_quote_columns(primary_keys, sep=' and ', fmt='{} = %s'))
+    return sql, _getter(columns + primary_keys, strict=False)
+
+
+def _compile_tool_insert(table_name, columns):
+    sql = 'insert into {table_name}({columns}) values ({values})' \
+          ''.format(table_name=table_name, columns=', '.join(columns), values=', '.join(['%s'] * len(columns)))
+    return sql, _getter(columns, strict=False)
+
+
+def _value_size(value):
+    """
+    估算参数转义后在 sql 语句中占用的字节数, 不小于实际字节数
+    str 按转义后的长度计算: 引号、反斜杠、NUL 等字符转义后占两个字节;
+    unicode 每个字符按 3 字节计算, 需要转义的都是 ASCII 字符, 转义后也不超过 3 字节
+    """
+    if value is None:
+        return 4
+    if isinstance(value, str):
+        return len(value) + sum(value.count(c) for c in _ESCAPED_CHARS) + 2
+    if isinstance(value, unicode):
+        return len(value) * 3 + 2
+    if isinstance(value, (bool, int, long, float)):
+        return 24
+    if isinstance(value, Decimal):
+        return len(str(value))
+    return len(str(value)) + 2
 
 
 class SQL(object):
 
+    # 单条语句的字节数上限, 应不大于服务端的 max_allowed_packet
+    max_packet = 4 * 1024 * 1024
+    # 单条语句的参数个数上限
+    max_params = 65535
+
+    @classmethod
+    def split_values(cls, head, tail, width, rows, max_packet=None, max_params=None):
+        """
+        将多行参数拼接为若干条 `head values (...), (...) tail` 语句, 每条语句不超过 max_packet 字节和 max_params 个参数
+        :param head: values 之前的语句, 如 'insert into `t` (`a`, `b`) '
+        :param tail: values 之后的语句, 如 on duplicate key update 子句
+        :param width: 每行参数个数
+        :param rows: 可迭代的参数序列
+        :return: [(sql, params), ...]
+        """
+        max_packet = max_packet or cls.max_packet
+        max_rows = max(1, (max_params or cls.max_params) // width)
+        row_sql = '({})'.format(', '.join(['%s'] * width))
+        base_size = len(head) + len(tail) + 8
+        statements = []
+
+        def _statement(count, params):
+            return '{head}values {values}{tail}'.format(head=head, values=', '.join([row_sql] * count),
+                                                        tail=tail), tuple(params)
+
+        params, count, size = [], 0, base_size
+        for row in rows:
+            if len(row) != width:
+                raise ValueError('row {!r} should have {} values'.format(row, width))
+            row_size = sum(map(_value_size, row)) + 2 * width + 4
+            if count and (count >= max_rows or size + row_size > max_packet):
+                statements.append(_statement(count, params))
+                params, count, size = [], 0, base_size
+            params.extend(row)
+            count += 1
+            size += row_size
+        if count:
+            statements.append(_statement(count, params))
+        return statements
+
+    @classmethod
+    def _batch_rows(cls, table_name, rows):
+        if not isinstance(table_name, str):
+            raise TypeError('table_name must be string')
+        if not rows:
+            raise ValueError('need at least one row')
+        columns = sorted(rows[0].keys())
+        if not columns:
+            raise ValueError('need at least one filed value')
+        try:
+            values = [tuple(row[k] for k in columns) if len(row) == len(columns) else None for row in rows]
+        except KeyError:
+            values = [None]
+        if None in values:
+            raise ValueError('all rows must have the same columns {!r}'.format(columns))
+        return columns, values
+
+    @classmethod
+    def insert_many(cls, table_name, rows, max_packet=None, max_params=None):
+        """
+        构造多行 insert 语句, 超过 max_packet 或 max_params 时拆分为多条
+        :param table_name: 数据库表名
+        :param rows: list of dict, 每行字段相同
+        :return: [(sql, params), ...]
+        >>> SQL.insert_many('table_name', [dict(id=1, db='mysql'), dict(id=2, db='redis')])
+        [('insert into `table_name` (`db`, `id`) values (%s, %s), (%s, %s)', ('mysql', 1, 'redis', 2))]
+        """
+        columns, values = cls._batch_rows(table_name, rows)
+        head = 'insert into `{table_name}` ({columns}) '.format(
+            table_name=table_name, columns=', '.join(map(lambda k: '`{}`'.format(k), columns)))
+        return cls.split_values(head, '', len(columns), values, max_packet=max_packet, max_params=max_params)
+
+    @classmethod
+    def upsert_many(cls, table_name, rows, max_packet=None, max_params=None):
+        """
+        构造多行 upsert 语句, 冲突时更新全部字段
+        :param table_name: 数据库表名
+        :param rows: list of dict, 每行字段相同
+        :return: [(sql, params), ...]
+        >>> SQL.upsert_many('table_name', [dict(id=1, db='mysql'), dict(id=2, db='redis')])
+        [('insert into `table_name` (`db`, `id`) values (%s, %s), (%s, %s) on duplicate key update
+        `db` = values(`db`), `id` = values(`id`)', ('mysql', 1, 'redis', 2))]
+        """
+        columns, values = cls._batch_rows(table_name, rows)
+        return cls._upsert_many(table_name, columns, columns, values, max_packet, max_params)
+
+    @classmethod
+    def update_insert_many(cls, table_name, duplicate, rows, max_packet=None, max_params=None):
+        """
+        构造多行 update_insert 语句, 冲突时只更新 duplicate 以外的字段
+        :param table_name: 数据库表名
+        :param duplicate: list 主键字段名
+        :param rows: list of dict, 每行字段相同, 包含主键字段
+        :return: [(sql, params), ...]
+        >>> SQL.update_insert_many('table_name', ['id'], [dict(id=1, name='a'), dict(id=2, name='b')])
+        [('insert into `table_name` (`id`, `name`) values (%s, %s), (%s, %s) on duplicate key update
+        `name` = values(`name`)', (1, 'a', 2, 'b'))]
+        """
+        if not isinstance(duplicate, (list, tuple)):
+            raise TypeError('duplicate must be list object')
+        columns, values = cls._batch_rows(table_name, rows)
+        upsert_columns = [k for k in columns if k not in duplicate]
+        if not upsert_columns or len(upsert_columns) + len(duplicate) != len(columns):
+            raise ValueError('rows must contain duplicate columns and at least one other column')
+        return cls._upsert_many(table_name, columns, upsert_columns, values, max_packet, max_params)
+
+    @classmethod
+    def _upsert_many(cls, table_name, columns, upsert_columns, values, max_packet, max_params):
+        head = 'insert into `{table_name}` ({columns}) '.format(
+            table_name=table_name, columns=', '.join(map(lambda k: '`{}`'.format(k), columns)))
+        tail = ' on duplicate key update {}'.format(
+            ', '.join(map(lambda k: '`{0}` = values(`{0}`)'.format(k), upsert_columns)))
+        return cls.split_values(head, tail, len(columns), values, max_packet=max_packet, max_params=max_params)
+
     @classmethod
     def insert(cls, table_name, **values):
         """
@@ -173,15 +978,10 @@ class SQL(object):
         :param values: dict, 数据库表字段对应的值
         :return: sql, params
         >>> SQL.insert('table_name', id=1, db='mysql', version='5.6.7')
-        ('insert into `table_name` (`version`, `db`, `id`) values(%s, %s, %s)', ('5.6.7', 'mysql', 1))
+        ('insert into `table_name` (`db`, `id`, `version`) values(%s, %s, %s)', ('mysql', 1, '5.6.7'))
         """
-        columns = values.keys()
-        params = tuple(map(lambda k: values.get(k), columns))
-        sql = 'insert into `{table_name}` ({columns}) values({params})' \
-              ''.format(table_name=table_name,
-                        columns=', '.join(map(lambda k: '`{}`'.format(k), columns)),
-                        params=', '.join(['%s'] * len(columns)))
-        return sql, params
+        sql, params = _compiled(_compile_insert, table_name, tuple(sorted(values)))
+        return sql, params(values)
 
     @classmethod
     def upsert(cls, table_name, **values):
@@ -198,17 +998,8 @@ class SQL(object):
         if not values:
             raise ValueError('need at least one filed value')
 
-        columns = values.keys()
-        set_columns = map(lambda k: '`{}` = %s'.format(k), columns)
-        sql = 'insert into `{table_name}` ({columns}) values({params}) ' \
-              'on duplicate key update {set_columns}' \
-              ''.format(table_name=table_name,
-                        columns=', '.join(map(lambda k: '`{}`'.format(k), columns)),
-                        params=', '.join(['%s'] * len(columns)),
-                        set_columns=', '.join(set_columns))
-        params = tuple(map(lambda k: values.get(k), columns))
-        params = params + params
-        return sql, params
+        sql, params = _compiled(_compile_upsert, table_name, tuple(sorted(values)))
+        return sql, params(values)
 
     @classmethod
     def update(cls, table_name, values, where):
@@ -225,15 +1016,8 @@ class SQL(object):
             raise TypeError('`values` must be dict object')
         if not isinstance(where, dict):
             raise TypeError('`where` must be dict object')
-        set_columns = values.keys()
-        where_columns = where.keys()
-        sql = 'update `{table_name}` set {set_columns} where {where_columns}'.format(
-            table_name=table_name,
-            set_columns=', '.join(map(lambda x: '`{}` = %s'.format(x), set_columns)),
-            where_columns=' and '.join(map(lambda x: '`{}` = %s'.format(x), where_columns))
-        )
-        params = tuple(map(lambda x: values.get(x), set_columns) + map(lambda x: where.get(x), where_columns))
-        return sql, params
+        sql, params = _compiled(_compile_update, table_name, tuple(sorted(values)), tuple(sorted(where)))
+        return sql, params(values, where)
 
     @classmethod
     def delete(cls, table_name, **where):
@@ -247,13 +1031,8 @@ class SQL(object):
             raise TypeError('`table_name` must be string object')
         if not where:
             raise ValueError('need at least one filed value')
-        where_columns = where.keys()
-        sql = 'delete from `{table_name}` where {where_columns}'.format(
-            table_name=table_name,
-            where_columns=' and '.join(map(lambda x: '`{}` = %s'.format(x), where_columns))
-        )
-        params = tuple(map(lambda x: where.get(x), where_columns))
-        return sql, params
+        sql, params = _compiled(_compile_delete, table_name, tuple(sorted(where)))
+        return sql, params(where)
 
     @classmethod
     def select(cls, table_name, *columns, **where):
@@ -264,16 +1043,8 @@ class SQL(object):
         :param where: 查询条件(and)
         :return: sql(str), params(tuple)
         """
-        if not columns:
-            columns = ('*',)
-        where_columns = where.keys()
-        sql = 'select {columns} from `{table_name}` where {where}'.format(
-            columns=', '.join(columns),
-            table_name=table_name,
-            where=' and '.join(map(lambda x: '`{}` = %s'.format(x), where_columns))
-        )
-        params = tuple(map(lambda x: where.get(x), where_columns))
-        return sql, params
+        sql, params = _compiled(_compile_select, table_name, columns or ('*',), tuple(sorted(where)))
+        return sql, params(where)
 
     @classmethod
     def update_insert(cls, table_name, duplicate, **data):
@@ -282,7 +1053,7 @@ class SQL(object):
         :param duplicate: dict 主键字段
         :param data: dict 更新时需要更新的字段
         :return: sql, params
-        >>> SQL.update_insert('table_name', {'id': 1}, {'name': 'test'})
+        >>> SQL.update_insert('table_name', {'id': 1}, name='test')
         ('insert into `table_name` (`id`, `name`) values(%s, %s) on duplicate key update `name` = %s',
         (1, 'test', 'test'))
         """
@@ -292,16 +1063,7 @@ class SQL(object):
             raise ValueError('need at least one filed value')
         if not isinstance(duplicate, dict) or not isinstance(data, dict):
             raise TypeError('data or update_ata must be dict object')
-        upsert_columns = data.keys()
+        upsert_columns = tuple(sorted(data))
         data.update(duplicate)
-        insert_columns = data.keys()
-        set_columns = map(lambda k: '`{}` = %s'.format(k), upsert_columns)
-        sql = 'insert into `{table_name}` ({columns}) values({params}) ' \
-              'on duplicate key update {set_columns}' \
-              ''.format(table_name=table_name,
-                        columns=', '.join(map(lambda k: '`{}`'.format(k), insert_columns)),
-                        params=', '.join(['%s'] * len(insert_columns)),
-                        set_columns=', '.join(set_columns))
-        insert_params = tuple(map(lambda k: data.get(k), insert_columns))
-        upsert_params = tuple(map(lambda k: data.get(k), upsert_columns))
-        return sql, insert_params + upsert_params
+        sql, params = _compiled(_compile_update_insert, table_name, tuple(sorted(data)), upsert_columns)
+        return sql, params(data)
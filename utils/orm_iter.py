@@ -1,10 +1,15 @@
 # coding: utf-8
 
+import Queue
+import threading
+import multiprocessing
+from base import BoundedQueue
+
 
 def orm_iter(_class, start=0, limit=1000):
     count = limit
 
-    while count <= limit:
+    while count >= limit:
         os = _class.select().where(_class.id > start).order_by(_class.id).limit(limit)
         count = len(os)
         if os:
@@ -13,3 +18,198 @@ def orm_iter(_class, start=0, limit=1000):
             start = os[count-1].id
         else:
             break
+
+
+class ModelFetcher(object):
+    """按 id 区间分页读取 peewee model, 只能用于线程模式"""
+
+    processes = False
+
+    def __init__(self, _class):
+        self._class = _class
+
+    def min_max(self):
+        _class = self._class
+        first = _class.select(_class.id).order_by(_class.id).first()
+        last = _class.select(_class.id).order_by(_class.id.desc()).first()
+        if first is None or last is None:
+            return None, None
+        return first.id, last.id
+
+    def fetch(self, start, end, limit):
+        """读取 start < id <= end 的前 limit 行"""
+        _class = self._class
+        return list(_class.select().where((_class.id > start) & (_class.id <= end)).order_by(_class.id).limit(limit))
+
+    @staticmethod
+    def key(row):
+        return row.id
+
+    def reset(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class TableFetcher(object):
+    """
+    通过 MySqlClient 按主键区间分页读取原始表, 每个线程使用 client.clone() 出的连接
+    进程模式下子进程按相同的连接参数新建连接
+    """
+
+    processes = True
+
+    def __init__(self, client, table, columns='*', key='id'):
+        self.client = client
+        self.table = table
+        self.columns = columns if isinstance(columns, basestring) else ', '.join(columns)
+        self.key_column = key
+        self._local = threading.local()
+        self._clients = []
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        client = state.pop('client')
+        state['_params'] = dict(host=client.host, port=client.port, user=client.user, password=client.password,
+                                db=client.db, charset=client.charset)
+        for k in ('_local', '_clients', '_lock'):
+            state.pop(k)
+        return state
+
+    def __setstate__(self, state):
+        from mysql_tool import MySqlClient
+        params = state.pop('_params')
+        self.__dict__.update(state)
+        self.client = MySqlClient(**params)
+        self._local = threading.local()
+        self._clients = []
+        self._lock = threading.Lock()
+
+    def reset(self):
+        """在子进程中调用, 丢弃从父进程继承的连接(及连接池), 按相同的连接参数新建连接"""
+        state = self.__getstate__()
+        self.client._conn = None
+        self.__setstate__(state)
+
+    def _client(self):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.client.clone()
+            with self._lock:
+                self._clients.append(client)
+        return client
+
+    def _query(self, client, sql, *args):
+        with client.cursor() as (conn, cursor):
+            cursor.execute(sql, args)
+            rows = cursor.fetchall()
+            conn.commit()
+            return rows
+
+    def min_max(self):
+        row = self._query(self.client, 'select min(`{key}`) as min_id, max(`{key}`) as max_id from `{table}`'
+                                       ''.format(key=self.key_column, table=self.table))[0]
+        return row['min_id'], row['max_id']
+
+    def fetch(self, start, end, limit):
+        """读取 start < key <= end 的前 limit 行"""
+        sql = 'select {columns} from `{table}` where `{key}` > %s and `{key}` <= %s order by `{key}` limit %s' \
+              ''.format(columns=self.columns, table=self.table, key=self.key_column)
+        return list(self._query(self._client(), sql, start, end, limit))
+
+    def key(self, row):
+        return row[self.key_column]
+
+    def close(self):
+        with self._lock:
+            clients, self._clients = self._clients, []
+        for client in clients:
+            client.close()
+
+
+def split_ranges(min_id, max_id, count):
+    """将 [min_id, max_id] 切分为 count 个区间, 返回 [(start, end), ...], 区间为 start < id <= end"""
+    if min_id is None or max_id is None:
+        return []
+    count = max(1, min(count, max_id - min_id + 1))
+    step, rest = divmod(max_id - min_id + 1, count)
+    ranges, start = [], min_id - 1
+    for i in xrange(count):
+        end = start + step + (1 if i < rest else 0)
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+
+def _scan_worker(fetcher, tasks, out, limit, in_process):
+    if in_process:
+        fetcher.reset()
+    try:
+        while not out.stopped:
+            task = tasks.get()
+            if task is None:
+                break
+            start, end = task
+            while not out.stopped:
+                page = fetcher.fetch(start, end, limit)
+                if page and not out.put(page):
+                    return
+                if len(page) < limit:
+                    break
+                start = fetcher.key(page[-1])
+    finally:
+        if in_process:
+            fetcher.close()
+
+
+def parallel_scan(fetcher, workers=4, ranges=None, limit=1000, queue_size=None, pages=False, processes=False):
+    """
+    按 id 区间并发扫描全表
+    先查出 min/max id 并将 id 空间切分为 ranges 个区间, 由 workers 个线程(或进程)各自按 keyset 分页扫描,
+    结果经过容量为 queue_size 页的有界队列(BoundedQueue)返回, 消费过慢时 worker 阻塞; 不保证区间之间的顺序
+    :param fetcher: ModelFetcher 或 TableFetcher
+    :param workers: 并发数
+    :param ranges: 区间数, 默认 workers * 4
+    :param limit: 每页行数
+    :param queue_size: 队列中最多缓存的页数, 默认 workers * 2
+    :param pages: 为 True 时按页(list)返回, 否则逐行返回
+    :param processes: 使用进程代替线程, 仅 TableFetcher 支持
+    """
+    if processes and not fetcher.processes:
+        raise ValueError('{} can only be scanned with threads'.format(type(fetcher).__name__))
+    min_id, max_id = fetcher.min_max()
+    id_ranges = split_ranges(min_id, max_id, ranges or workers * 4)
+    if not id_ranges:
+        return
+    workers = min(workers, len(id_ranges))
+
+    tasks = multiprocessing.Queue() if processes else Queue.Queue()
+    for task in id_ranges:
+        tasks.put(task)
+    for _ in xrange(workers):
+        tasks.put(None)
+    out = BoundedQueue(queue_size or workers * 2, processes=processes, name='parallel scan worker')
+    out.start(_scan_worker, args=(fetcher, tasks, out, limit, processes), workers=workers)
+    try:
+        for page in out:
+            if pages:
+                yield page
+            else:
+                for row in page:
+                    yield row
+    finally:
+        out.close()
+        fetcher.close()
+
+
+def orm_parallel_iter(_class, workers=4, limit=1000, **kwargs):
+    """并发扫描 peewee model 全表, 参数同 parallel_scan"""
+    return parallel_scan(ModelFetcher(_class), workers=workers, limit=limit, **kwargs)
+
+
+def table_parallel_iter(client, table, columns='*', key='id', workers=4, limit=1000, **kwargs):
+    """通过 MySqlClient 并发扫描原始表, 参数同 parallel_scan"""
+    fetcher = TableFetcher(client, table, columns=columns, key=key)
+    return parallel_scan(fetcher, workers=workers, limit=limit, **kwargs)
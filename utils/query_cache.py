@@ -0,0 +1,230 @@
+# coding: utf-8
+
+import os
+import re
+import time
+import hashlib
+import tempfile
+import logging
+import threading
+import cPickle as pickle
+from collections import defaultdict
+from base import LRUCache
+
+
+log = logging.getLogger()
+
+# sql 中引用的表名, 支持 `db`.`table` 写法
+TABLE_PATTERN = re.compile(r'\b(?:from|join|into|update|table)\s+(?:table\s+)?(?:`?\w+`?\s*\.\s*)?`?(\w+)`?', re.I)
+# 以这些关键字开头的语句不修改数据, 不触发失效
+READ_STATEMENTS = ('select', 'show', 'explain', 'desc', 'describe')
+
+
+def _copy(value):
+    """复制查询结果: list/tuple 复制容器, 其中的 dict 行逐行浅复制; 单行 dict 浅复制"""
+    if isinstance(value, dict):
+        return value.copy()
+    if isinstance(value, (list, tuple)):
+        return type(value)(row.copy() if isinstance(row, dict) else row for row in value)
+    return value
+
+
+class QueryCache(object):
+    """
+    查询结果缓存, key 为 (kind, sql, params)
+    内存中为带 TTL 的 LRU, 可选的磁盘层在内存未命中时查找; 写入某个表时, 涉及该表的缓存全部失效
+    每次失效使表的版本号加一, 查询前取 generation(), 写入时版本号已变化说明查询期间表被修改, 结果不缓存
+    写入和读取时复制结果(行为 dict 时逐行复制), 调用方修改返回的结果不影响缓存
+    >>> client = MySqlClient(db='user', cache=QueryCache(maxsize=2048, ttl=600))
+    """
+
+    def __init__(self, maxsize=1024, ttl=300, max_rows=10000, disk_path=None, disk_maxsize=100000):
+        """
+        :param maxsize: 内存中最多缓存的查询数
+        :param ttl: 缓存有效期(秒)
+        :param max_rows: 超过该行数的结果不缓存
+        :param disk_path: 磁盘缓存的上级目录, 为 None 时不使用磁盘; 缓存文件写在本实例在其下新建的子目录中,
+            只删除自己写入的文件和该子目录; 表的失效只在本实例内跟踪, 磁盘层不在进程间共享
+        :param disk_maxsize: 磁盘上最多缓存的查询数
+        """
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self.disk_path = None
+        # _on_memory_evict 可能在 set 持有锁时被调用
+        self._lock = threading.RLock()
+        self._tables = defaultdict(set)
+        # 各表的版本号, 失效时加一; _epoch 在 clear() 时加一
+        self._generations = defaultdict(int)
+        self._epoch = 0
+        self._sql_tables = LRUCache(maxsize=4096)
+        self._memory = LRUCache(maxsize=maxsize, on_evict=self._on_memory_evict)
+        self._disk = None
+        if disk_path:
+            if not os.path.isdir(disk_path):
+                os.makedirs(disk_path)
+            self.disk_path = tempfile.mkdtemp(prefix='query_cache_', dir=disk_path)
+            self._disk = LRUCache(maxsize=disk_maxsize, on_evict=self._on_disk_evict)
+        self._stats = dict(hits=0, disk_hits=0, misses=0, expired=0, invalidations=0, skipped=0, stale=0)
+
+    def tables(self, sql):
+        """解析 sql 中涉及的表名"""
+        tables = self._sql_tables.get(sql)
+        if tables is None:
+            tables = self._sql_tables.set(sql, frozenset(t.lower() for t in TABLE_PATTERN.findall(sql)))
+        return tables
+
+    def generation(self, sql):
+        """sql 涉及的表当前的版本号, 查询前调用, 传给 set()"""
+        tables = self.tables(sql)
+        with self._lock:
+            return self._generation(tables)
+
+    def _generation(self, tables):
+        return (self._epoch,) + tuple(self._generations.get(table, 0) for table in sorted(tables))
+
+    def _incr(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _file(self, key):
+        return os.path.join(self.disk_path, hashlib.md5(repr(key)).hexdigest())
+
+    def get(self, kind, sql, params):
+        """返回 (是否命中, 结果)"""
+        key = (kind, sql, params)
+        try:
+            entry = self._memory.get(key)
+        except TypeError:    # 参数不可哈希
+            return False, None
+        if entry is None and self._disk is not None and self._disk.get(key) is not None:
+            try:
+                with open(self._file(key), 'rb') as f:
+                    entry = pickle.load(f)
+                self._incr('disk_hits')
+                self._memory.set(key, entry)
+            except (IOError, EOFError, pickle.UnpicklingError):
+                entry = None
+        if entry is None:
+            self._incr('misses')
+            return False, None
+        if entry[0] < time.time():
+            self._incr('expired')
+            self._incr('misses')
+            self._discard(key)
+            return False, None
+        self._incr('hits')
+        return True, _copy(entry[1])
+
+    def set(self, kind, sql, params, value, generation=None):
+        """
+        缓存查询结果, 返回 value
+        :param generation: 查询前 generation(sql) 的返回值, 与当前版本号不同时不缓存(查询期间表被修改)
+        """
+        key = (kind, sql, params)
+        if isinstance(value, (list, tuple)) and len(value) > self.max_rows:
+            self._incr('skipped')
+            return value
+        try:
+            hash(key)
+        except TypeError:
+            return value
+        tables = self.tables(sql)
+        entry = (time.time() + self.ttl, _copy(value))
+        # 版本号检查、写入内存和登记表名在同一个锁内, 不会与 invalidate_table 交错
+        with self._lock:
+            if generation is not None and generation != self._generation(tables):
+                self._stats['stale'] += 1
+                return value
+            self._memory.set(key, entry)
+            for table in tables:
+                self._tables[table].add(key)
+        if self._disk is not None:
+            try:
+                with open(self._file(key), 'wb') as f:
+                    pickle.dump(entry, f, pickle.HIGHEST_PROTOCOL)
+                self._disk.set(key, True)
+            except (IOError, pickle.PicklingError, TypeError), e:
+                log.error('query cache write disk error %r' % e)
+            # 写磁盘期间表被修改时, invalidate_table 可能在文件写入前已执行, 这里补删
+            with self._lock:
+                current = self._generation(tables)
+            if generation is not None and generation != current:
+                self._discard(key)
+        return value
+
+    def _discard(self, key):
+        self._memory.pop(key)
+        if self._disk is not None and self._disk.pop(key) is not None:
+            self._remove_file(key)
+
+    def _remove_file(self, key):
+        try:
+            os.remove(self._file(key))
+        except OSError:
+            pass
+
+    def _on_memory_evict(self, key, entry):
+        if self._disk is None or key not in self._disk:
+            self._forget(key)
+
+    def _on_disk_evict(self, key, value):
+        self._remove_file(key)
+        if key not in self._memory:
+            self._forget(key)
+
+    def _forget(self, key):
+        with self._lock:
+            for table in self.tables(key[1]):
+                keys = self._tables.get(table)
+                if keys is not None:
+                    keys.discard(key)
+
+    def invalidate_table(self, *tables):
+        """使涉及这些表的缓存失效"""
+        keys = set()
+        with self._lock:
+            for table in tables:
+                table = table.lower()
+                self._generations[table] += 1
+                keys.update(self._tables.pop(table, ()))
+            self._stats['invalidations'] += len(keys)
+        for key in keys:
+            self._discard(key)
+
+    def invalidate(self, sql):
+        """写语句执行后调用, 使其涉及的表的缓存失效"""
+        if sql.lstrip()[:10].lower().startswith(READ_STATEMENTS):
+            return
+        self.invalidate_table(*self.tables(sql))
+
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+            self._tables.clear()
+        self._memory.clear()
+        if self._disk is not None:
+            for key in self._disk.keys():
+                self._remove_file(key)
+            self._disk.clear()
+
+    def close(self):
+        """清空缓存, 删除磁盘层的子目录"""
+        self.clear()
+        if self.disk_path is not None:
+            try:
+                os.rmdir(self.disk_path)
+            except OSError, e:
+                log.error('query cache remove %s error %r' % (self.disk_path, e))
+            self._disk = None
+            self.disk_path = None
+
+    def stats(self):
+        """命中/未命中/淘汰等计数"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update(size=len(self._memory), evictions=self._memory.evictions,
+                     disk_size=len(self._disk) if self._disk is not None else 0,
+                     disk_evictions=self._disk.evictions if self._disk is not None else 0)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / 1.0 / lookups if lookups else 0.0
+        return stats
@@ -1,11 +1,93 @@
 # coding: utf-8
 
+import re
 import time
+import calendar
 import functools
+import itertools
+import collections
 import datetime as sys_datetime
 from dateutil import parser
 from string_tool import StringTool
 from logger import log
+from base import LRUCache
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# %Y-%m-%d, %Y-%m-%d %H:%M, %Y-%m-%d %H:%M:%S 及带微秒、以 T 分隔的写法, 日期也可用 / 或 . 分隔, 不经过 dateutil 直接解析
+_DATETIME_PATTERN = re.compile(r'(\d{4})[-/.](\d{2})[-/.](\d{2})(?:[ T](\d{2}):(\d{2})(?::(\d{2})(?:\.(\d{1,6}))?)?)?$')
+# 判断 dateutil 解析的字符串是否包含完整日期: 去掉时分秒后的数字和单词, 以及 dateutil 认识的月份名
+_TIME_PART = re.compile(r'\d{1,2}:\d{2}(?::\d{2}(?:\.\d+)?)?')
+_DATE_TOKEN = re.compile(r'\d+|[a-z]+', re.I)
+_MONTH_NAMES = frozenset(name.lower() for names in parser.parserinfo.MONTHS for name in names)
+_EPOCH_ORDINAL = sys_datetime.date(1970, 1, 1).toordinal()
+# 时间戳转本地日期时, 按该秒数分段查询时区偏移, 覆盖整点/半点/刻钟切换的夏令时
+_OFFSET_STEP = 900
+# 批量转换时间戳时按 numpy 数组处理的范围(秒), 两端留出一天给时区偏移, 范围外逐个转换
+_MIN_TIMESTAMP = (sys_datetime.datetime(1, 1, 2) - sys_datetime.datetime(1970, 1, 1)).total_seconds()
+_MAX_TIMESTAMP = (sys_datetime.datetime(9999, 12, 31) - sys_datetime.datetime(1970, 1, 1)).total_seconds()
+GROUP_TYPES = ('day', 'week', 'month', 'quarter')
+
+# 日历表中一个月的边界和标签; 9999 年末月份的 last、next_first 和季度末月份的 quarter_last 无法表示, 为 None
+MonthInfo = collections.namedtuple('MonthInfo', ['first', 'last', 'next_first', 'quarter_first', 'quarter_last',
+                                                 'month_tips', 'quarter_tips'])
+# strftime 中只与日期有关的指令, 批量格式化时按天缓存
+_DATE_DIRECTIVES = 'aAbBdjmUwWyYxFD'
+
+
+def _full_date(s):
+    """
+    dateutil 用今天的日期补全字符串中缺少的年、月、日(如 "10:30"), 这样的结果随日期变化, 不能缓存;
+    时分秒之外含 4 位年份和另外两个日期部分(数字或月份名), 或含 8 位以上的连写日期(20200102)时才认为日期完整
+    """
+    year, parts = False, 0
+    for token in _DATE_TOKEN.findall(_TIME_PART.sub(' ', s)):
+        if token.isdigit():
+            if len(token) >= 8:
+                return True
+            year = year or len(token) == 4
+            parts += 1
+        elif token.lower() in _MONTH_NAMES:
+            parts += 1
+    return year and parts >= 3
+
+
+class _Memo(dict):
+    """首次访问某个键时调用 func(key) 计算并缓存, 用于批量转换中按天、按时区分段的中间结果"""
+
+    def __init__(self, func):
+        super(_Memo, self).__init__()
+        self.func = func
+
+    def __missing__(self, key):
+        value = self[key] = self.func(key)
+        return value
+
+
+def _time_template(fmt):
+    """
+    将 strftime 格式拆为日期部分和时分秒: 返回 (day_fmt, fields), 某天的 datetime.strftime(day_fmt) 得到的字符串
+    再 % (时, 分, 秒)[:fields] 即为该天该时刻按 fmt 格式化的结果;
+    含其他与时间有关的指令, 或时分秒不是按 %H %M %S 的顺序出现时返回 None
+    """
+    parts, fields = [], 0
+    for token in re.findall(r'%.?|[^%]+', fmt, re.S):
+        if token[0] != '%':
+            parts.append(token)
+        elif token == '%%':
+            parts.append('%%%%')
+        elif len(token) == 2 and fields < 3 and token[1] == 'HMS'[fields]:
+            parts.append('%%02d')
+            fields += 1
+        elif len(token) == 2 and token[1] in _DATE_DIRECTIVES:
+            parts.append(token)
+        else:
+            return None
+    return ''.join(parts), fields
 
 
 class TimeTool(object):
@@ -16,9 +98,17 @@ class TimeTool(object):
 
     weeks_cn = ['周一',  '周二',  '周三',  '周四',  '周五',  '周六',  '周日']
 
+    # 其他格式的字符串由 dateutil 解析后缓存, 不含完整日期的字符串不缓存
+    parse_cache = LRUCache(maxsize=10000)
+    # str_to_datetime 各层的命中次数
+    parse_stats = dict(fast=0, cache=0, dateutil=0, failed=0)
+
     @classmethod
     def str_to_datetime(cls, s):
-        """将日期字符串转换为 datetime 类型, 转换失败返回 None"""
+        """
+        将日期字符串转换为 datetime 类型, 转换失败返回 None
+        依次尝试: 固定格式(%Y-%m-%d, %Y-%m-%d %H:%M:%S 等)直接解析, 已解析字符串的缓存, dateutil
+        """
         if isinstance(s, sys_datetime.date):
             return cls.date_to_datetime(s)
         if isinstance(s, sys_datetime.datetime):
@@ -26,11 +116,90 @@ class TimeTool(object):
         s = StringTool.s(s)
         if not isinstance(s, str) or not s:
             return None
+        stats = cls.parse_stats
+        match = _DATETIME_PATTERN.match(s)
+        if match is not None:
+            year, month, day, hour, minute, second, micro = match.groups()
+            try:
+                d = sys_datetime.datetime(int(year), int(month), int(day), int(hour or 0), int(minute or 0),
+                                          int(second or 0), int(micro.ljust(6, '0')) if micro else 0)
+            except ValueError:
+                pass
+            else:
+                stats['fast'] += 1
+                return d
+        d = cls.parse_cache.get(s)
+        if d is not None:
+            stats['cache'] += 1
+            return d
         try:
-            return parser.parse(s)
+            d = parser.parse(s)
         except Exception, e:
+            stats['failed'] += 1
             log.error('TimeTool str_to_datetime error %s, [%s]' % (e, s))
             return None
+        stats['dateutil'] += 1
+        return cls.parse_cache.set(s, d) if _full_date(s) else d
+
+    @classmethod
+    def reset_parse_stats(cls):
+        for k in cls.parse_stats:
+            cls.parse_stats[k] = 0
+
+    # 日历表覆盖的年份范围(含), 首次用到某年时生成该年 12 个月的边界和标签; 范围外的日期每次重新计算
+    calendar_years = (1900, 2100)
+    calendar_months = {}
+    calendar_weeks = {}
+    calendar_week_tips = {}
+
+    @classmethod
+    def _month_start(cls, year, month):
+        """某月第一天, month 为 13 时为下一年 1 月; 超出 datetime 的年份范围(9999 年之后)时为 None"""
+        if month == 13:
+            year, month = year + 1, 1
+        if year > sys_datetime.MAXYEAR:
+            return None
+        return sys_datetime.datetime(year=year, month=month, day=1)
+
+    @classmethod
+    def _build_month(cls, year, month):
+        one = sys_datetime.timedelta(microseconds=1)
+        quarter = (month - 1) / 3 + 1
+        next_first = cls._month_start(year, month + 1)
+        quarter_next = cls._month_start(year, quarter * 3 + 1)
+        return MonthInfo(cls._month_start(year, month), next_first and next_first - one, next_first,
+                         cls._month_start(year, (quarter - 1) * 3 + 1), quarter_next and quarter_next - one,
+                         '%d年%02d月' % (year, month), '%d年%02d季度' % (year, quarter))
+
+    @staticmethod
+    def _in_range(value):
+        """MonthInfo 中 9999 年末之后的边界为 None, 同直接构造 datetime 一样抛出 ValueError"""
+        if value is None:
+            raise ValueError('year is out of range')
+        return value
+
+    @classmethod
+    def month_info(cls, year, month):
+        """某月的边界和标签(MonthInfo), 日历表范围内的年份首次访问时整年生成"""
+        info = cls.calendar_months.get((year, month))
+        if info is not None:
+            return info
+        if not cls.calendar_years[0] <= year <= cls.calendar_years[1]:
+            return cls._build_month(year, month)
+        for m in xrange(1, 13):
+            cls.calendar_months[(year, m)] = cls._build_month(year, m)
+        return cls.calendar_months[(year, month)]
+
+    @classmethod
+    def _week_tips(cls, d):
+        ordinal = d.toordinal()
+        tips = cls.calendar_week_tips.get(ordinal)
+        if tips is None:
+            y, w, _ = d.isocalendar()
+            tips = '%d年第%02d周' % (y, w)
+            if cls.calendar_years[0] <= d.year <= cls.calendar_years[1]:
+                cls.calendar_week_tips[ordinal] = tips
+        return tips
 
     @classmethod
     def date_to_datetime(cls, d):
@@ -80,6 +249,218 @@ class TimeTool(object):
     def seconds_to_datetime(cls, seconds):
         return cls.millis_to_datetime((seconds or 0) * 1000)
 
+    @classmethod
+    def _as_list(cls, values):
+        """批量转换的输入转为 list, numpy datetime64 数组转为 datetime"""
+        if numpy is not None and isinstance(values, numpy.ndarray):
+            if values.dtype.kind == 'M':
+                values = values.astype('datetime64[us]')
+            return values.tolist()
+        return values if isinstance(values, list) else list(values)
+
+    @classmethod
+    def _local_offset(cls, seconds):
+        """按 UTC 计算的本地时间秒数与 UTC 的偏移秒数, 同 mktime 的换算"""
+        return seconds - int(time.mktime(time.gmtime(seconds)[:8] + (-1,)))
+
+    @classmethod
+    def _offsets(cls, offset=None, utc=True):
+        """
+        按天缓存的时区偏移秒数, 键为秒数 // 86400
+        一天内及前后相邻的时段偏移有变化(夏令时切换)时值为 None, utc 为 True 时改查按 _OFFSET_STEP 分段的第二个缓存,
+        为 False 时由调用方逐个 mktime: 回拨重复和跳过的时段内 mktime 的结果与之前的调用有关, 不能按分段缓存
+        :param offset: 固定的偏移秒数, 为 None 时按本地时区
+        :param utc: 秒数为 UTC 时间戳(同 fromtimestamp), 为 False 时为本地时间(同 mktime)
+        :return: (day_offsets, step_offsets)
+        """
+        if offset is not None:
+            return _Memo(lambda day: offset), None
+        func = cls._utc_offset if utc else cls._local_offset
+
+        def day_offset(day):
+            # 前后各多查一段, 切换恰好在 0 点时当天 0 点也可能落在回拨重复的时段内
+            start = day * 86400
+            offsets = set(func(seconds) for seconds in (start - _OFFSET_STEP, start, start + 86400 - _OFFSET_STEP,
+                                                          start + 86400))
+            return offsets.pop() if len(offsets) == 1 else None
+        return _Memo(day_offset), _Memo(lambda step: func(step * _OFFSET_STEP)) if utc else None
+
+    @classmethod
+    def _offset_array(cls, seconds, offset=None):
+        """_offsets 的 numpy 版本, seconds 为 UTC 时间戳的 int64 数组"""
+        if offset is not None:
+            return offset
+        day_offsets, step_offsets = cls._offsets()
+        days, index = numpy.unique(seconds // 86400, return_inverse=True)
+        values = [day_offsets[day] for day in days.tolist()]
+        offsets = numpy.array([v or 0 for v in values], dtype=numpy.int64)[index]
+        if None in values:
+            changed = numpy.array([v is None for v in values])[index]
+            offsets[changed] = [step_offsets[step] for step in (seconds[changed] // _OFFSET_STEP).tolist()]
+        return offsets
+
+    @classmethod
+    def _timestamp_array(cls, millis):
+        """
+        毫秒时间戳转为 (seconds, micro, valid) 三个 numpy 数组, 秒和微秒的取整同 datetime.fromtimestamp;
+        valid 为 False 的位置(0/None 或接近 datetime 范围边界)由调用方逐个转换; 含其他类型的值时返回 None
+        """
+        if not all(type(m) in (int, long, float) or m is None for m in millis):
+            return None
+        t = numpy.array([m or 0 for m in millis], dtype=numpy.float64) / 1000.0
+        valid = (t != 0) & (t > _MIN_TIMESTAMP) & (t < _MAX_TIMESTAMP)
+        t[~valid] = 0
+        seconds = t.astype(numpy.int64)
+        x = (t - seconds) * 1e6
+        micro = numpy.where(x < 0, numpy.ceil(x - 0.5), numpy.floor(x + 0.5)).astype(numpy.int64)
+        negative = micro < 0
+        seconds[negative] -= 1
+        micro[negative] += 1000000
+        full = micro == 1000000
+        seconds[full] += 1
+        micro[full] = 0
+        return seconds, micro, valid
+
+    @classmethod
+    def datetimes_to_millis(cls, values, offset=None):
+        """
+        datetime_to_millis 的批量版本, 不逐个调用 mktime
+        :param values: datetime/date 的序列或 numpy datetime64 数组
+        :param offset: 固定的时区偏移秒数(东八区为 28800), 为 None 时按本地时区, 结果与 datetime_to_millis 相同
+        """
+        day_offsets, _ = cls._offsets(offset, utc=False)
+        result = []
+        for d in cls._as_list(values):
+            t = type(d)
+            if t is sys_datetime.datetime and d.tzinfo is None:
+                local = (d.toordinal() - _EPOCH_ORDINAL) * 86400 + d.hour * 3600 + d.minute * 60 + d.second
+            elif t is sys_datetime.date:
+                local = (d.toordinal() - _EPOCH_ORDINAL) * 86400
+            else:
+                local = None
+            o = day_offsets[local // 86400] if local is not None else None
+            result.append(cls.datetime_to_millis(d) if o is None else (local - o) * 1000)
+        return result
+
+    @classmethod
+    def strs_to_millis(cls, values, offset=None, second=False):
+        """
+        str_to_millis 的批量版本, %Y-%m-%d %H:%M:%S 等固定格式的字符串不创建 datetime, 其他值逐个调用 str_to_millis
+        :param offset: 同 datetimes_to_millis
+        :param second: 返回秒级时间戳, 同 query_to_millis
+        """
+        day_offsets, _ = cls._offsets(offset, utc=False)
+        days = _Memo(lambda ymd: sys_datetime.date(*map(int, ymd)).toordinal() - _EPOCH_ORDINAL)
+        result = []
+        for s in cls._as_list(values):
+            match = _DATETIME_PATTERN.match(s) if isinstance(s, (str, unicode)) else None
+            o = None
+            if match is not None:
+                year, month, day, hour, minute, sec, _ = match.groups()
+                hour, minute, sec = int(hour or 0), int(minute or 0), int(sec or 0)
+                if hour < 24 and minute < 60 and sec < 60:
+                    try:
+                        day = days[(year, month, day)]
+                    except ValueError:
+                        pass
+                    else:
+                        o = day_offsets[day]
+            if o is None:
+                millis = cls.str_to_millis(s)
+                result.append(millis / 1000 if second else millis)
+                continue
+            local = day * 86400 + hour * 3600 + minute * 60 + sec - o
+            result.append(local if second else local * 1000)
+        return result
+
+    @classmethod
+    def millis_to_datetimes(cls, millis, offset=None):
+        """
+        millis_to_datetime 的批量版本, 有 numpy 时不逐个调用 localtime
+        :param millis: 毫秒时间戳的序列或 numpy 数组
+        :param offset: 固定的时区偏移秒数, 为 None 时按本地时区, 结果与 millis_to_datetime 相同
+        """
+        if offset is None:
+            convert = cls.millis_to_datetime
+        else:
+            delta = sys_datetime.timedelta(seconds=offset)
+
+            def convert(m):
+                if not m:
+                    return None
+                try:
+                    return sys_datetime.datetime.utcfromtimestamp(m / 1000.0) + delta
+                except (ValueError, OverflowError):
+                    return None
+        millis = cls._as_list(millis)
+        split = cls._timestamp_array(millis) if numpy is not None else None
+        if split is None:
+            return [convert(m) for m in millis]
+        seconds, micro, valid = split
+        offsets = cls._offset_array(seconds, offset)
+        result = ((seconds + offsets) * 1000000 + micro).astype('datetime64[us]').tolist()
+        for i in numpy.flatnonzero(~valid).tolist():
+            result[i] = convert(millis[i])
+        return result
+
+    @classmethod
+    def millis_to_strs(cls, millis, fmt='%Y-%m-%d %H:%M:%S', offset=None):
+        """
+        millis_to_str 的批量版本, fmt 只含日期和 %H %M %S 时不创建 datetime, 日期部分每天格式化一次
+        :param offset: 同 millis_to_datetimes
+        """
+        template = _time_template(fmt)
+        if template is None:
+            return [cls.datetime_to_str(d, fmt=fmt) for d in cls.millis_to_datetimes(millis, offset)]
+        day_fmt, fields = template
+
+        def day_format(days):
+            s = sys_datetime.datetime.fromordinal(days + _EPOCH_ORDINAL).strftime(day_fmt)
+            return s % () if fields == 0 else s
+        formats = _Memo(day_format)
+        millis = cls._as_list(millis)
+        split = cls._timestamp_array(millis) if numpy is not None else None
+        if split is not None:
+            seconds, _, valid = split
+            offsets = cls._offset_array(seconds, offset)
+            days, clock = divmod(seconds + offsets, 86400)
+            if fields == 0:
+                result = [formats[day] for day in days.tolist()]
+            else:
+                clock = itertools.izip((clock // 3600).tolist(), (clock // 60 % 60).tolist(), (clock % 60).tolist())
+                result = [formats[day] % hms[:fields] for day, hms in itertools.izip(days.tolist(), clock)]
+            for i in numpy.flatnonzero(~valid).tolist():
+                result[i] = cls.datetime_to_str(cls.millis_to_datetimes([millis[i]], offset)[0], fmt=fmt)
+            return result
+        day_offsets, step_offsets = cls._offsets(offset)
+        result = []
+        for m in millis:
+            if not m:
+                result.append('')
+                continue
+            try:
+                # 秒的取整同 datetime.fromtimestamp
+                t = m / 1000.0
+                seconds = int(t)
+                micro = round((t - seconds) * 1e6)
+                if micro < 0:
+                    seconds -= 1
+                elif micro == 1000000:
+                    seconds += 1
+                o = day_offsets[seconds // 86400]
+                if o is None:
+                    o = step_offsets[seconds // _OFFSET_STEP]
+                days, clock = divmod(seconds + o, 86400)
+                result.append(formats[days] % (clock // 3600, clock // 60 % 60, clock % 60)[:fields])
+            except (ValueError, OverflowError):
+                result.append(cls.datetime_to_str(cls.millis_to_datetimes([m], offset)[0], fmt=fmt))
+        return result
+
+    @classmethod
+    def seconds_to_strs(cls, seconds, fmt='%Y-%m-%d %H:%M:%S', offset=None):
+        """seconds_to_str 的批量版本"""
+        return cls.millis_to_strs([(s or 0) * 1000 for s in cls._as_list(seconds)], fmt=fmt, offset=offset)
+
     @classmethod
     def incr(cls, d, days=1):
         return d + sys_datetime.timedelta(days=days)
@@ -88,10 +469,16 @@ class TimeTool(object):
     def get_first_last_date_by_week_number(cls, year, week_number):
         """通过week_number周获取一年第week_number周星期一和星期日"""
         if isinstance(year, int) and year > 0 and isinstance(week_number, int) and 0 <= week_number <= 52:
+            result = cls.calendar_weeks.get((year, week_number))
+            if result is not None:
+                return result
             year_first = sys_datetime.datetime(year=year, month=1, day=1)
-            return (year_first + sys_datetime.timedelta(days=week_number * 7 - year_first.weekday()),
-                    year_first + sys_datetime.timedelta(days=week_number * 7 - year_first.weekday() + 7)
-                    - sys_datetime.timedelta(microseconds=1))
+            result = (year_first + sys_datetime.timedelta(days=week_number * 7 - year_first.weekday()),
+                      year_first + sys_datetime.timedelta(days=week_number * 7 - year_first.weekday() + 7)
+                      - sys_datetime.timedelta(microseconds=1))
+            if cls.calendar_years[0] <= year <= cls.calendar_years[1]:
+                cls.calendar_weeks[(year, week_number)] = result
+            return result
         return None, None
 
     @classmethod
@@ -134,20 +521,17 @@ class TimeTool(object):
         """通过当前日期获取当月第一天号"""
         if not isinstance(d, sys_datetime.date):
             return None
-        return sys_datetime.datetime(year=d.year, month=d.month, day=1)
+        return cls.month_info(d.year, d.month).first
 
     @classmethod
     def get_month_last(cls, d):
         """通过当前日期获取当月最后一天"""
-        return cls.get_next_month_first(d) - sys_datetime.timedelta(microseconds=1)
+        return cls._in_range(cls.month_info(d.year, d.month).last)
 
     @classmethod
     def get_next_month_first(cls, d):
         """获取下个月第一天"""
-        if d.month == 12:
-            return sys_datetime.datetime(year=d.year + 1, month=1, day=1)
-        else:
-            return sys_datetime.datetime(year=d.year, month=d.month + 1, day=1)
+        return cls._in_range(cls.month_info(d.year, d.month).next_first)
 
     @classmethod
     def get_pre_month_first(cls, d):
@@ -170,14 +554,16 @@ class TimeTool(object):
     @classmethod
     def get_quarter_first(cls, d):
         """获取当前季度第一天"""
-        year, quarter = cls.get_quarter(d)
-        return cls.get_month_first(sys_datetime.datetime(year=year, month=(quarter - 1) * 3 + 1, day=1))
+        if not isinstance(d, sys_datetime.date):
+            raise TypeError(u'%r is not a `datetime` object' % d)
+        return cls.month_info(d.year, d.month).quarter_first
 
     @classmethod
     def get_quarter_last(cls, d):
         """获取当前季度最后一天"""
-        year, quarter = cls.get_quarter(d)
-        return cls.get_month_last(sys_datetime.datetime(year=year, month=(quarter - 1) * 3 + 3, day=1))
+        if not isinstance(d, sys_datetime.date):
+            raise TypeError(u'%r is not a `datetime` object' % d)
+        return cls._in_range(cls.month_info(d.year, d.month).quarter_last)
 
     @classmethod
     def get_next_quarter_first(cls, d):
@@ -210,7 +596,7 @@ class TimeTool(object):
         millis = int(time.time() * 1000)
         if not isinstance(days, int):
             return millis
-        return millis + days * 24 * 60 * 60 if days else millis
+        return millis + days * 24 * 60 * 60 * 1000 if days else millis
 
     @classmethod
     def delta_format(cls, delta):
@@ -262,15 +648,13 @@ class TimeTool(object):
             d = cls.date_to_datetime(d)
         if isinstance(d, sys_datetime.datetime):
             if _type == 'day':
-                return '周' + ('一', '二', '三', '四', '五', '六', '日')[d.weekday()]
+                return cls.weeks_cn[d.weekday()]
             elif _type == 'week':
-                y, w, d = d.isocalendar()
-                return '%d年第%02d周' % (y, w)
+                return cls._week_tips(d)
             elif _type == 'month':
-                return '%d年%02d月' % (d.year, d.month)
+                return cls.month_info(d.year, d.month).month_tips
             elif _type == 'quarter':
-                year, quarter = cls.get_quarter(d)
-                return '%d年%02d季度' % (year, quarter)
+                return cls.month_info(d.year, d.month).quarter_tips
         return ''
 
     @classmethod
@@ -286,12 +670,7 @@ class TimeTool(object):
 
     @classmethod
     def query_to_millis(cls, *args, **kwargs):
-        def func(x):
-            if kwargs.get('second', False):
-                return cls.datetime_to_millis(x) / 1000
-            else:
-                return cls.datetime_to_millis(x)
-        return tuple(func(cls.str_to_datetime(arg)) for arg in args)
+        return tuple(cls.strs_to_millis(args, second=kwargs.get('second', False)))
 
     @classmethod
     def ensure_datetime(cls, date):
@@ -333,6 +712,115 @@ class TimeTool(object):
         else:
             raise ValueError('Parameter _type must be (day|week|month), you get %r' % _type)
 
+    # bucket_dates 生成的区间标签, 超过上限后清空
+    group_labels = {}
+    group_labels_size = 10000
+
+    @classmethod
+    def _epoch_days(cls, values):
+        """将日期序列转换为距 1970-01-01 的本地天数, 有 numpy 时返回 int64 数组"""
+        if numpy is not None and isinstance(values, numpy.ndarray):
+            if values.dtype.kind == 'M':
+                if numpy.isnat(values).any():
+                    raise ValueError('dt is not a datetime object')
+                return values.astype('datetime64[D]').astype(numpy.int64)
+            if values.dtype.kind in 'iuf':
+                return cls._millis_to_epoch_days(values)
+            values = values.tolist()
+        values = list(values)
+        if values and all(isinstance(v, (int, long, float)) and not isinstance(v, bool) for v in values):
+            return cls._millis_to_epoch_days(values)
+        days = []
+        for v in values:
+            if isinstance(v, (str, unicode)):
+                v = cls.str_to_datetime(v)
+            if not isinstance(v, sys_datetime.date):
+                raise ValueError('dt is not a datetime object')
+            days.append(v.toordinal() - _EPOCH_ORDINAL)
+        return numpy.array(days, dtype=numpy.int64) if numpy is not None else days
+
+    @classmethod
+    def _millis_to_epoch_days(cls, millis):
+        """毫秒时间戳(datetime_to_millis 的结果)转换为本地日期的天数, 时区偏移按 _OFFSET_STEP 分段查询一次"""
+        if numpy is None:
+            return [sys_datetime.datetime.fromtimestamp(m / 1000.0).toordinal() - _EPOCH_ORDINAL for m in millis]
+        seconds = numpy.floor(numpy.asarray(millis, dtype=numpy.float64) / 1000.0).astype(numpy.int64)
+        steps, index = numpy.unique(seconds // _OFFSET_STEP, return_inverse=True)
+        offsets = numpy.array([cls._utc_offset(int(step) * _OFFSET_STEP) for step in steps], dtype=numpy.int64)
+        return (seconds + offsets[index]) // 86400
+
+    @classmethod
+    def _utc_offset(cls, seconds):
+        """本地时间与 UTC 的偏移秒数"""
+        return calendar.timegm(time.localtime(seconds)) - seconds
+
+    @classmethod
+    def _bucket_epoch_days(cls, days, _type):
+        """各天所在区间第一天的天数"""
+        if _type not in GROUP_TYPES:
+            raise ValueError('Parameter _type must be (day|week|month), you get %r' % _type)
+        if numpy is not None:
+            if _type == 'day':
+                return days
+            if _type == 'week':    # 1970-01-01 为周四
+                return days - (days + 3) % 7
+            months = days.astype('datetime64[D]').astype('datetime64[M]').astype(numpy.int64)
+            if _type == 'quarter':
+                months -= months % 3
+            return months.astype('datetime64[M]').astype('datetime64[D]').astype(numpy.int64)
+        starts = []
+        for day in days:
+            if _type == 'day':
+                starts.append(day)
+            elif _type == 'week':
+                starts.append(day - (day + 3) % 7)
+            else:
+                d = sys_datetime.date.fromordinal(day + _EPOCH_ORDINAL)
+                month = d.month - (d.month - 1) % 3 if _type == 'quarter' else d.month
+                starts.append(sys_datetime.date(d.year, month, 1).toordinal() - _EPOCH_ORDINAL)
+        return starts
+
+    @classmethod
+    def bucket_dates(cls, values, _type='day'):
+        """
+        批量计算日期所在的日/周/月/季度区间
+        :param values: datetime/date/日期字符串的序列, numpy datetime64 数组, 或毫秒时间戳(datetime_to_millis)的序列/数组
+        :param _type: day week month quarter
+        :return: (starts, index), starts 为升序排列的区间第一天(datetime) 列表, index[i] 为 values[i] 所在区间在 starts 中的下标;
+            有 numpy 时 index 为数组
+        """
+        starts = cls._bucket_epoch_days(cls._epoch_days(values), _type)
+        if numpy is not None:
+            unique, index = numpy.unique(starts, return_inverse=True)
+            unique = unique.tolist()
+        else:
+            unique = sorted(set(starts))
+            position = dict((day, i) for i, day in enumerate(unique))
+            index = [position[day] for day in starts]
+        return [sys_datetime.datetime.fromordinal(day + _EPOCH_ORDINAL) for day in unique], index
+
+    @classmethod
+    def group_dates(cls, values, _type='day', _fmt='%Y-%m-%d'):
+        """
+        format_group_date 的批量版本, 每个区间的标签只计算一次
+        >>> TimeTool.group_dates(['2018-09-03 10:00:00', '2018-09-09'], 'week')
+        ([datetime(2018, 9, 3), datetime(2018, 9, 3)], ['2018-09-03 ~ 2018-09-09', '2018-09-03 ~ 2018-09-09'])
+        :param values: 同 bucket_dates
+        :return: (keys, labels), keys[i] 为 values[i] 所在区间的第一天, labels[i] 同 format_group_date(values[i])
+        """
+        starts, index = cls.bucket_dates(values, _type)
+        cache = cls.group_labels
+        if len(cache) + len(starts) > cls.group_labels_size:
+            cache.clear()
+        labels = []
+        for start in starts:
+            key = (_type, _fmt, start)
+            label = cache.get(key)
+            if label is None:
+                label = cache[key] = cls.format_group_date(start, _type, _fmt)
+            labels.append(label)
+        return [starts[i] for i in index], [labels[i] for i in index]
+
     @classmethod
     def diff_month(cls, dt1, dt2):
         """比较两个时间相差几个自然月, 取当月第一天比较"""
@@ -1,9 +1,24 @@
 # coding: utf-8
 
+import re
 import time
+import Queue
+import itertools
+import traceback
+import multiprocessing
 from datetime import datetime, date
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 import xlsxwriter
+from base import BoundedQueue
+
+# 流式模式下默认只根据前 1000 行数据计算列宽
+STREAMING_WIDTH_SAMPLE_ROWS = 1000
+# 非 latin-1 字符(ord >= 256, 如中文)按 2.4 个字符宽度计算
+WIDE_CHAR_WIDTH = 2.4
+# 文本宽度缓存的最多条数, 超出后清空重新缓存
+TEXT_WIDTH_CACHE_SIZE = 10000
+_text_widths = {}
+_NUMBER_TYPES = (int, long, float)
 
 
 def _u(s, strip=True, charset='utf-8'):
@@ -26,10 +41,92 @@ def _s(u, strip=True, charset='utf-8'):
     return u
 
 
+# 不需要 _u() 转换的类型
+_PLAIN_TYPES = frozenset([int, long, float, bool, type(None)])
+_NUMBER_WRITE_TYPES = frozenset([int, long, float])
+# worksheet.write 会按公式/数组公式/链接处理的字符串, 以及空字符串, 这些值仍交给 write 判断
+_SPECIAL_STRING = re.compile(r'$|=|\{=|(?:ftp|http)s?://|mailto:|(?:in|ex)ternal:')
+
+
+def _convert_row(values):
+    """按类型转换一行的值, 结果同 map(_u, values), 数字和 None 不做字符串处理"""
+    return [v if type(v) in _PLAIN_TYPES else v.strip() if type(v) is unicode else _u(v) for v in values]
+
+
+def _dict_columns(row):
+    """dict 行未指定 columns 时的字段顺序, 只有 OrderedDict 的键顺序是确定的, 普通 dict 抛出 ValueError"""
+    if isinstance(row, OrderedDict):
+        return row.keys()
+    raise ValueError('columns is required for dict rows, the key order of a plain dict is arbitrary')
+
+
+def _iter_rows(rows, columns=None, header=None):
+    """
+    write_iter 的参数处理: dict 行按 columns(OrderedDict 行默认为第一行的 keys())转为 list
+    :return: (表头 list 或 None, 行的迭代器)
+    """
+    rows = iter(rows)
+    try:
+        first = next(rows)
+    except StopIteration:
+        first = None
+    if isinstance(first, dict) and columns is None:
+        columns = _dict_columns(first)
+    if header is None:
+        header = columns
+    if first is None:
+        return list(header) if header else None, iter(())
+    rows = itertools.chain([first], rows)
+    if isinstance(first, dict):
+        rows = ([item.get(c) for c in columns] for item in rows)
+    return list(header) if header else None, rows
+
+
+def _column_lists(columns, header=None):
+    """
+    write_columns 的参数处理: dict 的 keys() 作为默认表头, numpy 数组转为 list
+    :return: (表头 list 或 None, 列数据的列表)
+    """
+    if isinstance(columns, dict):
+        if header is None:
+            header = columns.keys()
+        columns = columns.values()
+    return list(header) if header else None, [c.tolist() if hasattr(c, 'tolist') else c for c in columns]
+
+
+def _text_width(text):
+    """
+    text 为 _u() 转换后的值; latin-1 编码时被忽略的即宽字符, 由 C 实现计数
+    重复的字符串直接查缓存, 数字等其他类型(1 == 1.0 == True)不缓存
+    """
+    if not isinstance(text, unicode):
+        if isinstance(text, _NUMBER_TYPES):
+            return len(str(text))
+        return _count_width(unicode(text))
+    width = _text_widths.get(text)
+    if width is None:
+        if len(_text_widths) >= TEXT_WIDTH_CACHE_SIZE:
+            _text_widths.clear()
+        width = _text_widths[text] = _count_width(text)
+    return width
+
+
+def _count_width(text):
+    narrow = len(text.encode('latin-1', 'ignore'))
+    return narrow + (len(text) - narrow) * WIDE_CHAR_WIDTH
+
+
 class SheetWriter(object):
 
-    def __init__(self, book, sheet_name, start_row=0, default_max_width=20, **options):
+    def __init__(self, book, sheet_name, start_row=0, default_max_width=20, streaming=False, width_sample_rows=None,
+                 **options):
+        """
+        :param streaming: 工作簿为 constant_memory 模式, 行写出后即落盘, 只能按行号顺序写入
+        :param width_sample_rows: 只根据表头之后的前 n 行计算列宽, 为 None 时根据所有行计算
+        """
         self._book = book
+        self.streaming = streaming
+        self.width_sample_rows = width_sample_rows
         self._cache_format = {}
         self._sheet = self._book.add_worksheet(_u(sheet_name))
         self.header_row = start_row
@@ -54,6 +151,15 @@ class SheetWriter(object):
     def current_row(self):
         return self.row
 
+    def _sample_width(self, row):
+        """该行是否参与列宽计算"""
+        return self.width_sample_rows is None or row <= self.header_row + self.width_sample_rows
+
+    def _check_row(self, row):
+        # constant_memory 模式下开始写新行时前面的行已经写入临时文件, 再写入会被 xlsxwriter 忽略
+        if self.streaming and row < self.row - 1:
+            raise ValueError('streaming sheet must be written in row order, row {} already flushed'.format(row))
+
     def set_header_format(self, _fmt):
         self._sheet.set_row(self.header_row, cell_format=_fmt)
 
@@ -73,14 +179,16 @@ class SheetWriter(object):
         if center:
             properties['valign'] = 'vcenter'
         cell_format = self._get_cell_format(**properties)
-        if first_col == last_col:
+        self._check_row(first_row)
+        sample = self._sample_width(first_row)
+        if sample and first_col == last_col:
             try:
                 self._col_width[first_col] = min(
                     self.default_max_width, max(self.get_text_width(value), self._col_width[first_col])
                 )
             except TypeError:
                 pass
-        if first_row == last_row:
+        if sample and first_row == last_row:
             columns = last_col - first_col + 1
             width = self.get_text_width(value)
             width = max(width, sum(map(lambda x: self._col_width[x], xrange(first_col, last_col + 1))))
@@ -119,31 +227,154 @@ class SheetWriter(object):
             row = self.row
             self.row += 1
         else:
+            self._check_row(row)
             self.row = max(row, self.row + 1)
+        sample = self._sample_width(row)
         if col_span > 1 == len(values):
             self._sheet.merge_range(row, 0, row, col_span - 1, _u(values[0]), cell_format=cell_format)
         else:
+            values = map(_u, values)
             for col, v in enumerate(values):
-                v = _u(v)
                 if height:
                     self._sheet.set_row(row, height)
                 self._sheet.write(row, col, v, cell_format)
-                try:
-                    self._col_width[col] = min(
-                        self.default_max_width, max(self.get_text_width(v), self._col_width[col]))
-                except TypeError:
-                    pass
+            if sample:
+                self._update_widths(map(_text_width, values))
+
+    def _update_widths(self, widths, first_col=0):
+        """按一行(或一批行逐列取最大值)的文本宽度更新列宽"""
+        col_width, max_width = self._col_width, self.default_max_width
+        for col, width in enumerate(widths, first_col):
+            col_width[col] = min(max_width, max(width, col_width[col]))
+
+    def write_iter(self, rows, columns=None, header=None, **properties):
+        """
+        逐行写入可迭代的数据, 如 MySqlClient.iter_query 的结果; 流式模式下内存占用不随行数增长
+        :param rows: 可迭代的 dict 或 list/tuple
+        :param columns: dict 行的字段顺序; 行为 OrderedDict 时默认取第一行的 keys(), 普通 dict 行必须指定
+        :param header: 表头列表, 默认为 columns; 为 False 时不写表头
+        :param properties: 数据行的格式, 同 write
+        :return: 写入的数据行数
+        """
+        header, rows = _iter_rows(rows, columns, header)
+        if header:
+            self.write(header)
+        return self.write_rows(rows, **properties)
+
+    def write_rows(self, rows, row=None, formats=None, height=None, batch_size=1000, first_col=0, **properties):
+        """
+        批量写入多行, 格式在开始时解析一次, 每批行转换后用 write_row 写入, 列宽按批逐列计算
+        :param rows: 可迭代的 list/tuple
+        :param row: 起始行号, 默认在尾部写入
+        :param first_col: 起始列号, formats[i] 对应第 first_col + i 列
+        :param formats: 各列的格式, 为 properties 的 dict 列表, 元素为 None 时该列无格式; 为 None 时所有列使用 properties
+        :param height: 行高
+        :param batch_size: 每批行数
+        :param properties: 所有列的格式, 同 write
+        :return: 写入的行数
+        """
+        if row is None:
+            row = self.row
+        else:
+            self._check_row(row)
+        cell_format = self._get_cell_format(**properties)
+        if formats is not None:
+            # _write_cells 按列号取格式
+            formats = [None] * first_col + [self._get_cell_format(**f) if f else None for f in formats]
+        sheet, count, rows = self._sheet, 0, iter(rows)
+        while True:
+            batch = map(_convert_row, itertools.islice(rows, batch_size))
+            if not batch:
+                break
+            for values in batch:
+                if height:
+                    sheet.set_row(row, height)
+                self._write_cells(row, first_col, values, formats, cell_format)
+                row += 1
+            self._update_batch_widths(batch, row - len(batch), first_col)
+            count += len(batch)
+        self.row = max(row, self.row)
+        return count
+
+    def write_columns(self, columns, row=None, first_col=0, formats=None, header=None, **properties):
+        """
+        按列写入数据, 如 MySqlClient.query_columns 的结果, 每列用 write_column 写入
+        流式模式下只能按行写入, 转为 write_rows
+        :param columns: 列数据的列表, 或 {列名: 列数据} 的 dict/OrderedDict; 列数据可以是 list 或 numpy 数组
+        :param row: 起始行号, 默认在尾部写入
+        :param first_col: 起始列号
+        :param formats: 各列的格式, 同 write_rows
+        :param header: 表头列表, columns 为 dict 时默认为其 keys(); 为 False 时不写表头
+        :param properties: 所有列的格式, 同 write
+        :return: 写入的行数
+        """
+        header, columns = _column_lists(columns, header)
+        if header:
+            header_row = self.row if row is None else row
+            self.write_rows([header], row=header_row, first_col=first_col)
+            row = header_row + 1
+        if self.streaming:
+            return self.write_rows(itertools.izip_longest(*columns), row=row, formats=formats, first_col=first_col,
+                                   **properties)
+        if row is None:
+            row = self.row
+        cell_format = self._get_cell_format(**properties)
+        count = 0
+        for col, values in enumerate(columns):
+            values = _convert_row(values)
+            f = cell_format
+            if formats is not None and col < len(formats):
+                f = self._get_cell_format(**formats[col]) if formats[col] else None
+            self._write_cells(row, first_col + col, values, None, f, vertical=True)
+            samples = values if self.width_sample_rows is None else \
+                values[:max(0, self.header_row + self.width_sample_rows + 1 - row)]
+            if samples:
+                self._update_widths([max(map(_text_width, samples))], first_col + col)
+            count = max(count, len(values))
+        self.row = max(row + count, self.row)
+        return count
+
+    def _write_cells(self, row, col, values, formats, cell_format, vertical=False):
+        """
+        写入一行(vertical 为 True 时为一列)已转换的值, 同 write_row / write_column,
+        数字和普通字符串直接调用 write_number / write_string, 跳过 worksheet.write 的类型判断
+        :param formats: 按列号取的格式列表, 超出部分或为 None 时使用 cell_format
+        """
+        sheet = self._sheet
+        write, write_number, write_string = sheet.write, sheet.write_number, sheet.write_string
+        plain_strings = not sheet.strings_to_numbers
+        f = cell_format
+        for v in values:
+            if formats is not None:
+                f = formats[col] if col < len(formats) else cell_format
+            t = type(v)
+            if t in _NUMBER_WRITE_TYPES:
+                write_number(row, col, v, f)
+            elif t is unicode and plain_strings and not _SPECIAL_STRING.match(v):
+                write_string(row, col, v, f)
+            else:
+                write(row, col, v, f)
+            if vertical:
+                row += 1
+            else:
+                col += 1
+
+    def _update_batch_widths(self, batch, first_row, first_col=0):
+        """按一批行逐列取最大文本宽度更新列宽, 只计算参与采样的行"""
+        if self.width_sample_rows is not None:
+            batch = batch[:max(0, self.header_row + self.width_sample_rows + 1 - first_row)]
+        if batch:
+            self._update_widths([max(map(_text_width, col)) for col in itertools.izip_longest(*batch, fillvalue=u'')],
+                                first_col)
 
     @classmethod
     def get_text_width(cls, text):
-        text = unicode(_u(text))
-        width = 0
-        for c in unicode(_u(text)):
-            if ord(c) < 256:
-                width += 1
-            else:
-                width += 2.4
-        return width
+        return _text_width(_u(text))
+
+    @classmethod
+    def get_text_widths(cls, values):
+        """批量计算文本宽度"""
+        return [_text_width(_u(v)) for v in values]
 
     def finish(self):
         for col, width in self._col_width.iteritems():
@@ -180,9 +411,113 @@ class SheetWriter(object):
         return list(_inner())
 
 
-class XlsxTool(object):
+def _sheet_worker(sheets, tasks, out, chunk_size, in_process):
+    """依次取出 sheet 序号, 调用其 fetch() 并将表头和按 chunk_size 切分的行写入 out"""
+    while not out.stopped:
+        index = tasks.get()
+        if index is None:
+            break
+        try:
+            fetch, header, columns = (sheets[index][1:] + (None, None))[:3]
+            rows, count = iter(fetch()), 0
+            while not out.stopped:
+                chunk = list(itertools.islice(rows, chunk_size))
+                if chunk and isinstance(chunk[0], dict):
+                    if columns is None:
+                        columns = _dict_columns(chunk[0])
+                    chunk = [[item.get(c) for c in columns] for item in chunk]
+                if count == 0:
+                    if header is None:
+                        header = columns
+                    if header and not out.put(('header', index, list(header))):
+                        return
+                if not chunk:
+                    break
+                if not out.put(('rows', index, chunk)):
+                    return
+                count += len(chunk)
+            out.put(('done', index, count))
+        except Exception, e:
+            out.put(('error', index, traceback.format_exc() if in_process else e))
+            return
+
+
+class Exporter(object):
+    """导出文件的基类, 子类实现 sheet() 和 close(), sheet() 返回的对象提供 SheetWriter 的行写入接口"""
+
+    def sheet(self, sheet_name=None, **options):
+        raise NotImplementedError
+
+    def close(self):
+        raise NotImplementedError
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write_sheets(self, sheets, workers=4, processes=False, chunk_size=1000, queue_size=None, **options):
+        """
+        并发生成多个 sheet, 总耗时取决于最慢的 sheet 而不是所有 sheet 之和
+        每个 sheet 的 fetch() 在 worker 线程(或进程)中执行, 结果按 chunk_size 行一块经有界队列返回,
+        由当前线程按到达顺序写入各自的 sheet; sheet 在工作簿中的顺序与 sheets 一致
+        xlsxwriter 的样式和共享字符串属于整个工作簿, 无法分别生成 sheet 文件再合并, 所以写入仍在当前线程中进行
+        >>> book = XlsxTool('monthly.xlsx', streaming=True)
+        >>> book.write_sheets([(u'行业', lambda: client.iter_query(sql1), None, ['id', 'name']),
+        ...                    (u'职位', lambda: client.query(sql2), [u'编号'], ['id'])])
+        :param sheets: [(sheet_name, fetch[, header[, columns]]), ...], fetch() 返回该 sheet 的行(dict 或 list/tuple),
+            header 和 columns 同 write_iter; 线程模式下每个 fetch 应使用各自的连接(如 client.clone()),
+            进程模式下 fetch 需可 pickle
+        :param workers: 并发数
+        :param processes: 使用进程代替线程, 适合 fetch 本身消耗 CPU 的情况
+        :param chunk_size: 每块行数
+        :param queue_size: 队列中最多缓存的块数, 默认 workers * 2
+        :param options: 传给 sheet() 的参数
+        :return: 各 sheet 写入的数据行数
+        """
+        sheets = [tuple(s) for s in sheets]
+        writers = [self.sheet(s[0], **options) for s in sheets]
+        if not sheets:
+            return []
+        workers = max(1, min(workers, len(sheets)))
+        tasks = multiprocessing.Queue() if processes else Queue.Queue()
+        for index in xrange(len(sheets)):
+            tasks.put(index)
+        for _ in xrange(workers):
+            tasks.put(None)
+        out = BoundedQueue(queue_size or workers * 2, processes=processes, name='sheet worker')
+        out.start(_sheet_worker, args=(sheets, tasks, out, chunk_size, processes), workers=workers)
+
+        counts = [0] * len(sheets)
+        try:
+            for kind, index, value in out:
+                if kind == 'rows':
+                    writers[index].write_rows(value)
+                elif kind == 'header':
+                    writers[index].write(value)
+                elif kind == 'done':
+                    counts[index] = value
+                elif isinstance(value, BaseException):
+                    raise value
+                else:
+                    raise RuntimeError(u'sheet {} failed\n{}'.format(_u(sheets[index][0]), value))
+        finally:
+            out.close()
+        for writer in writers:
+            writer.finish()
+        return counts
+
+
+class XlsxTool(Exporter):
+    """
+    xlsx 文件, streaming=True 时使用 xlsxwriter 的 constant_memory 模式, 每个 sheet 只在内存中保留当前行,
+    适合导出百万行的报表; 此时每个 sheet 需按行号顺序写入, 列宽根据前 width_sample_rows 行计算
+    >>> with XlsxTool('industry.xlsx', streaming=True).sheet('industry') as sheet:
+    ...     sheet.write_iter(client.iter_query('select * from industry_new'), columns=['id', 'name'])
+    """
 
-    def __init__(self, filename, **properties):
+    def __init__(self, filename, streaming=False, **properties):
         filename = _u(filename)
         if not filename.endswith('.xlsx'):
             filename += '.%d.xlsx' % time.time()
@@ -191,15 +526,21 @@ class XlsxTool(object):
             self.filename = self.filename.replace(u':', u'：')
         properties.setdefault('font_size', 11)
         properties.setdefault('font_name', 'Times New Roman')
+        self.streaming = streaming
         self._book = xlsxwriter.Workbook(self.filename, options={
-            'default_format_properties': properties
+            'default_format_properties': properties,
+            'constant_memory': streaming,
+            'in_memory': False,
         })
         self._current_sheet = None
 
     def sheet(self, sheet_name=None, start_row=0, default_max_width=40,
-              auto_filter=True, freeze_header=True, **options):
+              auto_filter=True, freeze_header=True, width_sample_rows=None, **options):
+        if width_sample_rows is None and self.streaming:
+            width_sample_rows = STREAMING_WIDTH_SAMPLE_ROWS
         return SheetWriter(self._book, sheet_name, start_row=start_row, default_max_width=default_max_width,
-                           auto_filter=auto_filter, freeze_header=freeze_header, **options)
+                           auto_filter=auto_filter, freeze_header=freeze_header, streaming=self.streaming,
+                           width_sample_rows=width_sample_rows, **options)
 
     def __del__(self):
         self.close()